@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import numpy as np
+from constants import FIELD_WIDTH, INITIAL_HERBIVORE_COUNT, INITIAL_PREDATOR_COUNT
+from metrics import Metrics, PHASES
+
+try:
+    import resource
+except ImportError:  # Нет на Windows: пиковая память не измеряется
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Замеры производительности: симуляция без окна с фиксированными зёрнами на наборе сценариев,
+# которые растят число травоядных, хищников и размер поля. Каждый сценарий идёт в отдельном
+# процессе, чтобы пиковая память и прогрев JIT не перетекали между сценариями.
+# Результат — JSON (rounds/sec, время фаз на раунд, пиковая память); --compare сравнивает
+# его с сохранённым прогоном и завершается с кодом 1 при замедлении сверх порога.
+
+REPORT_VERSION = 1
+# Настройки прогона, при которых сравнение rounds/sec имеет смысл только при совпадении
+COMPARED_SETTINGS = ('rounds', 'warmup', 'seed', 'render', 'threads')
+
+def scenarios(quick=False):
+    # Имя сценария -> замены параметров модели (имена из constants.PARAMS)
+    herbivores = (200, 1000) if quick else (200, 1000, 5000, 20000)
+    predators = (1, 10) if quick else (1, 10, 100)
+    fields = (400, 1000) if quick else (400, 1000, 2000)
+    result = {}
+    for count in herbivores:
+        result[f'herbivores-{count}'] = {'INITIAL_HERBIVORE_COUNT': count}
+    for count in predators:
+        result[f'predators-{count}'] = {'INITIAL_HERBIVORE_COUNT': herbivores[-1], 'INITIAL_PREDATOR_COUNT': count}
+    for size in fields:
+        # Плотность травоядных как у поля по умолчанию
+        count = int(INITIAL_HERBIVORE_COUNT * (size / FIELD_WIDTH) ** 2)
+        result[f'field-{size}'] = {'FIELD_WIDTH': size, 'FIELD_HEIGHT': size, 'INITIAL_HERBIVORE_COUNT': count,
+                                   'INITIAL_PREDATOR_COUNT': max(INITIAL_PREDATOR_COUNT, count // 200)}
+    return result
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # macOS — байты, Linux — килобайты
+
+def _time_index(simulation, repeats):
+    # Индекс соседей обновляется внутри шагов, поэтому отдельно меряем полную сборку индекса
+    # травоядных и пакетный запрос «ближайшая трава» для всех травоядных на конечном состоянии
+    # (мс на одну сборку или один пакетный запрос)
+    from spatial import _link_range
+    herbivores = simulation.herbivores
+    index = herbivores.index
+    start = time.perf_counter()
+    for _ in range(repeats):
+        grid = (np.full_like(index.head, -1), np.full_like(index.next, -1), np.full_like(index.prev, -1),
+                np.full_like(index.cell, -1), index.cell_size, index.cols, index.rows, index.x0, index.y0)
+        _link_range(grid, herbivores.x, herbivores.y, herbivores.alive, 0, herbivores.count)
+    build = (time.perf_counter() - start) / repeats
+    x = herbivores.x[:herbivores.count]
+    y = herbivores.y[:herbivores.count]
+    simulation.grass.index.nearest_batch(x, y, simulation.config.herbivore_vision)  # Первый вызов — компиляция
+    start = time.perf_counter()
+    for _ in range(repeats):
+        simulation.grass.index.nearest_batch(x, y, simulation.config.herbivore_vision)
+    query = (time.perf_counter() - start) / repeats
+    return {'index_build': build * 1000, 'index_query': query * 1000}
+
+def _measure(name, params, rounds, warmup, seed, render, threads):
+    # Один сценарий; выполняется в отдельном процессе
+    if threads:
+        import numba
+        numba.set_num_threads(threads)
+    from config import Config
+    from simulation import Simulation, STORE_NAMES
+    baseline_rss = _peak_rss_mb()
+    metrics = Metrics(PHASES)
+    simulation = Simulation(seed=seed, config=Config.from_params(params), metrics=metrics)
+    simulation.initialize()
+    output = None
+    with tempfile.TemporaryDirectory() as directory:
+        if render:
+            from pipeline import InlineOutput
+            output = InlineOutput(os.path.join(directory, 'benchmark.mp4'), config=simulation.config, metrics=metrics)
+        try:
+            start_time = time.perf_counter()
+            timed_rounds = 0
+            for k in range(warmup + rounds):
+                if k == warmup:
+                    # Прогрев (JIT, кэши, первые перевыделения) в замеры не входит
+                    metrics.total_timers = {}
+                    metrics.rounds = 0
+                    start_time = time.perf_counter()
+                if not simulation.running:
+                    break
+                simulation.update(end_round=False)
+                if output is not None:
+                    state = simulation.history.latest()
+                    if state is not None:
+                        output.submit(state, simulation.speed, simulation.simulation_round,
+                                      simulation.simulation_round, 0)
+                simulation.end_round_metrics()
+                if k >= warmup:
+                    timed_rounds += 1
+            elapsed = time.perf_counter() - start_time
+        finally:
+            if output is not None:
+                output.close()
+    phases = {phase: timing['per_round'] * 1000 for phase, timing in metrics.totals().items()}
+    phases.update(_time_index(simulation, repeats=5))
+    return {
+        'name': name,
+        'params': params,
+        'seed': seed,
+        'rounds': timed_rounds,
+        'seconds': elapsed,
+        'rounds_per_sec': timed_rounds / elapsed if elapsed > 0 else None,
+        'phases_ms': phases,
+        'peak_rss_mb': _peak_rss_mb(),
+        'baseline_rss_mb': baseline_rss,
+        'final_counts': {store: simulation.stats.counts[store] for store in STORE_NAMES},
+    }
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    import numba
+    return {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'numba': numba.__version__, 'machine': platform.machine(),
+            'cpus': os.cpu_count()}
+
+def run_benchmark(selected, rounds=100, warmup=5, seed=12345, render=True, threads=None):
+    # selected: {имя: замены параметров}; каждый сценарий — свежий процесс
+    report = {'version': REPORT_VERSION, 'environment': _environment(),
+              'settings': {'rounds': rounds, 'warmup': warmup, 'seed': seed, 'render': render, 'threads': threads},
+              'scenarios': {}}
+    context = multiprocessing.get_context('spawn')
+    for name, params in selected.items():
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            result = pool.apply(_measure, (name, params, rounds, warmup, seed, render, threads))
+        report['scenarios'][name] = result
+        phases = ', '.join(f"{phase} {value:.2f}" for phase, value in result['phases_ms'].items())
+        memory = f"{result['peak_rss_mb']:.0f} МБ" if result['peak_rss_mb'] is not None else "нет данных"
+        logger.info(f"{name}: {result['rounds_per_sec']:.1f} раундов/с, пик памяти {memory}; мс за раунд: {phases}")
+    return report
+
+def compare(report, baseline, threshold=0.1):
+    # Сравнение с сохранённым прогоном: имена сценариев, где rounds/sec упал больше чем на threshold.
+    # Прогоны с разными настройками (например, с рендерингом и без) не сравниваются — ValueError
+    settings, base_settings = report.get('settings', {}), baseline.get('settings', {})
+    differing = [f"{key}: {base_settings.get(key)} -> {settings.get(key)}" for key in COMPARED_SETTINGS
+                 if settings.get(key) != base_settings.get(key)]
+    if differing:
+        raise ValueError(f"настройки прогона не совпадают с базовым ({'; '.join(differing)})")
+    regressions = []
+    for name, result in report['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None or not base.get('rounds_per_sec') or not result.get('rounds_per_sec'):
+            logger.info(f"{name}: нет данных для сравнения")
+            continue
+        ratio = result['rounds_per_sec'] / base['rounds_per_sec']
+        changes = []
+        for phase, value in result['phases_ms'].items():
+            old = base.get('phases_ms', {}).get(phase)
+            if old and abs(value / old - 1) > threshold:
+                changes.append(f"{phase} {old:.2f} -> {value:.2f} мс")
+        message = f"{name}: {base['rounds_per_sec']:.1f} -> {result['rounds_per_sec']:.1f} раундов/с ({ratio:.2f}x)"
+        if changes:
+            message += '; ' + ', '.join(changes)
+        if ratio < 1 - threshold:
+            regressions.append(name)
+            logger.warning(f"Замедление: {message}")
+        else:
+            logger.info(message)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры производительности симуляции")
+    parser.add_argument("--output", default="benchmark.json", help="куда записать результаты (JSON)")
+    parser.add_argument("--compare", metavar="PATH", help="сравнить с результатами прошлого прогона")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="допустимое падение rounds/sec при сравнении (доля, по умолчанию 0.1)")
+    parser.add_argument("--rounds", type=int, default=100, help="число замеряемых раундов в сценарии")
+    parser.add_argument("--warmup", type=int, default=5, help="число раундов прогрева перед замером")
+    parser.add_argument("--seed", type=int, default=12345, help="зерно всех сценариев")
+    parser.add_argument("--quick", action="store_true", help="меньший набор сценариев")
+    parser.add_argument("--only", action="append", metavar="NAME", help="запустить только указанные сценарии")
+    parser.add_argument("--no-render", action="store_true", help="не рисовать кадры и не кодировать видео")
+    parser.add_argument("--threads", type=int, help="число потоков numba в сценарии")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    selected = scenarios(args.quick)
+    if args.only:
+        unknown = set(args.only) - set(selected)
+        if unknown:
+            parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}; есть: {', '.join(selected)}")
+        selected = {name: selected[name] for name in args.only}
+    report = run_benchmark(selected, rounds=args.rounds, warmup=args.warmup, seed=args.seed,
+                           render=not args.no_render, threads=args.threads)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    logger.info(f"Результаты записаны в {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(report, baseline, args.threshold)
+        except ValueError as e:
+            logger.error(f"Сравнение невозможно: {e}")
+            sys.exit(1)
+        if regressions:
+            logger.error(f"Замедление в сценариях: {', '.join(regressions)}")
+            sys.exit(1)
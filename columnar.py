@@ -0,0 +1,112 @@
+import os
+import json
+import zlib
+import struct
+import numpy as np
+
+# Столбцовый файл только для дописывания. Файл — последовательность кадров, кадр — одна запись
+# append(): MAGIC, длина заголовка и длина данных (uint32, uint64), JSON-заголовок, данные.
+# Заголовок перечисляет таблицы кадра, их столбцы (имя, dtype) и число строк, а также CRC32 данных.
+# Кадр пишется одним вызовом и либо есть целиком, либо отбрасывается: оборванный хвост
+# после сбоя отрезается при следующем открытии на дописывание.
+
+MAGIC = b'LSCF'
+PREFIX = struct.Struct('<4sIQ')
+
+def _frames(f):
+    # Полные кадры файла: (заголовок, смещение данных); конец последнего полного кадра
+    frames = []
+    end = 0
+    while True:
+        prefix = f.read(PREFIX.size)
+        if len(prefix) < PREFIX.size:
+            break
+        magic, header_size, data_size = PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            break
+        raw_header = f.read(header_size)
+        data_offset = f.tell()
+        if len(raw_header) < header_size or f.seek(data_size, os.SEEK_CUR) > os.fstat(f.fileno()).st_size:
+            break
+        try:
+            header = json.loads(raw_header)
+        except ValueError:
+            break
+        frames.append((header, data_offset))
+        end = data_offset + data_size
+    return frames, end
+
+class ColumnarWriter:
+    def __init__(self, path):
+        self.path = path
+        mode = 'r+b' if os.path.exists(path) else 'w+b'
+        self.file = open(path, mode)
+        _, end = _frames(self.file)
+        self.file.truncate(end)
+        self.file.seek(end)
+
+    def append(self, tables):
+        # tables: {имя таблицы: {имя столбца: одномерный массив}}, все столбцы таблицы одной длины
+        header = {'tables': {}}
+        chunks = []
+        for table, columns in tables.items():
+            rows = None
+            described = []
+            for name, values in columns.items():
+                values = np.ascontiguousarray(values)
+                if values.ndim != 1 or values.dtype.hasobject:
+                    raise ValueError(f"столбец {table}.{name} должен быть одномерным массивом без объектов")
+                if rows is None:
+                    rows = len(values)
+                elif len(values) != rows:
+                    raise ValueError(f"в таблице {table} столбцы разной длины")
+                described.append([name, values.dtype.str])
+                chunks.append(values.tobytes())
+            header['tables'][table] = {'rows': rows or 0, 'columns': described}
+        data = b''.join(chunks)
+        header['crc32'] = zlib.crc32(data)
+        raw_header = json.dumps(header).encode()
+        self.file.write(PREFIX.pack(MAGIC, len(raw_header), len(data)) + raw_header + data)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_table(path, table):
+    # Все строки таблицы из полных кадров, столбцы склеены по порядку записи.
+    # Пустой словарь, если файла или таблицы нет.
+    if not os.path.exists(path):
+        return {}
+    parts = {}
+    with open(path, 'rb') as f:
+        frames, _ = _frames(f)
+        for header, data_offset in frames:
+            if table not in header['tables']:
+                continue
+            f.seek(data_offset)
+            data = f.read(sum(_frame_sizes(header)))
+            if zlib.crc32(data) != header['crc32']:
+                break  # Кадр повреждён: дальше файлу не доверяем
+            offset = 0
+            for name, description in header['tables'].items():
+                for column, dtype in description['columns']:
+                    dtype = np.dtype(dtype)
+                    size = dtype.itemsize * description['rows']
+                    if name == table:
+                        parts.setdefault(column, []).append(np.frombuffer(data, dtype, description['rows'], offset))
+                    offset += size
+    lengths = {len(chunks) for chunks in parts.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"в таблице {table} разный набор столбцов в разных кадрах")
+    return {column: np.concatenate(chunks) for column, chunks in parts.items()}
+
+def _frame_sizes(header):
+    for description in header['tables'].values():
+        for _, dtype in description['columns']:
+            yield np.dtype(dtype).itemsize * description['rows']
@@ -0,0 +1,44 @@
+from dataclasses import dataclass
+import constants
+from constants import PARAMS
+
+# Параметры модели одного прогона; значения по умолчанию берутся из constants.py.
+# Поле называется как константа в нижнем регистре. Ядра получают значения аргументами,
+# поэтому одна скомпилированная (и закэшированная на диске) версия служит любой конфигурации.
+
+@dataclass(frozen=True)
+class Config:
+    field_width: int = constants.FIELD_WIDTH
+    field_height: int = constants.FIELD_HEIGHT
+    initial_grass_count: int = constants.INITIAL_GRASS_COUNT
+    initial_herbivore_count: int = constants.INITIAL_HERBIVORE_COUNT
+    initial_predator_count: int = constants.INITIAL_PREDATOR_COUNT
+    grass_spawn_per_round: int = constants.GRASS_SPAWN_PER_ROUND
+    grass_spawn_bonus: int = constants.GRASS_SPAWN_BONUS
+    grass_spawn_radius: float = constants.GRASS_SPAWN_RADIUS
+    herbivore_speed: float = constants.HERBIVORE_SPEED
+    herbivore_speed_to_grass: float = constants.HERBIVORE_SPEED_TO_GRASS
+    herbivore_vision: float = constants.HERBIVORE_VISION
+    herbivore_reproduction_count: int = constants.HERBIVORE_REPRODUCTION_COUNT
+    herbivore_grass_to_reproduce: int = constants.HERBIVORE_GRASS_TO_REPRODUCE
+    predator_speed: float = constants.PREDATOR_SPEED
+    predator_speed_to_prey: float = constants.PREDATOR_SPEED_TO_PREY
+    predator_vision: float = constants.PREDATOR_VISION
+    predator_eating_time: int = constants.PREDATOR_EATING_TIME
+    predator_reproduction_count: int = constants.PREDATOR_REPRODUCTION_COUNT
+    predator_feces_interval: int = constants.PREDATOR_FECES_INTERVAL
+    predator_hunger_max: int = constants.PREDATOR_HUNGER_MAX
+    predator_hunger_decrease: int = constants.PREDATOR_HUNGER_DECREASE
+
+    @classmethod
+    def from_params(cls, params=None):
+        # Конфигурация по заменам с именами из constants.PARAMS: {'HERBIVORE_VISION': 5, ...}
+        params = dict(params or {})
+        for name in params:
+            if name not in PARAMS:
+                raise ValueError(f"неизвестный параметр модели {name}")
+        return cls(**{name.lower(): value for name, value in params.items()})
+
+    def params(self):
+        # Обратно к именам constants.PARAMS — для контрольных точек, перебора и ансамбля
+        return {name: getattr(self, name.lower()) for name in PARAMS}
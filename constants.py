@@ -38,4 +38,16 @@ PREDATOR_HUNGER_DECREASE = 1  # Уменьшение голода за раун
 COLOR_GRASS = (0, 255, 0)  # Цвет травы (RGB)
 COLOR_HERBIVORE = (128, 0, 128)  # Цвет травоядного (RGB)
 COLOR_PREDATOR = (255, 0, 0)  # Цвет хищника (RGB)
-COLOR_FECES = (139, 69, 19)  # Цвет экскрементов (RGB)
\ No newline at end of file
+COLOR_FECES = (139, 69, 19)  # Цвет экскрементов (RGB)
+
+# Параметры модели, которые можно переопределить для отдельного прогона
+# (Simulation(config=Config.from_params(...)), ансамбль, перебор параметров)
+PARAMS = (
+    'FIELD_WIDTH', 'FIELD_HEIGHT',
+    'INITIAL_GRASS_COUNT', 'INITIAL_HERBIVORE_COUNT', 'INITIAL_PREDATOR_COUNT',
+    'GRASS_SPAWN_PER_ROUND', 'GRASS_SPAWN_BONUS', 'GRASS_SPAWN_RADIUS',
+    'HERBIVORE_SPEED', 'HERBIVORE_SPEED_TO_GRASS', 'HERBIVORE_VISION',
+    'HERBIVORE_REPRODUCTION_COUNT', 'HERBIVORE_GRASS_TO_REPRODUCE',
+    'PREDATOR_SPEED', 'PREDATOR_SPEED_TO_PREY', 'PREDATOR_VISION', 'PREDATOR_EATING_TIME',
+    'PREDATOR_REPRODUCTION_COUNT', 'PREDATOR_FECES_INTERVAL', 'PREDATOR_HUNGER_MAX', 'PREDATOR_HUNGER_DECREASE',
+)
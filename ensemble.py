@@ -0,0 +1,338 @@
+import numpy as np
+from numba import njit
+import constants
+from entities import HerbivoreStore, PredatorStore
+from kernels import make_rng_state, _next_seed, _uniform, _random_direction, step_herbivores, step_predators
+from spatial import _link_range, first_within_batch
+
+# Ансамбль: N независимых миров в общих массивах с ведущей осью мира.
+# Столбец сущности вида — массив (миры, ёмкость), численность — counts[мир, вид].
+# У каждого мира свой вектор параметров (строка params, столбцы по PARAMS) и свой поток
+# случайных чисел. Раунд всех миров — один вызов скомпилированного ядра, поэтому
+# накладные расходы интерпретатора делятся на весь ансамбль. Вымершие миры
+# пропускаются и выбрасываются из массивов; их итог остаётся в extinct_round/final_counts.
+
+PARAMS = constants.PARAMS
+P = {name: k for k, name in enumerate(PARAMS)}
+# Номера столбцов params для скомпилированных ядер
+(P_FIELD_WIDTH, P_FIELD_HEIGHT, P_INITIAL_GRASS_COUNT, P_INITIAL_HERBIVORE_COUNT, P_INITIAL_PREDATOR_COUNT,
+ P_GRASS_SPAWN_PER_ROUND, P_GRASS_SPAWN_BONUS, P_GRASS_SPAWN_RADIUS,
+ P_HERBIVORE_SPEED, P_HERBIVORE_SPEED_TO_GRASS, P_HERBIVORE_VISION,
+ P_HERBIVORE_REPRODUCTION_COUNT, P_HERBIVORE_GRASS_TO_REPRODUCE,
+ P_PREDATOR_SPEED, P_PREDATOR_SPEED_TO_PREY, P_PREDATOR_VISION, P_PREDATOR_EATING_TIME,
+ P_PREDATOR_REPRODUCTION_COUNT, P_PREDATOR_FECES_INTERVAL, P_PREDATOR_HUNGER_MAX,
+ P_PREDATOR_HUNGER_DECREASE) = range(len(PARAMS))
+KINDS = ('grass', 'herbivores', 'predators', 'feces')
+GRASS, HERBIVORES, PREDATORS, FECES = range(len(KINDS))
+# Дополнительные столбцы видов — те же, что у хранилищ одиночной симуляции
+COLUMNS = {'grass': (), 'herbivores': HerbivoreStore.columns, 'predators': PredatorStore.columns, 'feces': ()}
+HERBIVORE_SIZE = HerbivoreStore.size
+PREDATOR_SIZE = PredatorStore.size
+
+def _grid_shape(params, vision):
+    cols = (params[:, P_FIELD_WIDTH] // params[:, vision]).astype(np.int64) + 1
+    rows = (params[:, P_FIELD_HEIGHT] // params[:, vision]).astype(np.int64) + 1
+    return cols, rows
+
+def _grow(old, capacity, fill):
+    new = np.full((old.shape[0], capacity) + old.shape[2:], fill, old.dtype)
+    new[:, :old.shape[1]] = old
+    return new
+
+class Ensemble:
+    def __init__(self, n_worlds, params=None, seed=None, capacity=256):
+        # params: имя параметра -> число или массив из n_worlds значений; остальные из constants
+        params = params or {}
+        unknown = set(params) - set(PARAMS)
+        if unknown:
+            raise ValueError(f"неизвестные параметры: {', '.join(sorted(unknown))}")
+        self.params = np.empty((n_worlds, len(PARAMS)), dtype=np.float64)
+        for name, k in P.items():
+            self.params[:, k] = params.get(name, getattr(constants, name))
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.rng_states = np.stack([make_rng_state(self.seed, stream=w) for w in range(n_worlds)])
+        self.world_ids = np.arange(n_worlds)  # Исходный номер мира для каждой строки
+        self.round = 0
+        # Итоги по исходным номерам миров: раунд вымирания (-1 — мир жив) и численность в этот момент
+        self.extinct_round = np.full(n_worlds, -1, dtype=np.int64)
+        self.final_counts = np.zeros((n_worlds, len(KINDS)), dtype=np.int64)
+        # Состояние по строкам массивов
+        self.counts = np.zeros((n_worlds, len(KINDS)), dtype=np.int64)
+        self.active = np.ones(n_worlds, dtype=np.bool_)
+        self._row_extinct = np.full(n_worlds, -1, dtype=np.int64)
+
+        self.capacity = dict.fromkeys(KINDS, capacity)
+        self.columns = {}
+        for kind in KINDS:
+            self.columns[kind] = {'x': np.zeros((n_worlds, capacity)), 'y': np.zeros((n_worlds, capacity)),
+                                  'alive': np.zeros((n_worlds, capacity), np.bool_)}
+            for name, dtype, shape, default in COLUMNS[kind]:
+                self.columns[kind][name] = np.full((n_worlds, capacity) + shape, default, dtype)
+        # Индексы соседей травы и травоядных: ячейка равна обзору того, кто ищет
+        self.grids = {}
+        for kind, vision in (('grass', P_HERBIVORE_VISION), ('herbivores', P_PREDATOR_VISION)):
+            cols, rows = _grid_shape(self.params, vision)
+            self.grids[kind] = {'head': np.full((n_worlds, int((cols * rows).max())), -1, np.int64),
+                                'next': np.full((n_worlds, capacity), -1, np.int64),
+                                'prev': np.full((n_worlds, capacity), -1, np.int64),
+                                'cell': np.full((n_worlds, capacity), -1, np.int64)}
+        self._reserve(self.params[:, [P_INITIAL_GRASS_COUNT, P_INITIAL_HERBIVORE_COUNT,
+                                      P_INITIAL_PREDATOR_COUNT]].max(axis=0).astype(np.int64).tolist() + [0])
+        _populate(self.counts, self.rng_states, self.params, *self._arrays())
+
+    def __len__(self):
+        return len(self.world_ids)
+
+    def _arrays(self):
+        g, h, p, f = (self.columns[kind] for kind in KINDS)
+        gg, hg = self.grids['grass'], self.grids['herbivores']
+        return (g['x'], g['y'], g['alive'],
+                h['x'], h['y'], h['alive'], h['direction'], h['grass_eaten'],
+                p['x'], p['y'], p['alive'], p['direction'], p['hunger'], p['eating_timer'], p['feces_timer'],
+                f['x'], f['y'], f['alive'],
+                gg['head'], gg['next'], gg['prev'], gg['cell'], hg['head'], hg['next'], hg['prev'], hg['cell'])
+
+    def _reserve(self, needed):
+        # Ёмкость по видам не меньше needed; растут сразу все миры
+        for kind, n in zip(KINDS, needed):
+            if n <= self.capacity[kind]:
+                continue
+            capacity = max(int(n), self.capacity[kind] * 2)
+            columns = self.columns[kind]
+            for name in columns:
+                columns[name] = _grow(columns[name], capacity, 0)
+            grid = self.grids.get(kind, {})
+            for name in ('next', 'prev', 'cell'):
+                if name in grid:
+                    grid[name] = _grow(grid[name], capacity, -1)
+            self.capacity[kind] = capacity
+
+    def _headroom(self):
+        # Верхняя граница численности после раунда: каждый может размножиться
+        c, params, live = self.counts, self.params, self.active
+        if not live.any():
+            return [0] * len(KINDS)
+        bounds = np.stack((
+            c[:, GRASS] + params[:, P_GRASS_SPAWN_PER_ROUND] + c[:, FECES] * params[:, P_GRASS_SPAWN_BONUS],
+            c[:, HERBIVORES] * (1 + params[:, P_HERBIVORE_REPRODUCTION_COUNT]),
+            c[:, PREDATORS] * (1 + params[:, P_PREDATOR_REPRODUCTION_COUNT]),
+            c[:, FECES] + c[:, HERBIVORES] + c[:, PREDATORS],
+        ), axis=1)
+        return bounds[live].max(axis=0).astype(np.int64).tolist()
+
+    def step(self):
+        self._reserve(self._headroom())
+        _step_worlds(self.round, self.active, self._row_extinct, self.counts, self.rng_states, self.params,
+                     *self._arrays())
+        self.round += 1
+        if not self.active.all():
+            self._drop_extinct()
+
+    def run(self, rounds, on_round=None):
+        # on_round(ensemble) вызывается после каждого раунда, например для записи численности
+        for _ in range(rounds):
+            if not len(self):
+                break
+            self.step()
+            if on_round is not None:
+                on_round(self)
+
+    def _drop_extinct(self):
+        done = ~self.active
+        ids = self.world_ids[done]
+        self.final_counts[ids] = self.counts[done]
+        self.extinct_round[ids] = self._row_extinct[done]
+        keep = self.active
+        self.params = self.params[keep]
+        self.rng_states = self.rng_states[keep]
+        self.world_ids = self.world_ids[keep]
+        self.counts = self.counts[keep]
+        self.active = self.active[keep]
+        self._row_extinct = self._row_extinct[keep]
+        for group in list(self.columns.values()) + list(self.grids.values()):
+            for name in group:
+                group[name] = group[name][keep]
+
+    def live_counts(self):
+        # Численность по исходным номерам миров; у выбывших — на момент вымирания
+        counts = self.final_counts.copy()
+        counts[self.world_ids] = self.counts
+        return counts
+
+@njit(cache=True)
+def _append(xs, ys, alive, count, x, y):
+    n = len(x)
+    xs[count:count + n] = x
+    ys[count:count + n] = y
+    alive[count:count + n] = True
+    return count + n
+
+@njit(cache=True)
+def _holes(alive, n):
+    # Перестановка уплотнения как в EntityStore.compact: дыры спереди занимают живые с хвоста
+    live = 0
+    for i in range(n):
+        if alive[i]:
+            live += 1
+    holes = np.empty(n, dtype=np.int64)
+    movers = np.empty(n, dtype=np.int64)
+    n_holes = 0
+    n_movers = 0
+    for i in range(live):
+        if not alive[i]:
+            holes[n_holes] = i
+            n_holes += 1
+    for i in range(live, n):
+        if alive[i]:
+            movers[n_movers] = i
+            n_movers += 1
+    return live, holes[:n_holes], movers[:n_movers]
+
+@njit(cache=True)
+def _move_rows(column, holes, movers):
+    for k in range(len(holes)):
+        column[holes[k]] = column[movers[k]]
+
+@njit(cache=True)
+def _build_grid(head, nxt, prv, cell, cell_size, cols, rows, x, y, alive, count):
+    head[:cols * rows] = -1
+    cell[:count] = -1
+    grid = (head[:cols * rows], nxt, prv, cell, cell_size, cols, rows, 0.0, 0.0)
+    _link_range(grid, x, y, alive, 0, count)
+    return grid
+
+@njit(cache=True)
+def _populate(counts, rng_states, params, gx, gy, galive, hx, hy, halive, hdir, heaten,
+              px, py, palive, pdir, phunger, peat, pfeces, fx, fy, falive,
+              ghead, gnext, gprev, gcell, hhead, hnext, hprev, hcell):
+    # Начальные численности в PARAMS идут подряд в порядке GRASS, HERBIVORES, PREDATORS
+    for w in range(len(counts)):
+        seed = _next_seed(rng_states[w])
+        width = params[w, P_FIELD_WIDTH]
+        height = params[w, P_FIELD_HEIGHT]
+        index = 0
+        for kind, xs, ys, alive in ((GRASS, gx[w], gy[w], galive[w]), (HERBIVORES, hx[w], hy[w], halive[w]),
+                                    (PREDATORS, px[w], py[w], palive[w])):
+            n = int(params[w, P_INITIAL_GRASS_COUNT + kind])
+            for i in range(n):
+                xs[i] = _uniform(seed, index, 0, 0.0, width)
+                ys[i] = _uniform(seed, index, 1, 0.0, height)
+                alive[i] = True
+                index += 1
+            counts[w, kind] = n
+        for i in range(counts[w, HERBIVORES]):
+            hdir[w, i, 0], hdir[w, i, 1] = _random_direction(seed, index + i, 2)
+        index += counts[w, HERBIVORES]
+        for i in range(counts[w, PREDATORS]):
+            pdir[w, i, 0], pdir[w, i, 1] = _random_direction(seed, index + i, 2)
+            phunger[w, i] = int(params[w, P_PREDATOR_HUNGER_MAX])
+
+# Без кэша на диске: функция вызывает параллельные ядра, а загрузка такой связки из кэша numba
+# приводит к падению процесса. Компилируется при первом шаге ансамбля.
+@njit
+def _step_worlds(round_num, active, extinct_round, counts, rng_states, params,
+                 gx, gy, galive, hx, hy, halive, hdir, heaten,
+                 px, py, palive, pdir, phunger, peat, pfeces, fx, fy, falive,
+                 ghead, gnext, gprev, gcell, hhead, hnext, hprev, hcell):
+    # Раунд всех живых миров; порядок фаз повторяет Simulation.update_all
+    for w in range(len(counts)):
+        if not active[w]:
+            continue
+        p = params[w]
+        width = p[P_FIELD_WIDTH]
+        height = p[P_FIELD_HEIGHT]
+        herbivore_vision = p[P_HERBIVORE_VISION]
+        predator_vision = p[P_PREDATOR_VISION]
+        spawn = int(p[P_GRASS_SPAWN_PER_ROUND])
+        bonus = int(p[P_GRASS_SPAWN_BONUS])
+        hunger_max = int(p[P_PREDATOR_HUNGER_MAX])
+        n_grass, n_herb, n_pred, n_feces = counts[w, GRASS], counts[w, HERBIVORES], counts[w, PREDATORS], counts[w, FECES]
+        g_cols, g_rows = int(width // herbivore_vision) + 1, int(height // herbivore_vision) + 1
+        h_cols, h_rows = int(width // predator_vision) + 1, int(height // predator_vision) + 1
+
+        # Трава: удобрение экскрементами, случайное появление и появление рядом с экскрементами
+        grass_grid = _build_grid(ghead[w], gnext[w], gprev[w], gcell[w], herbivore_vision, g_cols, g_rows,
+                                 gx[w], gy[w], galive[w], n_grass)
+        nearby = first_within_batch(grass_grid, gx[w], gy[w], galive[w], fx[w, :n_feces], fy[w, :n_feces],
+                                    p[P_GRASS_SPAWN_RADIUS])
+        seed = _next_seed(rng_states[w])
+        for k in range(spawn):
+            gx[w, n_grass] = _uniform(seed, k, 0, 0.0, width)
+            gy[w, n_grass] = _uniform(seed, k, 1, 0.0, height)
+            galive[w, n_grass] = True
+            n_grass += 1
+        for j in range(n_feces):
+            if falive[w, j] and nearby[j] >= 0:
+                falive[w, j] = False
+                for k in range(bonus):
+                    index = spawn + j * bonus + k
+                    gx[w, n_grass] = fx[w, j] + _uniform(seed, index, 0, -5.0, 5.0)
+                    gy[w, n_grass] = fy[w, j] + _uniform(seed, index, 1, -5.0, 5.0)
+                    galive[w, n_grass] = True
+                    n_grass += 1
+        n_grass = _compact_plain(gx[w], gy[w], galive[w], n_grass)
+        n_feces = _compact_plain(fx[w], fy[w], falive[w], n_feces)
+        grass_grid = _build_grid(ghead[w], gnext[w], gprev[w], gcell[w], herbivore_vision, g_cols, g_rows,
+                                 gx[w], gy[w], galive[w], n_grass)
+        herb_grid = _build_grid(hhead[w], hnext[w], hprev[w], hcell[w], predator_vision, h_cols, h_rows,
+                                hx[w], hy[w], halive[w], n_herb)
+
+        hfx, hfy, hcx, hcy, hcd, _, _ = step_herbivores(
+            hx[w], hy[w], hdir[w], heaten[w], halive[w], n_herb, herb_grid,
+            gx[w], gy[w], galive[w], grass_grid, rng_states[w],
+            herbivore_vision, p[P_HERBIVORE_SPEED], p[P_HERBIVORE_SPEED_TO_GRASS], HERBIVORE_SIZE, width, height,
+            int(p[P_HERBIVORE_GRASS_TO_REPRODUCE]), int(p[P_HERBIVORE_REPRODUCTION_COUNT]))
+        pfx, pfy, pcx, pcy, pcd, _, _, _ = step_predators(
+            px[w], py[w], pdir[w], phunger[w], peat[w], pfeces[w], palive[w], n_pred,
+            hx[w], hy[w], halive[w], herb_grid, rng_states[w],
+            predator_vision, p[P_PREDATOR_SPEED], p[P_PREDATOR_SPEED_TO_PREY], PREDATOR_SIZE, width, height,
+            int(p[P_PREDATOR_EATING_TIME]), int(p[P_PREDATOR_FECES_INTERVAL]), hunger_max,
+            int(p[P_PREDATOR_HUNGER_DECREASE]), int(p[P_PREDATOR_REPRODUCTION_COUNT]))
+
+        # Рождения и экскременты — после обеих фаз, как в одиночной симуляции
+        n_feces = _append(fx[w], fy[w], falive[w], n_feces, hfx, hfy)
+        n_feces = _append(fx[w], fy[w], falive[w], n_feces, pfx, pfy)
+        start = n_herb
+        n_herb = _append(hx[w], hy[w], halive[w], n_herb, hcx, hcy)
+        hdir[w, start:n_herb] = hcd
+        heaten[w, start:n_herb] = 0
+        start = n_pred
+        n_pred = _append(px[w], py[w], palive[w], n_pred, pcx, pcy)
+        pdir[w, start:n_pred] = pcd
+        phunger[w, start:n_pred] = hunger_max
+        peat[w, start:n_pred] = 0
+        pfeces[w, start:n_pred] = 0
+
+        n_grass = _compact_plain(gx[w], gy[w], galive[w], n_grass)
+        n_feces = _compact_plain(fx[w], fy[w], falive[w], n_feces)
+        live, holes, movers = _holes(halive[w], n_herb)
+        for column in (hx[w], hy[w]):
+            _move_rows(column, holes, movers)
+        _move_rows(hdir[w], holes, movers)
+        _move_rows(heaten[w], holes, movers)
+        halive[w, live:n_herb] = False
+        halive[w, :live] = True
+        n_herb = live
+        live, holes, movers = _holes(palive[w], n_pred)
+        for column in (px[w], py[w]):
+            _move_rows(column, holes, movers)
+        _move_rows(pdir[w], holes, movers)
+        for column in (phunger[w], peat[w], pfeces[w]):
+            _move_rows(column, holes, movers)
+        palive[w, live:n_pred] = False
+        palive[w, :live] = True
+        n_pred = live
+
+        counts[w, GRASS], counts[w, HERBIVORES], counts[w, PREDATORS], counts[w, FECES] = n_grass, n_herb, n_pred, n_feces
+        if n_herb == 0 or n_pred == 0:
+            active[w] = False
+            extinct_round[w] = round_num + 1
+
+@njit(cache=True)
+def _compact_plain(x, y, alive, n):
+    live, holes, movers = _holes(alive, n)
+    _move_rows(x, holes, movers)
+    _move_rows(y, holes, movers)
+    alive[live:n] = False
+    alive[:live] = True
+    return live
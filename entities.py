@@ -1,229 +1,187 @@
-import random
-import math
+import numpy as np
 from constants import *
-from utils import distance, normalize_vector
-
-class QuadTree:
-    def __init__(self, x, y, width, height, capacity=4):  # Уменьшено с 8 до 4
-        self.x = x
-        self.y = y
-        self.width = width
-        self.height = height
+from kernels import step_herbivores, step_herbivores_raster, step_predators
+from grass_raster import GrassRaster
+
+def random_directions(n, rng):
+    # Случайные направления, отбрасываем слишком короткие векторы
+    directions = rng.uniform(-1, 1, (n, 2))
+    weak = np.flatnonzero(np.abs(directions).max(axis=1) <= 0.2)
+    while len(weak):
+        directions[weak] = rng.uniform(-1, 1, (len(weak), 2))
+        weak = weak[np.abs(directions[weak]).max(axis=1) <= 0.2]
+    return directions
+
+def scatter_around(x, y, count, rng, spread=5):
+    # Координаты потомков вокруг родителей: каждый родитель повторяется count раз
+    x = np.repeat(x, count) + rng.uniform(-spread, spread, len(x) * count)
+    y = np.repeat(y, count) + rng.uniform(-spread, spread, len(y) * count)
+    return x, y
+
+class EntityStore:
+    # Все сущности одного типа хранятся столбцами NumPy (struct-of-arrays).
+    # Индексы 0..count-1 заняты, мёртвые удаляются в compact() перестановкой с хвоста.
+    color = None
+    size = 1
+    columns = ()  # Дополнительные столбцы: (имя, dtype, форма элемента, значение по умолчанию)
+
+    def __init__(self, capacity=64):
+        self.count = 0
         self.capacity = capacity
-        self.entities = []
-        self.divided = False
-        self.nw = None
-        self.ne = None
-        self.sw = None
-        self.se = None
-        self.x_min = x
-        self.x_max = x + width
-        self.y_min = y
-        self.y_max = y + height
-        self._query_cache = {}
-
-    def subdivide(self):
-        half_w = self.width / 2
-        half_h = self.height / 2
-        x, y = self.x, self.y
-        self.nw = QuadTree(x, y, half_w, half_h, self.capacity)
-        self.ne = QuadTree(x + half_w, y, half_w, half_h, self.capacity)
-        self.sw = QuadTree(x, y + half_h, half_w, half_h, self.capacity)
-        self.se = QuadTree(x + half_w, y + half_h, half_w, half_h, self.capacity)
-        self.divided = True
-        entities_to_redistribute = self.entities
-        self.entities = []
-        for entity in entities_to_redistribute:
-            self.insert(entity)
-
-    def insert(self, entity):
-        if not (self.x_min <= entity.x < self.x_max and self.y_min <= entity.y < self.y_max):
-            return False
-        if len(self.entities) < self.capacity and not self.divided:
-            self.entities.append(entity)
-            return True
-        if not self.divided:
-            self.subdivide()
-        return (self.nw.insert(entity) or
-                self.ne.insert(entity) or
-                self.sw.insert(entity) or
-                self.se.insert(entity))
-
-    def query(self, x, y, radius):
-        cache_key = (x, y, radius)
-        if cache_key in self._query_cache:
-            return self._query_cache[cache_key]
-        
-        found = []
-        closest_x = max(self.x_min, min(x, self.x_max))
-        closest_y = max(self.y_min, min(y, self.y_max))
-        dist_to_rect = distance(x, y, closest_x, closest_y)
-        if dist_to_rect > radius:
-            return found
-        
-        for entity in self.entities:
-            if entity.alive and distance(x, y, entity.x, entity.y) <= radius:
-                found.append(entity)
-        
-        if self.divided:
-            found.extend(self.nw.query(x, y, radius))
-            found.extend(self.ne.query(x, y, radius))
-            found.extend(self.sw.query(x, y, radius))
-            found.extend(self.se.query(x, y, radius))
-        
-        self._query_cache[cache_key] = found
-        return found
-
-    def clear_cache(self):
-        self._query_cache.clear()
-        if self.divided:
-            self.nw.clear_cache()
-            self.ne.clear_cache()
-            self.sw.clear_cache()
-            self.se.clear_cache()
-
-class Entity:
-    def __init__(self, x, y, color, size):
-        self.x = x
-        self.y = y
-        self.color = color
-        self.size = size
-        self.alive = True
-
-class Grass(Entity):
-    def __init__(self, x, y):
-        super().__init__(x, y, COLOR_GRASS, 1)
-
-class Feces(Entity):
-    def __init__(self, x, y):
-        super().__init__(x, y, COLOR_FECES, 1)
-
-class Herbivore(Entity):
-    def __init__(self, x, y):
-        super().__init__(x, y, COLOR_HERBIVORE, 2)
-        while True:
-            dx, dy = random.uniform(-1, 1), random.uniform(-1, 1)
-            if abs(dx) > 0.2 or abs(dy) > 0.2:
-                self.direction = (dx, dy)
-                break
-        self.grass_eaten = 0
-
-    def move(self, grass_quadtree):
-        if not self.alive:
-            return
-        nearest_grass = None
-        min_dist = float('inf')
-        nearby_grass = grass_quadtree.query(self.x, self.y, HERBIVORE_VISION)
-        for grass in nearby_grass:
-            if grass.alive:
-                dist = distance(self.x, self.y, grass.x, grass.y)
-                if dist < min_dist:
-                    min_dist = dist
-                    nearest_grass = grass
-
-        if nearest_grass:
-            dx = nearest_grass.x - self.x
-            dy = nearest_grass.y - self.y
-            dx, dy = normalize_vector(dx, dy)
-            self.x += dx * HERBIVORE_SPEED_TO_GRASS
-            self.y += dy * HERBIVORE_SPEED_TO_GRASS
-        else:
-            dx, dy = normalize_vector(*self.direction)
-            self.x += dx * HERBIVORE_SPEED
-            self.y += dy * HERBIVORE_SPEED
-            self.direction = (random.uniform(-1, 1), random.uniform(-1, 1))
-
-        self.x = max(0, min(self.x, FIELD_WIDTH - self.size))
-        self.y = max(0, min(self.y, FIELD_HEIGHT - self.size))
-
-    def eat(self, grass_quadtree, feces_list):
-        if not self.alive:
-            return []
-        new_herbivores = []
-        nearby_grass = grass_quadtree.query(self.x, self.y, self.size)
-        for grass in nearby_grass:
-            if grass.alive:
-                grass.alive = False
-                self.grass_eaten += 1
-                if self.grass_eaten >= HERBIVORE_GRASS_TO_REPRODUCE:
-                    self.grass_eaten = 0
-                    feces_list.append(Feces(self.x, self.y))
-                    new_herbivores.extend([
-                        Herbivore(self.x + random.uniform(-5, 5), self.y + random.uniform(-5, 5))
-                        for _ in range(HERBIVORE_REPRODUCTION_COUNT)
-                    ])
-                break
-        return new_herbivores
-
-class Predator(Entity):
-    def __init__(self, x, y):
-        super().__init__(x, y, COLOR_PREDATOR, 6)
-        self.hunger = PREDATOR_HUNGER_MAX
-        while True:
-            dx, dy = random.uniform(-1, 1), random.uniform(-1, 1)
-            if abs(dx) > 0.2 or abs(dy) > 0.2:
-                self.direction = (dx, dy)
-                break
-        self.eating_timer = 0
-        self.feces_timer = 0
-        self.target = None
-
-    def move(self, herbivore_quadtree):
-        if not self.alive or self.eating_timer > 0:
-            self.eating_timer -= 1
-            self.hunger = PREDATOR_HUNGER_MAX
+        self.index = None  # SpatialHash, если для хранилища нужен поиск соседей
+        self.next_id = 0  # Постоянные номера сущностей не меняются при compact()
+        self.x = np.zeros(capacity, np.float64)
+        self.y = np.zeros(capacity, np.float64)
+        self.alive = np.zeros(capacity, np.bool_)
+        self.id = np.zeros(capacity, np.int64)
+        for name, dtype, shape, default in self.columns:
+            setattr(self, name, np.full((capacity,) + shape, default, dtype))
+
+    def column_names(self):
+        return ('x', 'y', 'alive', 'id') + tuple(column[0] for column in self.columns)
+
+    def _reserve(self, extra):
+        needed = self.count + extra
+        if needed <= self.capacity:
             return
+        capacity = max(needed, self.capacity * 2)
+        for name in self.column_names():
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        if self.index is not None:
+            self.index.reserve(capacity)
+        self.capacity = capacity
 
-        nearest_herbivore = None
-        min_dist = float('inf')
-        nearby_herbivores = herbivore_quadtree.query(self.x, self.y, PREDATOR_VISION)
-        for herbivore in nearby_herbivores:
-            if herbivore.alive:
-                dist = distance(self.x, self.y, herbivore.x, herbivore.y)
-                if dist < min_dist:
-                    min_dist = dist
-                    nearest_herbivore = herbivore
-
-        if nearest_herbivore:
-            self.target = nearest_herbivore
-            dx = nearest_herbivore.x - self.x
-            dy = nearest_herbivore.y - self.y
-            dx, dy = normalize_vector(dx, dy)
-            self.x += dx * PREDATOR_SPEED_TO_PREY
-            self.y += dy * PREDATOR_SPEED_TO_PREY
-        else:
-            self.target = None
-            dx, dy = normalize_vector(*self.direction)
-            self.x += dx * PREDATOR_SPEED
-            self.y += dy * PREDATOR_SPEED
-            self.direction = (random.uniform(-1, 1), random.uniform(-1, 1))
-
-        self.x = max(0, min(self.x, FIELD_WIDTH - self.size))
-        self.y = max(0, min(self.y, FIELD_HEIGHT - self.size))
-        self.hunger -= PREDATOR_HUNGER_DECREASE
-
-    def eat(self, herbivore_quadtree, feces_list):
-        if not self.alive:
-            return []
-        self.feces_timer += 1
-        if self.feces_timer >= PREDATOR_FECES_INTERVAL:
-            self.feces_timer = 0
-            feces_list.append(Feces(self.x, self.y))
-
-        if self.target and self.target.alive:
-            nearby_herbivores = herbivore_quadtree.query(self.x, self.y, self.size)
-            if self.target in nearby_herbivores:
-                self.target.alive = False
-                self.target = None
-                self.eating_timer = PREDATOR_EATING_TIME
-                self.hunger = PREDATOR_HUNGER_MAX
-                return []
-        elif self.eating_timer == 1:
-            self.eating_timer = 0
-            return [Predator(self.x + random.uniform(-5, 5), self.y + random.uniform(-5, 5))
-                    for _ in range(PREDATOR_REPRODUCTION_COUNT)]
-        return []
-
-    def update_hunger(self):
-        if self.hunger <= 0:
-            self.alive = False
\ No newline at end of file
+    def add(self, x, y, **values):
+        x = np.atleast_1d(np.asarray(x, np.float64))
+        y = np.atleast_1d(np.asarray(y, np.float64))
+        n = len(x)
+        self._reserve(n)
+        start, end = self.count, self.count + n
+        self.x[start:end] = x
+        self.y[start:end] = y
+        self.alive[start:end] = True
+        self.id[start:end] = np.arange(self.next_id, self.next_id + n)
+        self.next_id += n
+        for name, dtype, shape, default in self.columns:
+            getattr(self, name)[start:end] = values.get(name, default)
+        self.count = end
+        if self.index is not None:
+            self.index.insert(start, end)
+        return slice(start, end)
+
+    def live_count(self):
+        return int(np.count_nonzero(self.alive[:self.count]))
+
+    def live(self, name):
+        return getattr(self, name)[:self.count][self.alive[:self.count]]
+
+    def positions(self):
+        live = self.alive[:self.count]
+        return np.column_stack((self.x[:self.count][live], self.y[:self.count][live]))
+
+    def state_arrays(self, prefix):
+        # Занятая часть всех столбцов для контрольной точки (вместе с индексом соседей)
+        arrays = {f'{prefix}.{name}': getattr(self, name)[:self.count] for name in self.column_names()}
+        arrays[f'{prefix}.next_id'] = np.int64(self.next_id)
+        if self.index is not None:
+            arrays.update(self.index.state_arrays(prefix, self.count))
+        return arrays
+
+    def load_arrays(self, arrays, prefix):
+        # Восстановление из контрольной точки в пустое хранилище
+        n = len(arrays[f'{prefix}.x'])
+        self._reserve(n)
+        for name in self.column_names():
+            getattr(self, name)[:n] = arrays[f'{prefix}.{name}']
+        self.count = n
+        self.next_id = int(arrays[f'{prefix}.next_id'])
+        if self.index is not None:
+            self.index.load_arrays(arrays, prefix, n)
+
+    def compact(self):
+        # Мёртвые слоты в начале заполняются живыми сущностями с хвоста
+        n = self.count
+        alive = self.alive[:n]
+        live = int(np.count_nonzero(alive))
+        if live == n:
+            return
+        holes = np.flatnonzero(~alive[:live])
+        movers = live + np.flatnonzero(alive[live:n])
+        if self.index is not None:
+            self.index.compact(np.flatnonzero(~alive), holes, movers)
+        for name in self.column_names():
+            column = getattr(self, name)
+            column[holes] = column[movers]
+        self.alive[live:n] = False
+        self.count = live
+
+class GrassStore(EntityStore):
+    color = COLOR_GRASS
+    size = 1
+
+class FecesStore(EntityStore):
+    color = COLOR_FECES
+    size = 1
+
+class HerbivoreStore(EntityStore):
+    color = COLOR_HERBIVORE
+    size = 2
+    columns = (
+        ('direction', np.float64, (2,), 0.0),
+        ('grass_eaten', np.int64, (), 0),
+    )
+
+    def spawn(self, x, y, direction=None, rng=None):
+        x = np.atleast_1d(x)
+        if direction is None:
+            direction = random_directions(len(x), rng)
+        return self.add(x, np.atleast_1d(y), direction=direction)
+
+    def step(self, grass, rng_state, config):
+        # Один вызов скомпилированного ядра на весь раунд; config — параметры модели прогона (Config).
+        # Возвращает координаты экскрементов, потомков (x, y, направления) и события раунда:
+        # сколько травы съедено и на сколько уменьшилось число точек травы.
+        c = config
+        if isinstance(grass, GrassRaster):
+            feces_x, feces_y, child_x, child_y, child_direction, eaten, cleared = step_herbivores_raster(
+                self.x, self.y, self.direction, self.grass_eaten, self.alive, self.count, self.index.arrays(),
+                grass.cells, rng_state,
+                c.herbivore_vision, c.herbivore_speed, c.herbivore_speed_to_grass, self.size,
+                c.field_width, c.field_height, c.herbivore_grass_to_reproduce, c.herbivore_reproduction_count)
+            return (feces_x, feces_y), (child_x, child_y, child_direction), (eaten, cleared)
+        feces_x, feces_y, child_x, child_y, child_direction, eaten, cleared = step_herbivores(
+            self.x, self.y, self.direction, self.grass_eaten, self.alive, self.count, self.index.arrays(),
+            grass.x, grass.y, grass.alive, grass.index.arrays(), rng_state,
+            c.herbivore_vision, c.herbivore_speed, c.herbivore_speed_to_grass, self.size,
+            c.field_width, c.field_height, c.herbivore_grass_to_reproduce, c.herbivore_reproduction_count)
+        return (feces_x, feces_y), (child_x, child_y, child_direction), (eaten, cleared)
+
+class PredatorStore(EntityStore):
+    color = COLOR_PREDATOR
+    size = 6
+    columns = (
+        ('direction', np.float64, (2,), 0.0),
+        ('hunger', np.int64, (), PREDATOR_HUNGER_MAX),
+        ('eating_timer', np.int64, (), 0),
+        ('feces_timer', np.int64, (), 0),
+    )
+
+    def spawn(self, x, y, direction=None, rng=None, hunger=PREDATOR_HUNGER_MAX):
+        x = np.atleast_1d(x)
+        if direction is None:
+            direction = random_directions(len(x), rng)
+        return self.add(x, np.atleast_1d(y), direction=direction, hunger=hunger)
+
+    def step(self, herbivores, rng_state, config):
+        # События раунда: убитые травоядные, умершие от голода хищники и сумма голода выживших
+        c = config
+        feces_x, feces_y, child_x, child_y, child_direction, kills, starved, hunger_sum = step_predators(
+            self.x, self.y, self.direction, self.hunger, self.eating_timer, self.feces_timer, self.alive, self.count,
+            herbivores.x, herbivores.y, herbivores.alive, herbivores.index.arrays(), rng_state,
+            c.predator_vision, c.predator_speed, c.predator_speed_to_prey, self.size,
+            c.field_width, c.field_height, c.predator_eating_time, c.predator_feces_interval,
+            c.predator_hunger_max, c.predator_hunger_decrease, c.predator_reproduction_count)
+        return (feces_x, feces_y), (child_x, child_y, child_direction), (kills, starved, hunger_sum)
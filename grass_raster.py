@@ -0,0 +1,131 @@
+import math
+import numpy as np
+from numba import njit, prange
+from constants import COLOR_GRASS
+from utils import distance
+
+# Трава как растр: uint8 на пиксель поля — сколько травинок в клетке (не больше 255).
+# Память и время не зависят от количества травы: появление и поедание — запись в клетку,
+# поиск — просмотр окна клеток вокруг точки. Травинка клетки (ix, iy) стоит в точке (ix, iy).
+# Интерфейс повторяет GrassStore там, где его используют симуляция, история и журнал.
+
+class GrassRaster:
+    color = COLOR_GRASS
+    size = 1
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.cells = np.zeros((height, width), dtype=np.uint8)
+        self.index = self  # Растр сам отвечает на запросы соседства
+
+    def add(self, x, y):
+        # Возвращает, сколько клеток стало занятыми: на столько выросло число точек травы
+        return _add(self.cells, np.atleast_1d(np.asarray(x, np.float64)), np.atleast_1d(np.asarray(y, np.float64)))
+
+    def compact(self):
+        pass  # Удалять нечего: съеденная трава — меньшее число в клетке
+
+    def live_count(self):
+        # Число занятых клеток — столько точек травы видят история и рендерер
+        return int(np.count_nonzero(self.cells))
+
+    def live(self, name):
+        # Занятые клетки по возрастанию номера; номер клетки служит постоянным номером травы
+        occupied = np.flatnonzero(self.cells)
+        if name == 'x':
+            return (occupied % self.width).astype(np.float64)
+        if name == 'y':
+            return (occupied // self.width).astype(np.float64)
+        if name == 'id':
+            return occupied
+        raise KeyError(name)
+
+    def first_within_batch(self, px, py, radius):
+        return first_cell_batch(self.cells, np.asarray(px, np.float64), np.asarray(py, np.float64), radius)
+
+    def state_arrays(self, prefix):
+        return {f'{prefix}.cells': self.cells}
+
+    def load_arrays(self, arrays, prefix):
+        self.cells[:] = arrays[f'{prefix}.cells']
+
+@njit(cache=True)
+def _add(cells, x, y):
+    # Трава за пределами поля не появляется, переполнение клетки отбрасывается
+    h, w = cells.shape
+    occupied = 0
+    for k in range(len(x)):
+        ix = int(math.floor(x[k]))
+        iy = int(math.floor(y[k]))
+        if 0 <= ix < w and 0 <= iy < h and cells[iy, ix] < 255:
+            if cells[iy, ix] == 0:
+                occupied += 1
+            cells[iy, ix] += 1
+    return occupied
+
+@njit(cache=True)
+def _window(cells, px, py, radius):
+    h, w = cells.shape
+    x0 = max(int(math.floor(px - radius)), 0)
+    y0 = max(int(math.floor(py - radius)), 0)
+    x1 = min(int(math.floor(px + radius)), w - 1)
+    y1 = min(int(math.floor(py + radius)), h - 1)
+    return x0, y0, x1, y1
+
+@njit(cache=True)
+def nearest_cell(cells, px, py, radius):
+    # Ближайшая занятая клетка в радиусе: (номер клетки, расстояние) или (-1, inf)
+    w = cells.shape[1]
+    x0, y0, x1, y1 = _window(cells, px, py, radius)
+    best = -1
+    best_dist = np.inf
+    for iy in range(y0, y1 + 1):
+        for ix in range(x0, x1 + 1):
+            if cells[iy, ix]:
+                dist = distance(px, py, float(ix), float(iy))
+                if dist <= radius and dist < best_dist:
+                    best = iy * w + ix
+                    best_dist = dist
+    return best, best_dist
+
+@njit(cache=True)
+def nearest_cell_gather(cells, px, py, radius, near, candidates):
+    # Как nearest_cell, но попутно запоминает занятые клетки не дальше near (построчно);
+    # возвращает (номер клетки, расстояние, число таких клеток), см. spatial._nearest_gather
+    w = cells.shape[1]
+    x0, y0, x1, y1 = _window(cells, px, py, radius)
+    best = -1
+    best_dist = np.inf
+    n = 0
+    for iy in range(y0, y1 + 1):
+        for ix in range(x0, x1 + 1):
+            if cells[iy, ix]:
+                dist = distance(px, py, float(ix), float(iy))
+                if dist <= near:
+                    if n < len(candidates):
+                        candidates[n] = iy * w + ix
+                    n += 1
+                if dist <= radius and dist < best_dist:
+                    best = iy * w + ix
+                    best_dist = dist
+    return best, best_dist, n
+
+@njit(cache=True)
+def _first_cell(cells, px, py, radius):
+    # Любая занятая клетка ближе radius (строго), -1 — нет
+    w = cells.shape[1]
+    x0, y0, x1, y1 = _window(cells, px, py, radius)
+    for iy in range(y0, y1 + 1):
+        for ix in range(x0, x1 + 1):
+            if cells[iy, ix] and distance(px, py, float(ix), float(iy)) < radius:
+                return iy * w + ix
+    return -1
+
+@njit(parallel=True, nogil=True, cache=True)
+def first_cell_batch(cells, px, py, radius):
+    n = len(px)
+    found = np.full(n, -1, dtype=np.int64)
+    for k in prange(n):
+        found[k] = _first_cell(cells, px[k], py[k], radius)
+    return found
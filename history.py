@@ -0,0 +1,111 @@
+import numpy as np
+
+# Виды сущностей в порядке хранения в снимке
+KINDS = ('grass', 'herbivores', 'predators', 'feces')
+# По умолчанию: снимков в истории и байт под координаты (8 байт на сущность)
+HISTORY_STATES = 20
+HISTORY_BUDGET = 64 * 1024 * 1024
+
+class Snapshot:
+    # Неизменяемый снимок раунда: координаты всех сущностей (float32) подряд по видам,
+    # количество сущностей каждого вида и средний голод хищников.
+    # Массивы — представления буфера истории только для чтения и действительны, пока
+    # снимок не вытеснен из истории; copy() даёт независимую копию.
+    def __init__(self, round_num, positions, counts, avg_hunger):
+        self.round = round_num
+        self.positions = positions
+        self.counts = counts
+        self.avg_hunger = avg_hunger
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def __getitem__(self, kind):
+        k = KINDS.index(kind)
+        return self.positions[self.offsets[k]:self.offsets[k + 1]]
+
+    @property
+    def types(self):
+        # Код вида для каждой строки positions (индекс в KINDS)
+        return np.repeat(np.arange(len(KINDS), dtype=np.uint8), self.counts)
+
+    def copy(self):
+        return Snapshot(self.round, self.positions.copy(), self.counts.copy(), self.avg_hunger)
+
+class StateHistory:
+    # Кольцевой буфер снимков с заранее выделенной памятью.
+    # Координаты лежат в общей «арене» размером memory_budget байт; снимок занимает
+    # непрерывный участок, при нехватке места или слотов вытесняются самые старые.
+    # Поиск снимка по номеру раунда — O(1) через словарь.
+    def __init__(self, max_states=HISTORY_STATES, memory_budget=HISTORY_BUDGET):
+        self.max_states = max_states
+        self.arena = np.empty((max(1, memory_budget // 8), 2), dtype=np.float32)
+        self.slot_round = np.full(max_states, -1, dtype=np.int64)
+        self.slot_start = np.zeros(max_states, dtype=np.int64)
+        self.slot_length = np.zeros(max_states, dtype=np.int64)
+        self.slot_counts = np.zeros((max_states, len(KINDS)), dtype=np.int64)
+        self.slot_hunger = np.zeros(max_states, dtype=np.float64)
+        self.oldest = 0
+        self.size = 0
+        self.tail = 0
+        self.by_round = {}
+
+    def __len__(self):
+        return self.size
+
+    def _overlaps(self, start, end):
+        for k in range(self.size):
+            slot = (self.oldest + k) % self.max_states
+            s = self.slot_start[slot]
+            if s < end and start < s + self.slot_length[slot]:
+                return True
+        return False
+
+    def _evict_oldest(self):
+        slot = self.oldest
+        del self.by_round[int(self.slot_round[slot])]
+        self.slot_round[slot] = -1
+        self.oldest = (self.oldest + 1) % self.max_states
+        self.size -= 1
+
+    def append(self, round_num, positions, avg_hunger):
+        # positions — пары массивов (x, y) для каждого вида в порядке KINDS
+        counts = np.array([len(x) for x, _ in positions], dtype=np.int64)
+        n = int(counts.sum())
+        if n > len(self.arena):
+            raise MemoryError(f"снимок из {n} сущностей не помещается в буфер истории ({len(self.arena)})")
+        start = self.tail if self.tail + n <= len(self.arena) else 0
+        if round_num in self.by_round:
+            raise ValueError(f"снимок раунда {round_num} уже сохранён")
+        while self.size and (self.size == self.max_states or self._overlaps(start, start + n)):
+            self._evict_oldest()
+
+        offset = start
+        for x, y in positions:
+            self.arena[offset:offset + len(x), 0] = x
+            self.arena[offset:offset + len(x), 1] = y
+            offset += len(x)
+
+        slot = (self.oldest + self.size) % self.max_states
+        self.slot_round[slot] = round_num
+        self.slot_start[slot] = start
+        self.slot_length[slot] = n
+        self.slot_counts[slot] = counts
+        self.slot_hunger[slot] = avg_hunger
+        self.by_round[round_num] = slot
+        self.size += 1
+        self.tail = start + n
+
+    def _snapshot(self, slot):
+        start = self.slot_start[slot]
+        positions = self.arena[start:start + self.slot_length[slot]]
+        positions.flags.writeable = False
+        counts = self.slot_counts[slot].copy()
+        return Snapshot(int(self.slot_round[slot]), positions, counts, float(self.slot_hunger[slot]))
+
+    def get(self, round_num):
+        slot = self.by_round.get(round_num)
+        return None if slot is None else self._snapshot(slot)
+
+    def latest(self):
+        if not self.size:
+            return None
+        return self._snapshot((self.oldest + self.size - 1) % self.max_states)
@@ -0,0 +1,396 @@
+import numpy as np
+from numba import njit, prange
+from utils import distance, normalize_vector
+from spatial import relink, nearest_batch, within_range, _nearest, _nearest_gather
+from grass_raster import nearest_cell, nearest_cell_gather
+
+# Параллельные ядра (prange) работают на потоках numba и отпускают GIL (nogil): пока идёт
+# раунд, другие потоки Python этого процесса продолжают работу.
+
+# Генератор случайных чисел без общего состояния: каждое число выводится из ключа,
+# номера вызова ядра, индекса сущности и номера выборки (splitmix64).
+# Состояние — массив uint64 [ключ, счётчик вызовов], счётчик увеличивается ядром.
+
+def make_rng_state(seed=None, stream=0):
+    key = np.random.SeedSequence(seed, spawn_key=(stream,)).generate_state(1, np.uint64)[0]
+    return np.array([key, 0], dtype=np.uint64)
+
+@njit(cache=True)
+def _splitmix(z):
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+@njit(cache=True)
+def _next_seed(rng_state):
+    seed = _splitmix(rng_state[0] ^ _splitmix(rng_state[1]))
+    rng_state[1] += np.uint64(1)
+    return seed
+
+@njit(cache=True)
+def _uniform(seed, index, draw, low, high):
+    z = _splitmix(seed ^ _splitmix(np.uint64(index) * np.uint64(64) + np.uint64(draw)))
+    return low + (high - low) * ((z >> np.uint64(11)) * (1.0 / 9007199254740992.0))
+
+@njit(cache=True)
+def _random_direction(seed, index, draw):
+    # Как при создании сущности: отбрасываем слишком короткие направления
+    while True:
+        dx = _uniform(seed, index, draw, -1.0, 1.0)
+        dy = _uniform(seed, index, draw + 1, -1.0, 1.0)
+        draw += 2
+        if abs(dx) > 0.2 or abs(dy) > 0.2:
+            return dx, dy
+
+TIE_DRAW = 63  # Номер выборки для жребия при равных расстояниях; не пересекается с остальными
+
+# Кандидаты для проверки контакта, запомненные при поиске цели: травоядное за раунд смещается
+# не дальше своей скорости, поэтому трава в радиусе size от нового места уже была в радиусе
+# size + шаг от старого и попала в обход поиска цели. Кого граница поля сдвинула дальше
+# (потомки появляются и за краем), проверяются отдельным запросом. Обход сетки идёт построчно по ячейкам,
+# так что порядок кандидатов и выбор среди равноудалённых совпадают с отдельным запросом.
+# Трава в фазе намерений не умирает; живость всё равно проверяется при использовании.
+CONTACT_CANDIDATES = 16  # Больше кандидатов у агента — повторный запрос к индексу
+CONTACT_EPSILON = 1e-6  # Запас на округление при сравнении расстояний
+
+@njit(cache=True)
+def _claim_winners(agents, targets, dists, n_targets, seed):
+    # Разрешение заявок: каждая цель достаётся ближайшему претенденту, при равенстве —
+    # по жребию от зерна раунда и номера претендента. Результат не зависит от порядка
+    # заявок. Возвращает для каждой цели номер выигравшей заявки или -1.
+    winner = np.full(n_targets, -1, dtype=np.int64)
+    best_dist = np.full(n_targets, np.inf)
+    best_tie = np.zeros(n_targets)
+    for k in range(len(agents)):
+        t = targets[k]
+        if t < 0:
+            continue
+        tie = _uniform(seed, agents[k], TIE_DRAW, 0.0, 1.0)
+        if dists[k] < best_dist[t] or (dists[k] == best_dist[t] and tie < best_tie[t]):
+            winner[t] = k
+            best_dist[t] = dists[k]
+            best_tie[t] = tie
+    return winner
+
+@njit(cache=True)
+def _claim_units(agents, targets, dists, units, seed):
+    # Как _claim_winners, но цель делится: её получают units[цель] ближайших претендентов
+    # (травинки одной клетки растра). Возвращает для каждой заявки, удовлетворена ли она.
+    n = len(agents)
+    ties = np.empty(n)
+    for k in range(n):
+        ties[k] = _uniform(seed, agents[k], TIE_DRAW, 0.0, 1.0)
+    order = np.argsort(ties, kind='mergesort')
+    order = order[np.argsort(dists[order], kind='mergesort')]
+    order = order[np.argsort(targets[order], kind='mergesort')]
+    won = np.zeros(n, dtype=np.bool_)
+    current = -1
+    taken = 0
+    for k in order:
+        t = targets[k]
+        if t < 0:
+            continue
+        if t != current:
+            current = t
+            taken = 0
+        if taken < units[t]:
+            won[k] = True
+            taken += 1
+    return won
+
+@njit(cache=True)
+def _offspring(x, y, parents, n_parents, count, seed, first_index):
+    # Потомки вокруг родителей (±5 пикселей) со случайными направлениями
+    child_x = np.empty(n_parents * count)
+    child_y = np.empty(n_parents * count)
+    child_direction = np.empty((n_parents * count, 2))
+    for p in range(n_parents):
+        for k in range(count):
+            c = p * count + k
+            index = first_index + c
+            child_x[c] = x[parents[p]] + _uniform(seed, index, 0, -5.0, 5.0)
+            child_y[c] = y[parents[p]] + _uniform(seed, index, 1, -5.0, 5.0)
+            child_direction[c, 0], child_direction[c, 1] = _random_direction(seed, index, 2)
+    return child_x, child_y, child_direction
+
+@njit(cache=True)
+def _step_toward(x, y, direction, i, has_target, target_x, target_y, seed, speed, speed_to_target,
+                 size, width, height):
+    # Шаг к цели или, без цели, по текущему направлению со сменой его на случайное
+    if has_target:
+        dx, dy = normalize_vector(target_x - x[i], target_y - y[i])
+        x[i] += dx * speed_to_target
+        y[i] += dy * speed_to_target
+    else:
+        dx, dy = normalize_vector(direction[i, 0], direction[i, 1])
+        x[i] += dx * speed
+        y[i] += dy * speed
+        direction[i, 0] = _uniform(seed, i, 0, -1.0, 1.0)
+        direction[i, 1] = _uniform(seed, i, 1, -1.0, 1.0)
+    x[i] = max(0.0, min(x[i], width - size))
+    y[i] = max(0.0, min(y[i], height - size))
+
+# Раунд разбит на фазы. Намерения (herbivore_intents, predator_intents) идут параллельно:
+# каждый агент по состоянию на начало фазы выбирает цель, делает шаг и заявляет траву
+# или жертву рядом, меняя только свои столбцы. Затем заявки разрешаются (_claim_winners),
+# и последствия (herbivore_outcomes, predator_outcomes) применяются последовательно.
+# step_herbivores/step_predators собирают фазы для одного мира; tiles.py вызывает их
+# по отдельности, чтобы разрешать заявки через границы плиток.
+
+@njit(parallel=True, nogil=True, cache=True)
+def herbivore_intents(x, y, direction, alive, count, grass_x, grass_y, grass_alive, grass_grid, seed,
+                      vision, speed, speed_to_grass, size, width, height):
+    # Возвращает для каждого травоядного заявленную траву (-1 — нет) и расстояние до неё.
+    # Один запрос к индексу травы на травоядное: кандидаты для контакта собираются при поиске цели.
+    reach = size + max(speed, speed_to_grass) + CONTACT_EPSILON
+    gather = reach <= vision  # Иначе кандидаты контакта не помещаются в обход поиска цели
+    candidates = np.empty((count, CONTACT_CANDIDATES), dtype=np.int64)
+    n_candidates = np.full(count, CONTACT_CANDIDATES + 1, dtype=np.int64)
+    for i in prange(count):
+        if not alive[i]:
+            continue
+        old_x, old_y = x[i], y[i]
+        if gather:
+            target, _, n_candidates[i] = _nearest_gather(grass_grid, grass_x, grass_y, grass_alive, x[i], y[i],
+                                                         vision, reach, candidates[i])
+        else:
+            target, _ = _nearest(grass_grid, grass_x, grass_y, grass_alive, x[i], y[i], vision)
+        _step_toward(x, y, direction, i, target >= 0, grass_x[target] if target >= 0 else 0.0,
+                     grass_y[target] if target >= 0 else 0.0, seed, speed, speed_to_grass, size, width, height)
+        if distance(old_x, old_y, x[i], y[i]) + size > reach:
+            n_candidates[i] = CONTACT_CANDIDATES + 1  # Сдвинут границей поля дальше шага
+
+    claims = np.full(count, -1, dtype=np.int64)
+    dists = np.full(count, np.inf)
+    for i in prange(count):
+        if not alive[i]:
+            continue
+        if n_candidates[i] > CONTACT_CANDIDATES:
+            claims[i], dists[i] = _nearest(grass_grid, grass_x, grass_y, grass_alive, x[i], y[i], size)
+            continue
+        for k in range(n_candidates[i]):
+            j = candidates[i, k]
+            if grass_alive[j]:
+                dist = distance(x[i], y[i], grass_x[j], grass_y[j])
+                if dist <= size and dist < dists[i]:
+                    claims[i] = j
+                    dists[i] = dist
+    return claims, dists
+
+@njit(cache=True)
+def herbivore_outcomes(grass_eaten, fed, count, grass_to_reproduce):
+    # Учёт съеденной травы; возвращает индексы травоядных, готовых к размножению
+    parents = np.empty(count, dtype=np.int64)
+    n_parents = 0
+    for i in range(count):
+        if fed[i]:
+            grass_eaten[i] += 1
+            if grass_eaten[i] >= grass_to_reproduce:
+                grass_eaten[i] = 0
+                parents[n_parents] = i
+                n_parents += 1
+    return parents[:n_parents]
+
+@njit(parallel=True, nogil=True, cache=True)
+def step_herbivores(x, y, direction, grass_eaten, alive, count, grid,
+                    grass_x, grass_y, grass_alive, grass_grid, rng_state,
+                    vision, speed, speed_to_grass, size, width, height,
+                    grass_to_reproduce, reproduction_count):
+    # Полный раунд всех травоядных: поиск травы, движение, поедание, размножение.
+    # Траву, заявленную несколькими травоядными, съедает ближайшее.
+    seed = _next_seed(rng_state)
+    claims, dists = herbivore_intents(x, y, direction, alive, count, grass_x, grass_y, grass_alive, grass_grid,
+                                      seed, vision, speed, speed_to_grass, size, width, height)
+    for i in range(count):
+        if alive[i]:
+            relink(grid, i, x[i], y[i])
+
+    winner = _claim_winners(np.arange(count), claims, dists, len(grass_x), seed)
+    fed = np.zeros(count, dtype=np.bool_)
+    eaten = 0
+    for i in range(count):
+        j = claims[i]
+        if j >= 0 and winner[j] == i:
+            grass_alive[j] = False
+            fed[i] = True
+            eaten += 1
+    parents = herbivore_outcomes(grass_eaten, fed, count, grass_to_reproduce)
+
+    feces_x = x[parents].copy()
+    feces_y = y[parents].copy()
+    child_x, child_y, child_direction = _offspring(x, y, parents, len(parents), reproduction_count, seed, count)
+    # Съеденная трава и исчезнувшие точки травы (у травы-сущностей одно и то же)
+    return feces_x, feces_y, child_x, child_y, child_direction, eaten, eaten
+
+@njit(parallel=True, nogil=True, cache=True)
+def herbivore_intents_raster(x, y, direction, alive, count, cells, seed,
+                             vision, speed, speed_to_grass, size, width, height):
+    # То же для травы-растра: цель — ближайшая занятая клетка, заявка — номер клетки.
+    # Кандидаты контакта собираются при поиске цели так же, как для травы-сущностей.
+    w = cells.shape[1]
+    units = cells.reshape(-1)
+    reach = size + max(speed, speed_to_grass) + CONTACT_EPSILON
+    gather = reach <= vision
+    candidates = np.empty((count, CONTACT_CANDIDATES), dtype=np.int64)
+    n_candidates = np.full(count, CONTACT_CANDIDATES + 1, dtype=np.int64)
+    for i in prange(count):
+        if not alive[i]:
+            continue
+        old_x, old_y = x[i], y[i]
+        if gather:
+            target, _, n_candidates[i] = nearest_cell_gather(cells, x[i], y[i], vision, reach, candidates[i])
+        else:
+            target, _ = nearest_cell(cells, x[i], y[i], vision)
+        _step_toward(x, y, direction, i, target >= 0, float(target % w), float(target // w),
+                     seed, speed, speed_to_grass, size, width, height)
+        if distance(old_x, old_y, x[i], y[i]) + size > reach:
+            n_candidates[i] = CONTACT_CANDIDATES + 1  # Сдвинут границей поля дальше шага
+
+    claims = np.full(count, -1, dtype=np.int64)
+    dists = np.full(count, np.inf)
+    for i in prange(count):
+        if not alive[i]:
+            continue
+        if n_candidates[i] > CONTACT_CANDIDATES:
+            claims[i], dists[i] = nearest_cell(cells, x[i], y[i], size)
+            continue
+        for k in range(n_candidates[i]):
+            c = candidates[i, k]
+            if units[c]:
+                dist = distance(x[i], y[i], float(c % w), float(c // w))
+                if dist <= size and dist < dists[i]:
+                    claims[i] = c
+                    dists[i] = dist
+    return claims, dists
+
+@njit(parallel=True, nogil=True, cache=True)
+def step_herbivores_raster(x, y, direction, grass_eaten, alive, count, grid, cells, rng_state,
+                           vision, speed, speed_to_grass, size, width, height,
+                           grass_to_reproduce, reproduction_count):
+    # Раунд травоядных на траве-растре: в клетке может быть несколько травинок,
+    # их съедают ближайшие претенденты, по одной на каждого
+    seed = _next_seed(rng_state)
+    claims, dists = herbivore_intents_raster(x, y, direction, alive, count, cells, seed,
+                                             vision, speed, speed_to_grass, size, width, height)
+    for i in range(count):
+        if alive[i]:
+            relink(grid, i, x[i], y[i])
+
+    units = cells.reshape(-1)
+    fed = _claim_units(np.arange(count), claims, dists, units, seed)
+    eaten = 0
+    cleared = 0
+    for i in range(count):
+        if fed[i]:
+            units[claims[i]] -= 1
+            eaten += 1
+            if units[claims[i]] == 0:
+                cleared += 1
+    parents = herbivore_outcomes(grass_eaten, fed, count, grass_to_reproduce)
+
+    feces_x = x[parents].copy()
+    feces_y = y[parents].copy()
+    child_x, child_y, child_direction = _offspring(x, y, parents, len(parents), reproduction_count, seed, count)
+    # Съеденные травинки и опустевшие клетки — точек травы в снимке стало меньше на cleared
+    return feces_x, feces_y, child_x, child_y, child_direction, eaten, cleared
+
+@njit(parallel=True, nogil=True, cache=True)
+def predator_intents(x, y, direction, hunger, eating_timer, alive, count,
+                     prey_x, prey_y, prey_alive, prey_grid, seed,
+                     vision, speed, speed_to_prey, size, width, height, hunger_max, hunger_decrease):
+    # Переваривающие хищники стоят на месте, остальные охотятся.
+    # Возвращает охотников, их заявки на жертв (-1 — нет контакта) и расстояния до них.
+    hunting = np.empty(count, dtype=np.int64)
+    n_hunting = 0
+    for i in range(count):
+        if not alive[i]:
+            continue
+        if eating_timer[i] > 0:
+            eating_timer[i] -= 1
+            hunger[i] = hunger_max
+        else:
+            hunting[n_hunting] = i
+            n_hunting += 1
+    hunting = hunting[:n_hunting]
+
+    targets, _ = nearest_batch(prey_grid, prey_x, prey_y, prey_alive, x[hunting], y[hunting], vision)
+    for k in prange(n_hunting):
+        i = hunting[k]
+        target = targets[k]
+        _step_toward(x, y, direction, i, target >= 0, prey_x[target] if target >= 0 else 0.0,
+                     prey_y[target] if target >= 0 else 0.0, seed, speed, speed_to_prey, size, width, height)
+        hunger[i] -= hunger_decrease
+
+    contact = within_range(prey_x, prey_y, prey_alive, x[hunting], y[hunting], targets, size)
+    claims = np.where(contact, targets, -1)
+    dists = np.empty(n_hunting)
+    for k in prange(n_hunting):
+        j = claims[k]
+        dists[k] = distance(x[hunting[k]], y[hunting[k]], prey_x[j], prey_y[j]) if j >= 0 else np.inf
+    return hunting, claims, dists
+
+@njit(cache=True)
+def predator_outcomes(hunger, eating_timer, feces_timer, alive, count, fed,
+                      eating_time, feces_interval, hunger_max):
+    # Экскременты, начало переваривания, размножение и смерть от голода.
+    # Возвращает индексы хищников, оставивших экскременты, и готовых к размножению,
+    # число умерших от голода и сумму голода выживших.
+    parents = np.empty(count, dtype=np.int64)
+    droppers = np.empty(count, dtype=np.int64)
+    n_parents = 0
+    n_droppers = 0
+    starved = 0
+    hunger_sum = 0
+    for i in range(count):
+        if not alive[i]:
+            continue
+        feces_timer[i] += 1
+        if feces_timer[i] >= feces_interval:
+            feces_timer[i] = 0
+            droppers[n_droppers] = i
+            n_droppers += 1
+
+        if fed[i]:
+            eating_timer[i] = eating_time
+            hunger[i] = hunger_max
+        elif eating_timer[i] == 1:
+            eating_timer[i] = 0
+            parents[n_parents] = i
+            n_parents += 1
+
+        if hunger[i] <= 0:
+            alive[i] = False
+            starved += 1
+        else:
+            hunger_sum += hunger[i]
+    return droppers[:n_droppers], parents[:n_parents], starved, hunger_sum
+
+@njit(parallel=True, nogil=True, cache=True)
+def step_predators(x, y, direction, hunger, eating_timer, feces_timer, alive, count,
+                   prey_x, prey_y, prey_alive, prey_grid, rng_state,
+                   vision, speed, speed_to_prey, size, width, height,
+                   eating_time, feces_interval, hunger_max, hunger_decrease, reproduction_count):
+    # Полный раунд всех хищников: охота, движение, поедание, экскременты, размножение и голод.
+    # Из дотянувшихся до одной жертвы её убивает ближайший.
+    seed = _next_seed(rng_state)
+    hunting, claims, dists = predator_intents(x, y, direction, hunger, eating_timer, alive, count,
+                                              prey_x, prey_y, prey_alive, prey_grid, seed,
+                                              vision, speed, speed_to_prey, size, width, height,
+                                              hunger_max, hunger_decrease)
+    winner = _claim_winners(hunting, claims, dists, len(prey_x), seed)
+    fed = np.zeros(count, dtype=np.bool_)
+    kills = 0
+    for k in range(len(hunting)):
+        j = claims[k]
+        if j >= 0 and winner[j] == k:
+            prey_alive[j] = False
+            fed[hunting[k]] = True
+            kills += 1
+    droppers, parents, starved, hunger_sum = predator_outcomes(hunger, eating_timer, feces_timer, alive, count, fed,
+                                                               eating_time, feces_interval, hunger_max)
+
+    feces_x = x[droppers].copy()
+    feces_y = y[droppers].copy()
+    child_x, child_y, child_direction = _offspring(x, y, parents, len(parents), reproduction_count, seed, count)
+    return feces_x, feces_y, child_x, child_y, child_direction, kills, starved, hunger_sum
@@ -1,24 +1,34 @@
-import pygame
 import time
-import cv2
 import os
 import glob
 import shutil
-from simulation import Simulation
-from renderer import Renderer
+import argparse
+import logging
+import numpy as np
 from constants import *
+from metrics import Metrics, OFF, PHASES, DETAILED
+from history import HISTORY_STATES, HISTORY_BUDGET
+
+# Тяжёлые модули (numba, pygame, cv2) импортируются там, где нужны: прогону без рендеринга
+# не приходится ждать загрузки графики и видео, а --help отвечает сразу.
+
+logger = logging.getLogger(__name__)
+LOG_LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR,
+              'off': logging.CRITICAL + 1}
+METRICS_LEVELS = {'off': OFF, 'phases': PHASES, 'detailed': DETAILED}
 
 def create_video(snapshot_dir, output_path, fps=30):
-    print("Создание видео...")
+    import cv2
+    logger.info("Создание видео...")
     images = sorted(glob.glob(os.path.join(snapshot_dir, "snapshot_*.png")), key=lambda x: int(x.split('_')[-1].split('.')[0]))
     if not images:
-        print("Ошибка: снимки не найдены в папке snapshots!")
+        logger.error("Ошибка: снимки не найдены в папке snapshots!")
         return
 
     try:
         frame = cv2.imread(images[0])
         if frame is None:
-            print(f"Ошибка: не удалось загрузить изображение {images[0]}")
+            logger.error(f"Ошибка: не удалось загрузить изображение {images[0]}")
             return
         height, width, _ = frame.shape
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
@@ -27,82 +37,278 @@ def create_video(snapshot_dir, output_path, fps=30):
         for image in images:
             frame = cv2.imread(image)
             if frame is None:
-                print(f"Ошибка: не удалось загрузить изображение {image}")
+                logger.error(f"Ошибка: не удалось загрузить изображение {image}")
                 continue
             video.write(frame)
 
         video.release()
-        print(f"Видео сохранено как {output_path}")
+        logger.info(f"Видео сохранено как {output_path}")
+    except Exception as e:
+        logger.error(f"Ошибка при создании видео: {e}")
+
+def output_frame(output, simulation, state, frames_skipped, save_snapshots):
+    output.submit(state, simulation.speed, simulation.current_round, simulation.simulation_round, frames_skipped)
+    if save_snapshots:
+        logger.debug("Снимок сохранён для раунда %d", simulation.current_round)
+
+def close_output(output):
+    # Закрытие вывода после ошибки: упавший конвейер сообщает об ошибке ещё раз, её только записываем
+    if output is None:
+        return
+    try:
+        output.close()
+    except Exception as e:
+        logger.error(f"Ошибка при закрытии вывода: {e}")
+
+def replay(trajectory_path, start=None, end=None, output_path="replay_output.mp4", renderer_backend='numpy', render_workers=0):
+    # Повторный рендеринг диапазона раундов из журнала траектории, без запуска симуляции
+    from pipeline import InlineOutput, RenderPipeline
+    from trajectory import TrajectoryReader
+    output = None
+    try:
+        reader = TrajectoryReader(trajectory_path)
+        start = reader.first_round if start is None else start
+        end = reader.last_round if end is None else min(end, reader.last_round)
+        logger.info(f"Рендеринг раундов {start}..{end} из {trajectory_path}")
+        if render_workers:
+            output = RenderPipeline(output_path, fps=30, workers=render_workers, renderer_backend=renderer_backend)
+        else:
+            output = InlineOutput(output_path, fps=30, renderer_backend=renderer_backend)
+        for state in reader.snapshots(start, end):
+            output.submit(state, 1, state.round, end, 0)
+        output.close()
+        output = None
+    except Exception as e:
+        logger.error(f"Ошибка при повторном рендеринге: {e}")
+    finally:
+        close_output(output)
+
+def run_tiled(size, tile_size=1000, workers=0, seed=None, rounds=MAX_ROUNDS):
+    # Большое поле из плиток без рендеринга: только численность по раундам
+    from tiles import TiledWorld
+    world = None
+    try:
+        world = TiledWorld(size, size, tile_size=tile_size, seed=seed, workers=workers)
+        world.populate()
+        start_time = time.time()
+        for _ in range(rounds):
+            round_start_time = time.time()
+            world.step()
+            counts = world.counts()
+            logger.debug("Раунд %d: %s, плиток %d, %.3f секунд", world.round, counts, len(world.tiles),
+                         time.time() - round_start_time)
+            if counts['herbivores'] == 0 or counts['predators'] == 0:
+                logger.info("Симуляция остановлена: все травоядные или хищники вымерли")
+                break
+        logger.info(f"Программа завершена. Общее время: {time.time() - start_time:.2f} секунд")
+    except Exception as e:
+        logger.error(f"Ошибка в плиточной симуляции: {e}")
+    finally:
+        if world is not None:
+            world.close()
+
+def run_ensemble(n_worlds, seed=None, rounds=MAX_ROUNDS):
+    # Независимые миры одним пакетом без рендеринга: итог — раунд вымирания каждого мира
+    from ensemble import Ensemble
+    try:
+        ensemble = Ensemble(n_worlds, seed=seed)
+        start_time = time.time()
+        while ensemble.round < rounds and len(ensemble):
+            ensemble.step()
+            if ensemble.round % 100 == 0:
+                logger.debug("Раунд %d: живых миров %d из %d", ensemble.round, len(ensemble), n_worlds)
+        extinct = ensemble.extinct_round[ensemble.extinct_round >= 0]
+        logger.info(f"Вымерло миров: {len(extinct)} из {n_worlds}" +
+                    (f", медианный раунд вымирания {int(np.median(extinct))}" if len(extinct) else ""))
+        logger.info(f"Программа завершена. Общее время: {time.time() - start_time:.2f} секунд")
     except Exception as e:
-        print(f"Ошибка при создании видео: {e}")
+        logger.error(f"Ошибка в ансамбле: {e}")
 
-def main():
+def run_live(seed=None, grass_model='points', fps=60, renderer_backend='numpy', history_budget=HISTORY_BUDGET):
+    # Окно с живой симуляцией: симуляция в отдельном процессе, окно показывает последний готовый раунд
+    from viewer import LiveViewer
+    try:
+        LiveViewer(seed=seed, grass_model=grass_model, fps=fps, renderer_backend=renderer_backend,
+                   history_budget=history_budget).run()
+    except Exception as e:
+        logger.error(f"Ошибка живого просмотра: {e}")
+
+def main(save_snapshots=False, stream_video=True, renderer_backend='numpy', render_workers=0, trajectory_path=None,
+         seed=None, checkpoint_path=None, checkpoint_every=0, resume_path=None, grass_model='points', metrics=None,
+         stats_path=None, history_states=HISTORY_STATES, history_budget=HISTORY_BUDGET):
+    from simulation import Simulation
+    from pipeline import InlineOutput, RenderPipeline
+    metrics = metrics or Metrics()
+    output = None
+    simulation = None
     try:
         snapshot_dir = "snapshots"
         output_path = "simulation_output.mp4"
-        if os.path.exists(snapshot_dir):
-            shutil.rmtree(snapshot_dir)
-            print(f"Папка {snapshot_dir} очищена")
-        os.makedirs(snapshot_dir)
+        if save_snapshots:
+            if os.path.exists(snapshot_dir):
+                shutil.rmtree(snapshot_dir)
+                logger.info(f"Папка {snapshot_dir} очищена")
+            os.makedirs(snapshot_dir)
         if os.path.exists(output_path):
             os.remove(output_path)
-            print(f"Видео {output_path} удалено")
+            logger.info(f"Видео {output_path} удалено")
 
-        # Инициализация симуляции
-        simulation = Simulation()
-        renderer = Renderer(disable_rendering=False)  # Отключаем рендеринг
-        simulation.initialize()
-        print("Симуляция инициализирована")
+        # Инициализация симуляции или продолжение с контрольной точки
+        if resume_path:
+            simulation = Simulation.load_checkpoint(resume_path, trajectory_path=trajectory_path, stats_path=stats_path,
+                                                    history_states=history_states, history_budget=history_budget)
+            simulation.metrics = metrics
+        else:
+            simulation = Simulation(trajectory_path=trajectory_path, seed=seed, grass_model=grass_model, metrics=metrics,
+                                    stats_path=stats_path, history_states=history_states,
+                                    history_budget=history_budget)
+        if render_workers and stream_video:
+            # Растеризация и кодирование в отдельных процессах, симуляция их не ждёт
+            output = RenderPipeline(output_path, fps=30, workers=render_workers, renderer_backend=renderer_backend,
+                                    snapshot_dir=snapshot_dir if save_snapshots else None, config=simulation.config,
+                                    metrics=metrics)
+        else:
+            output = InlineOutput(output_path, fps=30, renderer_backend=renderer_backend,
+                                  snapshot_dir=snapshot_dir if save_snapshots else None, stream_video=stream_video,
+                                  config=simulation.config, metrics=metrics)
+        if not resume_path:
+            simulation.initialize()
+        logger.info("Симуляция инициализирована")
 
         snapshot_interval = max(1, int(60 / ROUNDS_PER_SECOND))  # Синхронизировано с save_interval
         frames_skipped = 0
         start_time = time.time()
 
-        # Первый раунд
+        # Первый раунд. Раунд в метриках закрывается после вывода кадра, чтобы рисование
+        # и кодирование попали в тот же раунд, что и его шаг симуляции.
+        # Слишком долгий раунд завершает прогон; симуляция останавливается в конце, после
+        # последней контрольной точки, чтобы та сохранилась с работающей симуляцией
+        first_round = simulation.simulation_round
         round_start_time = time.time()
-        simulation.update()
-        if time.time() - round_start_time > 60:
-            print(f"Начальный раунд превысил 60 секунд, остановка симуляции...")
-            simulation.stop()
+        simulation.update(end_round=False)
+        too_slow = time.time() - round_start_time > 60
+        if too_slow:
+            logger.warning(f"Начальный раунд превысил 60 секунд, остановка симуляции...")
         else:
-            state = simulation.get_current_state(0)
-            if state and not renderer.disable_rendering:
-                snapshot_path = os.path.join(renderer.snapshot_dir, f"snapshot_{simulation.current_round:06d}.png")
-                renderer.save_snapshot(state, simulation.speed, simulation.current_round, simulation.simulation_round, frames_skipped, snapshot_path)
-                print(f"Снимок сохранён для раунда {simulation.current_round}")
+            state = simulation.get_current_state(first_round)
+            if state:
+                output_frame(output, simulation, state, frames_skipped, save_snapshots)
+        simulation.end_round_metrics()
 
         # Основной цикл
-        while simulation.simulation_round < MAX_ROUNDS and simulation.running:
+        while simulation.simulation_round < MAX_ROUNDS and simulation.running and not too_slow:
             round_start_time = time.time()
-            simulation.update()
+            simulation.update(end_round=False)
             round_time = time.time() - round_start_time
-            print(f"Раунд {simulation.simulation_round} выполнен за {round_time:.3f} секунд")
+            logger.debug("Раунд %d выполнен за %.3f секунд", simulation.simulation_round, round_time)
             if round_time > 60:
-                print(f"Раунд {simulation.simulation_round} превысил 60 секунд, остановка симуляции...")
-                simulation.stop()
+                logger.warning(f"Раунд {simulation.simulation_round} превысил 60 секунд, остановка симуляции...")
                 break
 
+            if checkpoint_path and checkpoint_every and simulation.simulation_round % checkpoint_every == 0:
+                with metrics.phase('checkpoint'):
+                    simulation.save_checkpoint(checkpoint_path)
+                logger.info(f"Контрольная точка раунда {simulation.simulation_round} сохранена в {checkpoint_path}")
+
             if simulation.simulation_round % snapshot_interval == 0:
                 simulation.current_round = simulation.simulation_round
                 state = simulation.get_current_state(simulation.current_round)
-                if state and not renderer.disable_rendering:
-                    snapshot_path = os.path.join(renderer.snapshot_dir, f"snapshot_{simulation.current_round:06d}.png")
-                    renderer.save_snapshot(state, simulation.speed, simulation.current_round, simulation.simulation_round, frames_skipped, snapshot_path)
-                    print(f"Снимок сохранён для раунда {simulation.current_round}")
+                if state:
+                    output_frame(output, simulation, state, frames_skipped, save_snapshots)
+            simulation.end_round_metrics()
             frames_skipped += 1
 
-        # Создание видео, если рендеринг включён
-        if not renderer.disable_rendering:
-            create_video(renderer.snapshot_dir, output_path, fps=30)
+        # Видео уже записано потоком; из PNG собираем его только без потоковой записи
+        output.close()
+        output = None
+        if not stream_video:
+            create_video(snapshot_dir, output_path, fps=30)
 
-        simulation.stop()
-        if not renderer.disable_rendering:
-            pygame.quit()
-        print(f"Программа завершена. Общее время: {time.time() - start_time:.2f} секунд")
+        if checkpoint_path:
+            simulation.save_checkpoint(checkpoint_path)
+        log_metrics(metrics)
+        logger.info(f"Программа завершена. Общее время: {time.time() - start_time:.2f} секунд")
     except Exception as e:
-        print(f"Ошибка: {e}")
-        if not renderer.disable_rendering:
-            pygame.quit()
+        logger.error(f"Ошибка: {e}")
+    finally:
+        # И после ошибки вывода журнал траектории и ряд статистики дописываются и закрываются
+        close_output(output)
+        if simulation is not None:
+            simulation.stop()
+        metrics.close()
+
+def log_metrics(metrics):
+    # Итог по фазам за прогон, самые долгие первыми
+    for name, timing in metrics.totals().items():
+        logger.info(f"Фаза {name}: {timing['total']:.3f} секунд, {timing['per_round'] * 1000:.3f} мс за раунд")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Симуляция травоядных и хищников")
+    parser.add_argument("--snapshots", action="store_true", help="сохранять PNG-снимки каждого кадра в snapshots/")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="не писать видео потоком, а собрать его из PNG-снимков в конце (включает --snapshots)")
+    parser.add_argument("--renderer", choices=("numpy", "pygame"), default="numpy",
+                        help="растеризатор кадров: векторный на NumPy или pygame.draw по сущностям")
+    parser.add_argument("--render-workers", type=int, default=0,
+                        help="число процессов растеризации; 0 — рисовать и кодировать в основном процессе")
+    parser.add_argument("--trajectory", help="записывать траекторию каждого раунда в указанный каталог")
+    parser.add_argument("--threads", type=int,
+                        help="число потоков для параллельных фаз раунда (по умолчанию все ядра)")
+    parser.add_argument("--grass", choices=("points", "raster"), default="points",
+                        help="модель травы: отдельные сущности или растр плотности по пикселям поля")
+    parser.add_argument("--seed", type=int, help="зерно генератора случайных чисел для воспроизводимого прогона")
+    parser.add_argument("--checkpoint", metavar="PATH", help="сохранять контрольную точку в указанный файл (.npz)")
+    parser.add_argument("--checkpoint-every", type=int, default=100,
+                        help="сохранять контрольную точку каждые N раундов (и в конце прогона)")
+    parser.add_argument("--resume", metavar="PATH", help="продолжить симуляцию с контрольной точки")
+    parser.add_argument("--tiled", type=int, metavar="SIZE",
+                        help="без рендеринга моделировать квадратное поле SIZE x SIZE, разбитое на плитки")
+    parser.add_argument("--tile-size", type=int, default=1000, help="сторона плитки для --tiled")
+    parser.add_argument("--tile-workers", type=int, default=0,
+                        help="число процессов для плиток; 0 — считать плитки в основном процессе")
+    parser.add_argument("--ensemble", type=int, metavar="N",
+                        help="без рендеринга прогнать N независимых миров одним пакетом")
+    parser.add_argument("--log-level", choices=tuple(LOG_LEVELS), default="info",
+                        help="уровень сообщений в консоли; debug — строка на каждый раунд, off — без сообщений")
+    parser.add_argument("--metrics", metavar="PATH", help="дописывать метрики раундов строками JSON в указанный файл")
+    parser.add_argument("--metrics-level", choices=tuple(METRICS_LEVELS), default="off",
+                        help="что собирать: время фаз и численности (phases), ещё и счётчики (detailed); "
+                             "итог по фазам выводится в конце прогона (по умолчанию phases, если задан --metrics)")
+    parser.add_argument("--metrics-every", type=int, default=1, help="писать в файл метрик каждый N-й раунд")
+    parser.add_argument("--stats", metavar="PATH",
+                        help="дописывать численности видов и события каждого раунда в столбцовый файл")
+    parser.add_argument("--history-states", type=int, default=HISTORY_STATES,
+                        help="сколько последних раундов держать в памяти для вывода кадров")
+    parser.add_argument("--history-mb", type=int, default=HISTORY_BUDGET // (1024 * 1024),
+                        help="память под историю раундов в МБ: 8 байт на сущность каждого хранимого раунда")
+    parser.add_argument("--live", action="store_true",
+                        help="показывать симуляцию в окне: симуляция идёт в своём темпе, окно пропускает раунды, "
+                             "стрелки вверх/вниз меняют скорость, U снимает ограничение, пробел — пауза")
+    parser.add_argument("--live-fps", type=int, default=60, help="частота обновления окна для --live")
+    parser.add_argument("--replay", metavar="PATH", help="не запускать симуляцию, а отрисовать видео из журнала траектории")
+    parser.add_argument("--start", type=int, help="первый раунд для --replay")
+    parser.add_argument("--end", type=int, help="последний раунд для --replay")
+    args = parser.parse_args()
+    logging.basicConfig(level=LOG_LEVELS[args.log_level], format='%(message)s')
+    metrics_level = METRICS_LEVELS[args.metrics_level]
+    if args.metrics and metrics_level == OFF:
+        metrics_level = PHASES
+    if args.threads:
+        import numba
+        numba.set_num_threads(args.threads)
+    if args.live:
+        run_live(seed=args.seed, grass_model=args.grass, fps=args.live_fps, renderer_backend=args.renderer,
+                 history_budget=args.history_mb * 1024 * 1024)
+    elif args.ensemble:
+        run_ensemble(args.ensemble, seed=args.seed)
+    elif args.tiled:
+        run_tiled(args.tiled, tile_size=args.tile_size, workers=args.tile_workers, seed=args.seed)
+    elif args.replay:
+        replay(args.replay, args.start, args.end, renderer_backend=args.renderer, render_workers=args.render_workers)
+    else:
+        main(save_snapshots=args.snapshots or args.no_stream, stream_video=not args.no_stream, renderer_backend=args.renderer,
+             render_workers=args.render_workers, trajectory_path=args.trajectory, seed=args.seed,
+             checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every, resume_path=args.resume,
+             grass_model=args.grass, metrics=Metrics(metrics_level, args.metrics, args.metrics_every),
+             stats_path=args.stats, history_states=args.history_states,
+             history_budget=args.history_mb * 1024 * 1024)
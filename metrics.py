@@ -0,0 +1,91 @@
+import json
+import time
+
+# Метрики прогона: время фаз раунда, численности и счётчики событий.
+# Уровень выборки задаёт, что собирается:
+#   OFF      — ничего, phase() возвращает пустой контекст без обращения к часам;
+#   PHASES   — время фаз и численности видов;
+#   DETAILED — ещё счётчики (запросы к индексам соседей, перевыделения хранилищ и т. п.).
+# Раунды пишутся в поток JSON-строк раз в every раундов; итог по всем раундам — totals().
+
+OFF, PHASES, DETAILED = 0, 1, 2
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _Phase:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        timers = self.metrics.timers
+        timers[self.name] = timers.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+_NULL_PHASE = _NullPhase()
+
+class Metrics:
+    def __init__(self, level=OFF, path=None, every=1):
+        self.level = level
+        self.every = max(1, every)
+        self.timers = {}  # Время фаз текущего раунда, секунды
+        self.counters = {}  # Счётчики текущего раунда
+        self.total_timers = {}
+        self.rounds = 0
+        self._phases = {}
+        self.stream = open(path, 'a') if path and level else None
+
+    def phase(self, name):
+        # with metrics.phase('herbivore_step'): ... — время фазы прибавляется к текущему раунду
+        if not self.level:
+            return _NULL_PHASE
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase(self, name)
+        return phase
+
+    def count(self, name, value=1):
+        if self.level >= DETAILED:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def sampled(self, round_num):
+        # Пишется ли этот раунд в поток: по нему решают, стоит ли собирать численности
+        return self.level and round_num % self.every == 0
+
+    def end_round(self, round_num, counts=None):
+        # Закрывает раунд: копит итоги, пишет выбранный раунд в поток, обнуляет текущие значения
+        if not self.level:
+            return
+        self.rounds += 1
+        for name, value in self.timers.items():
+            self.total_timers[name] = self.total_timers.get(name, 0.0) + value
+        if self.stream is not None and self.sampled(round_num):
+            record = {'round': round_num, 'time': self.timers}
+            if counts is not None:
+                record['counts'] = counts
+            if self.counters:
+                record['counters'] = self.counters
+            self.stream.write(json.dumps(record) + '\n')
+        self.timers = {}
+        self.counters = {}
+
+    def totals(self):
+        # Суммарное и среднее на раунд время фаз за весь прогон
+        return {name: {'total': value, 'per_round': value / max(1, self.rounds)}
+                for name, value in sorted(self.total_timers.items(), key=lambda item: -item[1])}
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
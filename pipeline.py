@@ -0,0 +1,178 @@
+import os
+import queue
+import logging
+import multiprocessing
+import pygame
+from renderer import Renderer, ArrayRenderer
+from video import VideoStream
+from metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# Вывод кадров: снимки состояния превращаются в кадры видео и (по желанию) PNG-снимки.
+# InlineOutput рисует и кодирует в том же процессе, RenderPipeline — в отдельных процессах.
+
+RENDERERS = {'numpy': ArrayRenderer, 'pygame': Renderer}
+POLL_INTERVAL = 0.5  # Как часто ожидающий очереди проверяет, живы ли процессы вывода (секунды)
+CLOSE_TIMEOUT = 30  # Сколько ждать кодировщик после падения растеризатора (секунды)
+
+def _snapshot_path(snapshot_dir, current_round):
+    return os.path.join(snapshot_dir, f"snapshot_{current_round:06d}.png")
+
+class InlineOutput:
+    def __init__(self, output_path, fps=30, renderer_backend='numpy', snapshot_dir=None, stream_video=True, config=None,
+                 metrics=None):
+        self.renderer = RENDERERS[renderer_backend](disable_rendering=False, snapshot_dir=snapshot_dir, config=config)
+        self.video = VideoStream(output_path, fps=fps) if stream_video else None
+        self.metrics = metrics or Metrics()
+
+    def submit(self, state, speed, current_round, simulation_round, frames_skipped):
+        renderer = self.renderer
+        with self.metrics.phase('render'):
+            if renderer.snapshot_dir:
+                renderer.save_snapshot(state, speed, current_round, simulation_round, frames_skipped,
+                                       _snapshot_path(renderer.snapshot_dir, current_round))
+            else:
+                renderer.render(state, speed, current_round, simulation_round, frames_skipped)
+        if self.video is not None:
+            with self.metrics.phase('encode'):
+                self.video.write(renderer.frame())
+
+    def close(self):
+        if self.video is not None:
+            self.video.close()
+        pygame.quit()
+
+def _render_worker(tasks, frames, renderer_backend, snapshot_dir, config):
+    renderer = RENDERERS[renderer_backend](disable_rendering=False, snapshot_dir=snapshot_dir, config=config)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, state, speed, current_round, simulation_round, frames_skipped = task
+        if snapshot_dir:
+            renderer.save_snapshot(state, speed, current_round, simulation_round, frames_skipped,
+                                   _snapshot_path(snapshot_dir, current_round))
+        else:
+            renderer.render(state, speed, current_round, simulation_round, frames_skipped)
+        frame = renderer.frame()
+        frames.put((seq, frame.copy()))
+        del frame
+    frames.put(None)
+    pygame.quit()
+
+def _encode_worker(frames, output_path, fps, workers, slots):
+    # Кадры приходят в произвольном порядке; пишем их строго по номеру.
+    # Каждый записанный кадр освобождает место для следующего снимка (slots)
+    video = VideoStream(output_path, fps=fps)
+    pending = {}
+    next_seq = 0
+    finished = 0
+    while finished < workers:
+        item = frames.get()
+        if item is None:
+            finished += 1
+            continue
+        seq, frame = item
+        pending[seq] = frame
+        while next_seq in pending:
+            video.write(pending.pop(next_seq))
+            next_seq += 1
+            slots.release()
+    for seq in sorted(pending):
+        logger.error(f"Ошибка: кадр {next_seq} потерян, записываем кадр {seq}")
+        video.write(pending.pop(seq))
+        slots.release()
+    video.close()
+
+class RenderPipeline:
+    # Симуляция кладёт снимки в ограниченную очередь (submit блокируется, если рисование
+    # не успевает), процессы-растеризаторы рисуют кадры параллельно, а процесс-кодировщик
+    # собирает их по порядку и пишет в видео. Снимок состояния — словарь массивов NumPy.
+    # Снимков в работе (отправлены, но ещё не записаны) не больше max_pending, поэтому и кадры,
+    # ждущие у кодировщика своей очереди, занимают ограниченную память. Если процесс вывода
+    # падает, submit и close сообщают об ошибке вместо бесконечного ожидания.
+    def __init__(self, output_path, fps=30, workers=None, renderer_backend='numpy', snapshot_dir=None,
+                 queue_size=None, config=None, metrics=None, max_pending=None):
+        workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        if snapshot_dir and not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        context = multiprocessing.get_context('spawn')  # SDL плохо переносит fork
+        self.tasks = context.Queue(maxsize=queue_size or 2 * workers)
+        self.frames = context.Queue(maxsize=2 * workers)
+        self.slots = context.Semaphore(max_pending or 4 * workers)
+        self.workers = [context.Process(target=_render_worker,
+                                        args=(self.tasks, self.frames, renderer_backend, snapshot_dir, config),
+                                        daemon=True)
+                        for _ in range(workers)]
+        self.encoder = context.Process(target=_encode_worker, args=(self.frames, output_path, fps, workers, self.slots),
+                                       daemon=True)
+        for process in self.workers + [self.encoder]:
+            process.start()
+        self.seq = 0
+        self.metrics = metrics or Metrics()
+        self.closed = False
+
+    def _check(self):
+        for process in self.workers + [self.encoder]:
+            if not process.is_alive():
+                raise RuntimeError(f"процесс вывода кадров {process.name} завершился с кодом {process.exitcode}")
+
+    def submit(self, state, speed, current_round, simulation_round, frames_skipped):
+        # Рисование и кодирование идут в других процессах; здесь видно только ожидание места в очереди
+        with self.metrics.phase('render_queue'):
+            while not self.slots.acquire(timeout=POLL_INTERVAL):
+                self._check()
+            task = (self.seq, state, speed, current_round, simulation_round, frames_skipped)
+            while True:
+                try:
+                    self.tasks.put(task, timeout=POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    self._check()
+        self.seq += 1
+
+    def _failed(self):
+        return any(process.exitcode for process in self.workers) or self.encoder.exitcode is not None
+
+    def close(self):
+        # Живые растеризаторы дорисовывают очередь, кодировщик дописывает видео. Если какой-то
+        # процесс упал, очереди могли остаться заблокированными: оставшиеся растеризаторы
+        # останавливаются, за них кодировщику отправляется признак конца, и он получает
+        # CLOSE_TIMEOUT секунд на запись того, что успело прийти. Ошибка сообщается после остановки.
+        if self.closed:
+            return
+        self.closed = True
+        sent = 0
+        while sent < len(self.workers) and not self._failed():
+            try:
+                self.tasks.put(None, timeout=POLL_INTERVAL)
+                sent += 1
+            except queue.Full:
+                pass
+        for process in self.workers:
+            while process.is_alive() and not self._failed():
+                process.join(POLL_INTERVAL)
+        errors = [f"растеризатор {process.name} завершился с кодом {process.exitcode}"
+                  for process in self.workers if process.exitcode]
+        if self._failed():
+            for process in self.workers:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+                if process.exitcode and self.encoder.is_alive():
+                    try:
+                        self.frames.put(None, timeout=POLL_INTERVAL)
+                    except queue.Full:
+                        pass
+        self.encoder.join(None if not errors else CLOSE_TIMEOUT)
+        if self.encoder.is_alive():
+            self.encoder.terminate()
+            self.encoder.join()
+            errors.append("кодировщик не завершился и остановлен")
+        elif self.encoder.exitcode:
+            errors.append(f"кодировщик завершился с кодом {self.encoder.exitcode}")
+        if errors:
+            for error in errors:
+                logger.error(f"Ошибка вывода кадров: {error}")
+            raise RuntimeError(f"вывод кадров завершился с ошибкой: {'; '.join(errors)}")
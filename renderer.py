@@ -1,42 +1,54 @@
 import pygame
 import os
+import numpy as np
 from constants import *
+from config import Config
+from entities import GrassStore, HerbivoreStore, PredatorStore, FecesStore
+
+ENTITY_KINDS = (('grass', GrassStore), ('herbivores', HerbivoreStore),
+                ('predators', PredatorStore), ('feces', FecesStore))
 
 class Renderer:
-    def __init__(self, disable_rendering=False):
+    def __init__(self, disable_rendering=False, snapshot_dir="snapshots", config=None):
         self.disable_rendering = disable_rendering
+        config = config or Config()
+        self.width, self.height = config.field_width, config.field_height
         if not disable_rendering:
             pygame.init()
-            self.screen = pygame.Surface((FIELD_WIDTH + 200, FIELD_HEIGHT))  # Используем Surface вместо display
+            self.screen = pygame.Surface((self.width + 200, self.height))  # Используем Surface вместо display
             self.font = pygame.font.SysFont('arial', 20)
-            self.background = pygame.Surface((FIELD_WIDTH, FIELD_HEIGHT))
+            self.background = pygame.Surface((self.width, self.height))
             self.background.fill((255, 255, 255))
-        self.snapshot_dir = "snapshots"
-        if not os.path.exists(self.snapshot_dir):
-            os.makedirs(self.snapshot_dir)
+        self.snapshot_dir = snapshot_dir  # None — PNG-снимки не сохраняются
+        if snapshot_dir and not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
 
     def draw(self, state):
         if self.disable_rendering or not state:
             return
         self.screen.blit(self.background, (0, 0))
-        for entity_list in [state['grass'], state['herbivores'], state['predators'], state['feces']]:
-            for entity in entity_list:
-                if entity.alive:
-                    pygame.draw.rect(self.screen, entity.color, (entity.x, entity.y, entity.size, entity.size))
+        for key, kind in ENTITY_KINDS:
+            for x, y in state[key].tolist():
+                pygame.draw.rect(self.screen, kind.color, (x, y, kind.size, kind.size))
 
     def draw_statistics(self, state, speed, current_round, simulation_round, frames_skipped):
         if self.disable_rendering:
             return
-        stats_surface = pygame.Surface((200, FIELD_HEIGHT))
+        stats_surface = pygame.Surface((200, self.height))
         stats_surface.fill((200, 200, 200))
+        for i, stat in enumerate(self.statistics_lines(state, speed, current_round, simulation_round, frames_skipped)):
+            text = self.font.render(stat, True, (0, 0, 0))
+            stats_surface.blit(text, (10, 10 + i * 30))
+        self.screen.blit(stats_surface, (self.width, 0))
+
+    def statistics_lines(self, state, speed, current_round, simulation_round, frames_skipped):
         if state:
-            avg_hunger = sum(p.hunger for p in state['predators'] if p.alive) / max(1, len([p for p in state['predators'] if p.alive]))
             stats = [
-                f"Травы: {len([g for g in state['grass'] if g.alive])}",
-                f"Травоядных: {len([h for h in state['herbivores'] if h.alive])}",
-                f"Хищников: {len([p for p in state['predators'] if p.alive])}",
-                f"Экскрементов: {len([f for f in state['feces'] if f.alive])}",
-                f"Средний голод: {avg_hunger:.1f}",
+                f"Травы: {len(state['grass'])}",
+                f"Травоядных: {len(state['herbivores'])}",
+                f"Хищников: {len(state['predators'])}",
+                f"Экскрементов: {len(state['feces'])}",
+                f"Средний голод: {state.avg_hunger:.1f}",
                 f"Скорость: x{speed}",
                 f"Раунд: {current_round}",
                 f"Раундов вперёд: {simulation_round - current_round}",
@@ -44,14 +56,99 @@ class Renderer:
             ]
         else:
             stats = ["Ожидание состояния..."]
-        for i, stat in enumerate(stats):
-            text = self.font.render(stat, True, (0, 0, 0))
-            stats_surface.blit(text, (10, 10 + i * 30))
-        self.screen.blit(stats_surface, (FIELD_WIDTH, 0))
+        return stats
 
-    def save_snapshot(self, state, speed, current_round, simulation_round, frames_skipped, snapshot_path):
+    def render(self, state, speed, current_round, simulation_round, frames_skipped):
         if self.disable_rendering or not state:
-            return
+            return False
         self.draw(state)
         self.draw_statistics(state, speed, current_round, simulation_round, frames_skipped)
-        pygame.image.save(self.screen, snapshot_path)
\ No newline at end of file
+        return True
+
+    def frame(self):
+        # RGB-представление экрана (высота, ширина, 3) без копирования.
+        # Пока массив жив, поверхность заблокирована — не рисовать до его удаления.
+        return pygame.surfarray.pixels3d(self.screen).transpose(1, 0, 2)
+
+    def save_snapshot(self, state, speed, current_round, simulation_round, frames_skipped, snapshot_path):
+        if self.render(state, speed, current_round, simulation_round, frames_skipped):
+            pygame.image.save(self.screen, snapshot_path)
+
+class ArrayRenderer(Renderer):
+    # Растеризатор на NumPy: кадр — RGB-массив, все сущности одного типа рисуются
+    # одним векторным присваиванием, фон кэшируется, текст статистики
+    # перерисовывается только в изменившихся строках.
+    PANEL_WIDTH = 200
+    LINE_HEIGHT = 30
+    PANEL_COLOR = (200, 200, 200)
+
+    def __init__(self, disable_rendering=False, snapshot_dir="snapshots", config=None):
+        self.disable_rendering = disable_rendering
+        config = config or Config()
+        self.width, self.height = width, height = config.field_width, config.field_height
+        if not disable_rendering:
+            pygame.font.init()
+            self.font = pygame.font.SysFont('arial', 20)
+            self.buffer = np.empty((height, width + self.PANEL_WIDTH, 3), dtype=np.uint8)
+            self.buffer[:, width:] = self.PANEL_COLOR
+            self.background = np.full((height, width, 3), 255, dtype=np.uint8)
+            self.field = self.buffer[:, :width]
+            self.panel = self.buffer[:, width:]
+            self._lines = []
+            self._text_cache = {}
+            # Смещения пикселей внутри квадрата сущности для каждого размера
+            self._offsets = {}
+            for _, kind in ENTITY_KINDS:
+                dy, dx = np.divmod(np.arange(kind.size * kind.size), kind.size)
+                self._offsets[kind.size] = (dx, dy)
+        self.snapshot_dir = snapshot_dir  # None — PNG-снимки не сохраняются
+        if snapshot_dir and not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+
+    def draw(self, state):
+        if self.disable_rendering or not state:
+            return
+        np.copyto(self.field, self.background)
+        for key, kind in ENTITY_KINDS:
+            positions = state[key]
+            if not len(positions):
+                continue
+            dx, dy = self._offsets[kind.size]
+            # Как pygame.draw.rect: координаты усекаются, пиксели за полем отбрасываются
+            cols = (positions[:, 0].astype(np.int64)[:, None] + dx).ravel()
+            rows = (positions[:, 1].astype(np.int64)[:, None] + dy).ravel()
+            inside = (cols >= 0) & (cols < self.width) & (rows >= 0) & (rows < self.height)
+            self.field[rows[inside], cols[inside]] = kind.color
+
+    def _text(self, line):
+        text = self._text_cache.get(line)
+        if text is None:
+            if len(self._text_cache) > 1024:
+                self._text_cache.clear()
+            surface = self.font.render(line, True, (0, 0, 0), self.PANEL_COLOR)
+            text = pygame.surfarray.array3d(surface).transpose(1, 0, 2)
+            self._text_cache[line] = text
+        return text
+
+    def draw_statistics(self, state, speed, current_round, simulation_round, frames_skipped):
+        if self.disable_rendering:
+            return
+        lines = self.statistics_lines(state, speed, current_round, simulation_round, frames_skipped)
+        for i in range(max(len(lines), len(self._lines))):
+            line = lines[i] if i < len(lines) else None
+            if i < len(self._lines) and self._lines[i] == line:
+                continue
+            top = 10 + i * self.LINE_HEIGHT
+            row = self.panel[top:top + self.LINE_HEIGHT]
+            row[:] = self.PANEL_COLOR
+            if line is not None:
+                text = self._text(line)[:len(row), :self.PANEL_WIDTH - 10]
+                row[:text.shape[0], 10:10 + text.shape[1]] = text
+        self._lines = lines
+
+    def frame(self):
+        return self.buffer
+
+    def save_snapshot(self, state, speed, current_round, simulation_round, frames_skipped, snapshot_path):
+        if self.render(state, speed, current_round, simulation_round, frames_skipped):
+            pygame.image.save(pygame.surfarray.make_surface(self.buffer.transpose(1, 0, 2)), snapshot_path)
@@ -1,135 +1,296 @@
-import random
-import copy
-from threading import Thread
-import pickle
+import os
+import json
+import logging
+import numpy as np
 from constants import *
-from entities import Grass, Herbivore, Predator, Feces, QuadTree
-from utils import distance
+from config import Config
+from entities import GrassStore, HerbivoreStore, PredatorStore, FecesStore, scatter_around
+from kernels import make_rng_state
+from spatial import SpatialHash
+from grass_raster import GrassRaster
+from history import StateHistory, HISTORY_STATES, HISTORY_BUDGET
+from trajectory import TrajectoryWriter
+from metrics import Metrics
+from stats import PopulationStats
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+STORE_NAMES = ('grass', 'herbivores', 'predators', 'feces')
 
 class Simulation:
-    def __init__(self):
-        self.grass = []
-        self.herbivores = []
-        self.predators = []
-        self.feces = []
-        self.states = []
+    def __init__(self, trajectory_path=None, seed=None, grass_model='points', config=None, history=True,
+                 metrics=None, stats_path=None, history_states=HISTORY_STATES, history_budget=HISTORY_BUDGET):
+        # grass_model: 'points' — каждая травинка отдельной сущностью, 'raster' — растр плотности.
+        # config: параметры модели (Config), по умолчанию — значения из constants.
+        # history=False — без истории кадров, для прогонов без рендеринга; history_states и
+        # history_budget — число снимков в истории и память под них в байтах (StateHistory).
+        # metrics: сбор времени фаз и счётчиков (Metrics), по умолчанию выключен.
+        # stats_path: файл ряда численностей и событий по раундам (stats.py), по умолчанию не пишется.
+        self.grass_model = grass_model
+        self.config = c = config or Config()
+        self.grass = GrassRaster(c.field_width, c.field_height) if grass_model == 'raster' else GrassStore()
+        self.herbivores = HerbivoreStore()
+        self.predators = PredatorStore()
+        self.feces = FecesStore()
+        # Размер ячейки равен радиусу обзора того, кто ищет: запрос проверяет не больше 3x3 ячеек
+        if grass_model != 'raster':
+            SpatialHash(self.grass, c.herbivore_vision, c.field_width, c.field_height)
+        SpatialHash(self.herbivores, c.predator_vision, c.field_width, c.field_height)
+        # Все случайные числа выводятся из одного зерна: без него берётся случайное,
+        # и оно запоминается, чтобы прогон можно было повторить
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(2,)))
+        self.herbivore_rng = make_rng_state(self.seed, stream=0)
+        self.predator_rng = make_rng_state(self.seed, stream=1)
+        self.history = StateHistory(history_states, history_budget) if history else None
         self.current_round = 0
         self.simulation_round = 0
         self.speed = 1
         self.running = True
         self.save_interval = max(1, int(60 / ROUNDS_PER_SECOND))  # Увеличено с 30 до 60 FPS для реже сохранения
+        # Журнал траектории на диске: каждый раунд, для повторного рендеринга без симуляции
+        self.trajectory = TrajectoryWriter(trajectory_path) if trajectory_path else None
+        self.metrics = metrics or Metrics()
+        self.stats = PopulationStats(stats_path)
 
     def initialize(self):
-        print("Инициализация симуляции...")
+        logger.info(f"Инициализация симуляции, зерно {self.seed}...")
         try:
-            self.grass = [Grass(random.uniform(0, FIELD_WIDTH), random.uniform(0, FIELD_HEIGHT))
-                          for _ in range(INITIAL_GRASS_COUNT)]
-            self.herbivores = [Herbivore(random.uniform(0, FIELD_WIDTH), random.uniform(0, FIELD_HEIGHT))
-                               for _ in range(INITIAL_HERBIVORE_COUNT)]
-            self.predators = [Predator(random.uniform(0, FIELD_WIDTH), random.uniform(0, FIELD_HEIGHT))
-                              for _ in range(INITIAL_PREDATOR_COUNT)]
+            rng, c = self.rng, self.config
+            width, height = c.field_width, c.field_height
+            self.grass.add(rng.uniform(0, width, c.initial_grass_count),
+                           rng.uniform(0, height, c.initial_grass_count))
+            self.herbivores.spawn(rng.uniform(0, width, c.initial_herbivore_count),
+                                  rng.uniform(0, height, c.initial_herbivore_count), rng=rng)
+            self.predators.spawn(rng.uniform(0, width, c.initial_predator_count),
+                                 rng.uniform(0, height, c.initial_predator_count), rng=rng,
+                                 hunger=c.predator_hunger_max)
+            self.count_population()
+            self.stats.record(self.simulation_round)
             self.save_state()
-            print(f"Начальное состояние сохранено: {len(self.grass)} травы, {len(self.herbivores)} травоядных, {len(self.predators)} хищников")
+            self.log_trajectory()
+            counts = self.stats.counts
+            logger.info(f"Начальное состояние сохранено: {counts['grass']} травы, {counts['herbivores']} травоядных, {counts['predators']} хищников")
         except Exception as e:
-            print(f"Ошибка при инициализации: {e}")
+            logger.error(f"Ошибка при инициализации: {e}")
             raise
 
+    def count_population(self):
+        # Полный обход хранилищ; дальше численности и голод ведутся по событиям раунда
+        hunger = self.predators.live('hunger')
+        self.stats.reset({name: getattr(self, name).live_count() for name in STORE_NAMES}, hunger.sum())
+
     def save_state(self):
+        if self.history is None:
+            return
         try:
-            state = {
-                'grass': [g for g in self.grass if g.alive],
-                'herbivores': [h for h in self.herbivores if h.alive],
-                'predators': [p for p in self.predators if p.alive],
-                'feces': [f for f in self.feces if f.alive],
-                'round': self.simulation_round
-            }
-            pickle.dumps(state)
-            self.states.append(state)
-            while len(self.states) > 20:  # Уменьшено с 50 до 20
-                self.states.pop(0)
+            self.history.append(self.simulation_round,
+                                [(store.live('x'), store.live('y'))
+                                 for store in (self.grass, self.herbivores, self.predators, self.feces)],
+                                self.stats.avg_hunger())
         except Exception as e:
-            print(f"Ошибка при сохранении состояния: {e}")
+            logger.error(f"Ошибка при сохранении состояния: {e}")
+
+    def log_trajectory(self):
+        if self.trajectory is None:
+            return
+        self.trajectory.append(self.simulation_round, (self.grass, self.herbivores, self.predators, self.feces),
+                               self.stats.avg_hunger())
 
     def update_herbivores(self):
-        grass_quadtree = QuadTree(0, 0, FIELD_WIDTH, FIELD_HEIGHT)
-        for g in [g for g in self.grass if g.alive]:
-            grass_quadtree.insert(g)
-        new_herbivores = []
-        for herbivore in self.herbivores:
-            if herbivore.alive:
-                herbivore.move(grass_quadtree)
-                new_herbivores.extend(herbivore.eat(grass_quadtree, self.feces))
-        self.herbivores[:] = [h for h in self.herbivores if h.alive] + new_herbivores
-        grass_quadtree.clear_cache()
+        feces, children, (eaten, cleared) = self.herbivores.step(self.grass, self.herbivore_rng, self.config)
+        self._herbivore_births = feces, children
+        self.stats.event('grass_eaten', eaten)
+        self.stats.change('grass', -cleared)
 
     def update_predators(self):
-        herbivore_quadtree = QuadTree(0, 0, FIELD_WIDTH, FIELD_HEIGHT)
-        for h in [h for h in self.herbivores if h.alive]:
-            herbivore_quadtree.insert(h)
-        new_predators = []
-        for predator in self.predators:
-            if predator.alive:
-                predator.move(herbivore_quadtree)
-                new_predators.extend(predator.eat(herbivore_quadtree, self.feces))
-                predator.update_hunger()
-        self.predators[:] = [p for p in self.predators if p.alive] + new_predators
-        herbivore_quadtree.clear_cache()
+        feces, children, (kills, starved, hunger_sum) = self.predators.step(self.herbivores, self.predator_rng,
+                                                                            self.config)
+        self._predator_births = feces, children
+        stats = self.stats
+        stats.event('herbivores_killed', kills)
+        stats.change('herbivores', -kills)
+        stats.event('predators_starved', starved)
+        stats.change('predators', -starved)
+        stats.hunger_sum = int(hunger_sum)
+
+    def add_grass(self, x, y):
+        # Сколько точек травы прибавилось: у растра травинка в занятой клетке новой точки не даёт
+        added = self.grass.add(x, y)
+        return added if self.grass_model == 'raster' else len(x)
 
     def update_all(self):
         try:
-            print(f"Запуск update_all, раунд {self.simulation_round}")
-            new_grass = [Grass(random.uniform(0, FIELD_WIDTH), random.uniform(0, FIELD_HEIGHT))
-                         for _ in range(GRASS_SPAWN_PER_ROUND)]
-            for f in [f for f in self.feces if f.alive]:
-                for g in [g for g in self.grass if g.alive]:
-                    if distance(f.x, f.y, g.x, g.y) < GRASS_SPAWN_RADIUS:
-                        new_grass.extend([Grass(f.x + random.uniform(-5, 5), f.y + random.uniform(-5, 5))
-                                          for _ in range(GRASS_SPAWN_BONUS)])
-                        f.alive = False
-                        break
-            self.grass[:] = [g for g in self.grass if g.alive] + new_grass
-            self.feces[:] = [f for f in self.feces if f.alive]
-
-            herbivore_thread = Thread(target=self.update_herbivores)
-            predator_thread = Thread(target=self.update_predators)
-            herbivore_thread.start()
-            predator_thread.start()
-            herbivore_thread.join()
-            predator_thread.join()
-
-            if not any(h.alive for h in self.herbivores) or not any(p.alive for p in self.predators):
+            logger.debug("Запуск update_all, раунд %d", self.simulation_round)
+            # Экскременты рядом с травой удобряют почву: один пакетный запрос к индексу травы
+            c = self.config
+            metrics = self.metrics
+            stats = self.stats
+            stores = (self.grass, self.herbivores, self.predators, self.feces)
+            capacities = [getattr(store, 'capacity', 0) for store in stores] if metrics.level else None
+            with metrics.phase('grass_spawn'):
+                feces_x = self.feces.x[:self.feces.count]
+                feces_y = self.feces.y[:self.feces.count]
+                nearby_grass = self.grass.index.first_within_batch(feces_x, feces_y, c.grass_spawn_radius)
+                fertile = np.flatnonzero(self.feces.alive[:self.feces.count] & (nearby_grass >= 0))
+                self.feces.alive[fertile] = False
+                stats.event('feces_fertilized', len(fertile))
+                stats.change('feces', -len(fertile))
+                stats.change('grass', self.add_grass(self.rng.uniform(0, c.field_width, c.grass_spawn_per_round),
+                                                     self.rng.uniform(0, c.field_height, c.grass_spawn_per_round)))
+                stats.change('grass', self.add_grass(*scatter_around(feces_x[fertile], feces_y[fertile],
+                                                                     c.grass_spawn_bonus, self.rng)))
+                self.grass.compact()
+                self.feces.compact()
+            metrics.count('grass_queries', len(feces_x))
+            metrics.count('grass_fertilized', len(fertile))
+
+            # Строгий порядок: сначала травоядные, затем хищники видят их новые позиции.
+            # Параллельные потоки здесь делали исход зависимым от планировщика.
+            # Каждое живое животное делает один запрос к индексу своей добычи.
+            metrics.count('herbivore_queries', stats.counts['herbivores'])
+            with metrics.phase('herbivore_step'):
+                self.update_herbivores()
+            metrics.count('predator_queries', stats.counts['predators'])
+            with metrics.phase('predator_step'):
+                self.update_predators()
+
+            # Рождения и экскременты добавляются после обоих ядер, чтобы не менять столбцы на ходу
+            with metrics.phase('births'):
+                for feces in (self._herbivore_births[0], self._predator_births[0]):
+                    self.feces.add(*feces)
+                    stats.change('feces', len(feces[0]))
+                self.herbivores.spawn(*self._herbivore_births[1])
+                self.predators.spawn(*self._predator_births[1], hunger=c.predator_hunger_max)
+            herbivore_births = len(self._herbivore_births[1][0])
+            predator_births = len(self._predator_births[1][0])
+            stats.event('herbivore_births', herbivore_births)
+            stats.change('herbivores', herbivore_births)
+            stats.event('predator_births', predator_births)
+            stats.change('predators', predator_births)
+            stats.hunger_sum += predator_births * c.predator_hunger_max
+            metrics.count('herbivore_births', herbivore_births)
+            metrics.count('predator_births', predator_births)
+            with metrics.phase('compaction'):
+                for store in stores:
+                    store.compact()
+            if capacities is not None:
+                # Перевыделение столбцов хранилища при росте — заметная пауза, считаем отдельно
+                metrics.count('allocations', sum(getattr(store, 'capacity', 0) != capacity
+                                                 for store, capacity in zip(stores, capacities)))
+
+            if stats.counts['herbivores'] == 0 or stats.counts['predators'] == 0:
                 self.running = False
-                print("Симуляция остановлена: все травоядные или хищники вымерли")
+                logger.info("Симуляция остановлена: все травоядные или хищники вымерли")
         except Exception as e:
-            print(f"Ошибка в update_all: {e}")
+            logger.error(f"Ошибка в update_all: {e}")
             self.running = False
             raise
 
-    def update(self):
+    def update(self, end_round=True):
+        # end_round=False — раунд в метриках закроет вызывающий (end_round_metrics), например после вывода кадра
         if not self.running:
             return
-        print(f"Обновление симуляции, раунд {self.simulation_round}")
+        # Ленивое форматирование: без уровня debug строка не собирается
+        logger.debug("Обновление симуляции, раунд %d", self.simulation_round)
         try:
             self.update_all()
             self.simulation_round += 1
-            if self.simulation_round % self.save_interval == 0:
-                self.save_state()
-                print(f"Состояние сохранено для раунда {self.simulation_round}")
+            with self.metrics.phase('snapshot'):
+                self.stats.record(self.simulation_round)
+                self.log_trajectory()
+                if self.simulation_round % self.save_interval == 0:
+                    self.save_state()
+                    logger.debug("Состояние сохранено для раунда %d", self.simulation_round)
+            if end_round:
+                self.end_round_metrics()
         except Exception as e:
-            print(f"Ошибка в update: {e}")
+            logger.error(f"Ошибка в update: {e}")
             self.running = False
 
+    def end_round_metrics(self):
+        # Закрывает раунд в метриках; численности пишутся только для раундов, попадающих в поток
+        counts = dict(self.stats.counts) if self.metrics.sampled(self.simulation_round) else None
+        self.metrics.end_round(self.simulation_round, counts)
+
     def adjust_speed(self, increase):
         self.speed = min(self.speed + 1, 100) if increase else max(self.speed - 1, 1)
-        print(f"Скорость изменена на {self.speed}")
+        logger.info(f"Скорость изменена на {self.speed}")
 
     def stop(self):
         self.running = False
-        print("Симуляция остановлена")
+        if self.trajectory is not None:
+            self.trajectory.close()
+        self.stats.close()
+        logger.info("Симуляция остановлена")
+
+    def save_checkpoint(self, path):
+        # Полное состояние для продолжения: столбцы хранилищ, индексы соседей, счётчики
+        # и состояния генераторов. Без сжатия — запись и чтение упираются только в диск.
+        # Пишем во временный файл и переименовываем, чтобы сбой не оставил битую точку.
+        arrays = {}
+        for name in STORE_NAMES:
+            arrays.update(getattr(self, name).state_arrays(name))
+        arrays['herbivore_rng'] = self.herbivore_rng
+        arrays['predator_rng'] = self.predator_rng
+        arrays['meta'] = np.array(json.dumps({
+            'version': CHECKPOINT_VERSION,
+            'seed': self.seed,
+            'grass_model': self.grass_model,
+            'params': self.config.params(),
+            'simulation_round': self.simulation_round,
+            'current_round': self.current_round,
+            'speed': self.speed,
+            'rng': self.rng.bit_generator.state,
+            'stats': self.stats.state(),
+        }))
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temp_path, path)
+        # Журнал траектории и ряд статистики на диске не отстают от контрольной точки
+        if self.trajectory is not None:
+            self.trajectory.flush()
+        self.stats.flush()
+
+    @classmethod
+    def load_checkpoint(cls, path, trajectory_path=None, stats_path=None, history_states=HISTORY_STATES,
+                        history_budget=HISTORY_BUDGET):
+        # Продолжение с контрольной точки даёт те же раунды, что и непрерывный прогон.
+        # Журнал траектории, если задан, продолжается с раунда контрольной точки;
+        # ряд статистики дописывается (повторы раундов после точки отбрасывает stats.load_series).
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {key: data[key] for key in data.files}
+        meta = json.loads(str(arrays['meta']))
+        if meta['version'] != CHECKPOINT_VERSION:
+            raise ValueError(f"неподдерживаемая версия контрольной точки {meta['version']}")
+        simulation = cls(seed=meta['seed'],
+                         grass_model=meta.get('grass_model', 'points'), config=Config.from_params(meta.get('params')),
+                         stats_path=stats_path, history_states=history_states, history_budget=history_budget)
+        for name in STORE_NAMES:
+            getattr(simulation, name).load_arrays(arrays, name)
+        if trajectory_path:
+            simulation.trajectory = TrajectoryWriter(trajectory_path, resume_round=meta['simulation_round'])
+        simulation.herbivore_rng[:] = arrays['herbivore_rng']
+        simulation.predator_rng[:] = arrays['predator_rng']
+        simulation.rng.bit_generator.state = meta['rng']
+        simulation.simulation_round = meta['simulation_round']
+        simulation.current_round = meta['current_round']
+        simulation.speed = meta['speed']
+        simulation.count_population()
+        simulation.stats.load_state(meta.get('stats'))
+        # Флаг running не сохраняется: продолженная симуляция идёт, пока живы оба вида
+        counts = simulation.stats.counts
+        simulation.running = counts['herbivores'] > 0 and counts['predators'] > 0
+        simulation.save_state()
+        simulation.log_trajectory()
+        logger.info(f"Симуляция продолжена с раунда {simulation.simulation_round} из {path}")
+        return simulation
 
     def get_current_state(self, round_num):
-        for state in self.states:
-            if state['round'] == round_num:
-                return state
-        print(f"Состояние для раунда {round_num} не найдено")
+        state = self.history.get(round_num)
+        if state is not None:
+            return state
+        logger.warning(f"Состояние для раунда {round_num} не найдено")
         return None
\ No newline at end of file
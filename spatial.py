@@ -0,0 +1,269 @@
+import math
+import numpy as np
+from numba import njit, prange
+from utils import distance
+
+# Равномерная сетка ячеек для поиска соседей. Каждая ячейка — двусвязный список
+# индексов сущностей хранилища: head[ячейка], next/prev[индекс], cell[индекс].
+# Индекс обновляется на месте: при движении сущность перевешивается только если
+# сменила ячейку, рождения добавляются при add(), мёртвые удаляются при compact().
+
+class SpatialHash:
+    # Сетка покрывает прямоугольник [x0, x0 + width] x [y0, y0 + height]; точки за его
+    # пределами попадают в крайние ячейки, поэтому запросы остаются верными
+    def __init__(self, store, cell_size, width, height, x0=0.0, y0=0.0):
+        self.store = store
+        self.cell_size = float(cell_size)
+        self.x0 = float(x0)
+        self.y0 = float(y0)
+        self.cols = int(width // cell_size) + 1
+        self.rows = int(height // cell_size) + 1
+        self.head = np.full(self.cols * self.rows, -1, dtype=np.int64)
+        self.next = np.full(store.capacity, -1, dtype=np.int64)
+        self.prev = np.full(store.capacity, -1, dtype=np.int64)
+        self.cell = np.full(store.capacity, -1, dtype=np.int64)
+        store.index = self
+        self.insert(0, store.count)
+
+    def arrays(self):
+        # Кортеж для передачи в скомпилированные ядра
+        return self.head, self.next, self.prev, self.cell, self.cell_size, self.cols, self.rows, self.x0, self.y0
+
+    def reserve(self, capacity):
+        for name in ('next', 'prev', 'cell'):
+            old = getattr(self, name)
+            new = np.full(capacity, -1, dtype=np.int64)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def insert(self, start, end):
+        store = self.store
+        _link_range(self.arrays(), store.x, store.y, store.alive, start, end)
+
+    def state_arrays(self, prefix, count):
+        # Порядок сущностей в списках ячеек влияет на выбор среди равноудалённых соседей,
+        # поэтому для точного продолжения с контрольной точки списки сохраняются как есть
+        return {f'{prefix}.grid.head': self.head, f'{prefix}.grid.next': self.next[:count],
+                f'{prefix}.grid.prev': self.prev[:count], f'{prefix}.grid.cell': self.cell[:count]}
+
+    def load_arrays(self, arrays, prefix, count):
+        if f'{prefix}.grid.head' not in arrays or len(arrays[f'{prefix}.grid.head']) != len(self.head):
+            # Другая сетка — строим списки заново
+            self.head[:] = -1
+            self.cell[:] = -1
+            self.insert(0, count)
+            return
+        self.head[:] = arrays[f'{prefix}.grid.head']
+        for name in ('next', 'prev', 'cell'):
+            getattr(self, name)[:count] = arrays[f'{prefix}.grid.{name}']
+
+    def compact(self, dead, holes, movers):
+        _compact(self.arrays(), dead, holes, movers)
+
+    def query(self, x, y, radius):
+        store = self.store
+        return _query(self.arrays(), store.x, store.y, store.alive, x, y, radius)
+
+    def nearest(self, x, y, radius):
+        store = self.store
+        return _nearest(self.arrays(), store.x, store.y, store.alive, x, y, radius)
+
+    # Пакетные запросы: один вызов на массив точек вместо запроса на каждого агента.
+    # Точки обрабатываются параллельно на всех ядрах, индекс при этом только читается.
+
+    def nearest_batch(self, px, py, radius):
+        # Индексы ближайших живых сущностей (-1, если в радиусе никого) и расстояния до них
+        store = self.store
+        return nearest_batch(self.arrays(), store.x, store.y, store.alive,
+                             np.asarray(px, np.float64), np.asarray(py, np.float64), radius)
+
+    def first_within_batch(self, px, py, radius):
+        # Для каждой точки — любая живая сущность ближе radius (-1, если нет); быстрее nearest_batch в плотных местах.
+        # Граница строгая, как у удобрения травы экскрементами
+        store = self.store
+        return first_within_batch(self.arrays(), store.x, store.y, store.alive,
+                                  np.asarray(px, np.float64), np.asarray(py, np.float64), radius)
+
+    def within_range(self, px, py, targets, radius):
+        # Для каждой точки: жива ли её цель и находится ли она не дальше radius
+        store = self.store
+        return within_range(store.x, store.y, store.alive, np.asarray(px, np.float64),
+                            np.asarray(py, np.float64), np.asarray(targets, np.int64), radius)
+
+@njit(cache=True)
+def _cell_of(x, y, cell_size, cols, rows, x0, y0):
+    cx = min(max(int(math.floor((x - x0) / cell_size)), 0), cols - 1)
+    cy = min(max(int(math.floor((y - y0) / cell_size)), 0), rows - 1)
+    return cx, cy
+
+@njit(cache=True)
+def _link(grid, i, c):
+    head, nxt, prv, cell, cell_size, cols, rows, x0, y0 = grid
+    cell[i] = c
+    prv[i] = -1
+    nxt[i] = head[c]
+    if head[c] >= 0:
+        prv[head[c]] = i
+    head[c] = i
+
+@njit(cache=True)
+def _unlink(grid, i):
+    head, nxt, prv, cell, cell_size, cols, rows, x0, y0 = grid
+    c = cell[i]
+    if c < 0:
+        return
+    if prv[i] >= 0:
+        nxt[prv[i]] = nxt[i]
+    else:
+        head[c] = nxt[i]
+    if nxt[i] >= 0:
+        prv[nxt[i]] = prv[i]
+    cell[i] = -1
+    nxt[i] = -1
+    prv[i] = -1
+
+@njit(cache=True)
+def relink(grid, i, x, y):
+    # Вызывается после перемещения сущности; список меняется только при смене ячейки
+    head, nxt, prv, cell, cell_size, cols, rows, x0, y0 = grid
+    cx, cy = _cell_of(x, y, cell_size, cols, rows, x0, y0)
+    c = cy * cols + cx
+    if cell[i] != c:
+        _unlink(grid, i)
+        _link(grid, i, c)
+
+@njit(cache=True)
+def _link_range(grid, x, y, alive, start, end):
+    for i in range(start, end):
+        if alive[i]:
+            relink(grid, i, x[i], y[i])
+
+@njit(cache=True)
+def _compact(grid, dead, holes, movers):
+    # Повторяет перестановку EntityStore.compact: мёртвые убираются из списков,
+    # а живая сущность с хвоста занимает место дыры в том же узле списка
+    head, nxt, prv, cell, cell_size, cols, rows, x0, y0 = grid
+    for i in dead:
+        _unlink(grid, i)
+    for k in range(len(holes)):
+        h = holes[k]
+        m = movers[k]
+        c = cell[m]
+        if c < 0:
+            continue
+        p = prv[m]
+        q = nxt[m]
+        cell[h] = c
+        prv[h] = p
+        nxt[h] = q
+        if p >= 0:
+            nxt[p] = h
+        else:
+            head[c] = h
+        if q >= 0:
+            prv[q] = h
+        cell[m] = -1
+        nxt[m] = -1
+        prv[m] = -1
+
+@njit(cache=True)
+def _query(grid, x, y, alive, px, py, radius):
+    head, nxt, prv, cell, cell_size, cols, rows, x0, y0 = grid
+    found = []
+    cx0, cy0 = _cell_of(px - radius, py - radius, cell_size, cols, rows, x0, y0)
+    cx1, cy1 = _cell_of(px + radius, py + radius, cell_size, cols, rows, x0, y0)
+    for cy in range(cy0, cy1 + 1):
+        for cx in range(cx0, cx1 + 1):
+            j = head[cy * cols + cx]
+            while j >= 0:
+                if alive[j] and distance(px, py, x[j], y[j]) <= radius:
+                    found.append(j)
+                j = nxt[j]
+    return np.array(found, dtype=np.int64)
+
+@njit(cache=True)
+def _nearest(grid, x, y, alive, px, py, radius):
+    # Ближайшая живая сущность в радиусе: (индекс, расстояние) или (-1, inf)
+    head, nxt, prv, cell, cell_size, cols, rows, x0, y0 = grid
+    best = -1
+    best_dist = np.inf
+    cx0, cy0 = _cell_of(px - radius, py - radius, cell_size, cols, rows, x0, y0)
+    cx1, cy1 = _cell_of(px + radius, py + radius, cell_size, cols, rows, x0, y0)
+    for cy in range(cy0, cy1 + 1):
+        for cx in range(cx0, cx1 + 1):
+            j = head[cy * cols + cx]
+            while j >= 0:
+                if alive[j]:
+                    dist = distance(px, py, x[j], y[j])
+                    if dist <= radius and dist < best_dist:
+                        best = j
+                        best_dist = dist
+                j = nxt[j]
+    return best, best_dist
+
+@njit(cache=True)
+def _nearest_gather(grid, x, y, alive, px, py, radius, near, candidates):
+    # Как _nearest, но попутно запоминает в candidates живые сущности не дальше near в порядке
+    # обхода; возвращает (индекс, расстояние, число таких сущностей). Если число больше
+    # len(candidates), буфер переполнен и кандидатами пользоваться нельзя.
+    head, nxt, prv, cell, cell_size, cols, rows, x0, y0 = grid
+    best = -1
+    best_dist = np.inf
+    n = 0
+    cx0, cy0 = _cell_of(px - radius, py - radius, cell_size, cols, rows, x0, y0)
+    cx1, cy1 = _cell_of(px + radius, py + radius, cell_size, cols, rows, x0, y0)
+    for cy in range(cy0, cy1 + 1):
+        for cx in range(cx0, cx1 + 1):
+            j = head[cy * cols + cx]
+            while j >= 0:
+                if alive[j]:
+                    dist = distance(px, py, x[j], y[j])
+                    if dist <= near:
+                        if n < len(candidates):
+                            candidates[n] = j
+                        n += 1
+                    if dist <= radius and dist < best_dist:
+                        best = j
+                        best_dist = dist
+                j = nxt[j]
+    return best, best_dist, n
+
+@njit(cache=True)
+def _first_within(grid, x, y, alive, px, py, radius):
+    head, nxt, prv, cell, cell_size, cols, rows, x0, y0 = grid
+    cx0, cy0 = _cell_of(px - radius, py - radius, cell_size, cols, rows, x0, y0)
+    cx1, cy1 = _cell_of(px + radius, py + radius, cell_size, cols, rows, x0, y0)
+    for cy in range(cy0, cy1 + 1):
+        for cx in range(cx0, cx1 + 1):
+            j = head[cy * cols + cx]
+            while j >= 0:
+                if alive[j] and distance(px, py, x[j], y[j]) < radius:
+                    return j
+                j = nxt[j]
+    return -1
+
+@njit(parallel=True, nogil=True, cache=True)
+def nearest_batch(grid, x, y, alive, px, py, radius):
+    n = len(px)
+    found = np.full(n, -1, dtype=np.int64)
+    dist = np.full(n, np.inf)
+    for k in prange(n):
+        found[k], dist[k] = _nearest(grid, x, y, alive, px[k], py[k], radius)
+    return found, dist
+
+@njit(parallel=True, nogil=True, cache=True)
+def first_within_batch(grid, x, y, alive, px, py, radius):
+    n = len(px)
+    found = np.full(n, -1, dtype=np.int64)
+    for k in prange(n):
+        found[k] = _first_within(grid, x, y, alive, px[k], py[k], radius)
+    return found
+
+@njit(parallel=True, nogil=True, cache=True)
+def within_range(x, y, alive, px, py, targets, radius):
+    n = len(px)
+    contact = np.zeros(n, dtype=np.bool_)
+    for k in prange(n):
+        j = targets[k]
+        contact[k] = j >= 0 and alive[j] and distance(px[k], py[k], x[j], y[j]) <= radius
+    return contact
@@ -0,0 +1,87 @@
+import numpy as np
+from columnar import ColumnarWriter, read_table
+
+# Статистика популяций, которую симуляция ведёт по ходу раунда: численности видов и сумма
+# голода хищников меняются там, где сущности появляются и гибнут, поэтому снимки, метрики
+# и проверка вымирания получают их за O(1), без обхода хранилищ. События раунда (рождения,
+# гибель, съеденная трава) копятся до record(), который добавляет строку ряда и обнуляет их.
+# Ряд пишется в столбцовый файл (columnar.py) таблицей population пачками по buffer_rounds
+# строк: память буфера ограничена, а кадр файла после сбоя либо есть целиком, либо отброшен.
+
+TABLE = 'population'
+COUNTS = ('grass', 'herbivores', 'predators', 'feces')
+EVENTS = ('grass_eaten', 'herbivores_killed', 'predators_starved', 'feces_fertilized',
+          'herbivore_births', 'predator_births')
+COLUMNS = ('round',) + COUNTS + ('hunger_sum',) + EVENTS
+
+class PopulationStats:
+    def __init__(self, path=None, buffer_rounds=256):
+        self.counts = dict.fromkeys(COUNTS, 0)  # Живые сущности; у травы-растра — занятые клетки
+        self.hunger_sum = 0  # Сумма голода живых хищников
+        self.events = dict.fromkeys(EVENTS, 0)  # События текущего раунда
+        self.totals = dict.fromkeys(EVENTS, 0)  # События за весь прогон
+        self.buffer = np.zeros((len(COLUMNS), max(1, buffer_rounds)), np.int64)
+        self.buffered = 0
+        self.writer = ColumnarWriter(path) if path else None
+
+    def reset(self, counts, hunger_sum):
+        # Полный пересчёт по хранилищам — только при создании и загрузке контрольной точки
+        self.counts.update(counts)
+        self.hunger_sum = int(hunger_sum)
+
+    def change(self, kind, delta):
+        self.counts[kind] += int(delta)
+
+    def event(self, name, value):
+        value = int(value)
+        self.events[name] += value
+        self.totals[name] += value
+
+    def avg_hunger(self):
+        predators = self.counts['predators']
+        return self.hunger_sum / predators if predators else 0.0
+
+    def record(self, round_num):
+        # Закрывает раунд: строка ряда в буфер, при заполнении буфера — кадр в файл
+        if self.writer is not None:
+            row = self.buffer[:, self.buffered]
+            row[0] = round_num
+            row[1:1 + len(COUNTS)] = [self.counts[kind] for kind in COUNTS]
+            row[1 + len(COUNTS)] = self.hunger_sum
+            row[2 + len(COUNTS):] = [self.events[name] for name in EVENTS]
+            self.buffered += 1
+            if self.buffered == self.buffer.shape[1]:
+                self.flush()
+        self.events = dict.fromkeys(EVENTS, 0)
+
+    def flush(self):
+        if self.writer is None or not self.buffered:
+            return
+        self.writer.append({TABLE: {name: self.buffer[k, :self.buffered] for k, name in enumerate(COLUMNS)}})
+        self.buffered = 0
+
+    def state(self):
+        # Итоги прогона для контрольной точки; численности восстанавливаются по хранилищам
+        return dict(self.totals)
+
+    def load_state(self, totals):
+        self.totals.update(totals or {})
+
+    def close(self):
+        if self.writer is not None:
+            self.flush()
+            self.writer.close()
+            self.writer = None
+
+def load_series(path):
+    # Ряд из файла статистики: {столбец: массив} по возрастанию раунда. После продолжения
+    # с контрольной точки раунды за ней могут повторяться — остаётся последняя запись раунда.
+    series = read_table(path, TABLE)
+    if not series or not len(series['round']):
+        return series
+    rounds = series['round']
+    order = np.argsort(rounds, kind='stable')
+    last = np.ones(len(order), np.bool_)
+    last[:-1] = rounds[order][1:] != rounds[order][:-1]
+    keep = order[last]
+    return {name: values[keep] for name, values in series.items()}
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+import multiprocessing
+import numpy as np
+from constants import MAX_ROUNDS, PARAMS
+from config import Config
+from simulation import Simulation, STORE_NAMES
+from columnar import ColumnarWriter, read_table
+
+logger = logging.getLogger(__name__)
+
+# Перебор параметров: каждая конфигурация сетки прогоняется без рендеринга в пуле процессов.
+# Результаты пишутся в один столбцовый файл (columnar.py), по кадру на прогон:
+#   rounds — численность видов по раундам (run, round, grass, herbivores, predators, feces);
+#   runs — итог прогона: параметры, зерно, раунд вымирания, пиковые численности, время.
+# Прогон считается выполненным, когда его кадр записан целиком, поэтому прерванный перебор
+# продолжается тем же вызовом: готовые конфигурации узнаются по ключу и пропускаются.
+
+def parameter_grid(grid):
+    # {имя параметра: [значения]} -> список замен параметров, декартово произведение
+    for name in grid:
+        if name not in PARAMS:
+            raise ValueError(f"неизвестный параметр модели {name}")
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def run_key(params, seed, rounds, grass_model):
+    # Строка, однозначно задающая прогон: по ней продолжение перебора узнаёт готовые прогоны
+    return json.dumps({'params': params, 'seed': seed, 'rounds': rounds, 'grass': grass_model}, sort_keys=True)
+
+def _init_worker(threads, log_level):
+    # Процессов пула столько же, сколько ядер: параллельные фазы раунда внутри процесса не нужны
+    import numba
+    numba.set_num_threads(threads)
+    logging.basicConfig(level=log_level, format='%(message)s')
+    logging.getLogger('simulation').setLevel(max(log_level, logging.WARNING))
+
+def _run(task):
+    run, key, params, seed, rounds, grass_model = task
+    start_time = time.time()
+    counts = np.zeros((rounds + 1, len(STORE_NAMES)), np.int32)
+    simulation = Simulation(seed=seed, grass_model=grass_model, config=Config.from_params(params), history=False)
+    simulation.initialize()
+    population = simulation.stats.counts
+    counts[0] = [population[name] for name in STORE_NAMES]
+    while simulation.simulation_round < rounds and simulation.running:
+        simulation.update()
+        counts[simulation.simulation_round] = [population[name] for name in STORE_NAMES]
+    last = simulation.simulation_round
+    extinct = counts[last, 1] == 0 or counts[last, 2] == 0
+    if not simulation.running and not extinct:
+        raise RuntimeError(f"прогон {run} остановлен ошибкой на раунде {last}")
+    counts = counts[:last + 1]
+    peaks = counts.max(axis=0)
+    summary = {
+        'run': np.array([run], np.int64),
+        'key': np.array([key]),
+        'seed': np.array([seed], np.uint64),
+        'rounds': np.array([last], np.int64),
+        'extinction_round': np.array([last if extinct else -1], np.int64),
+    }
+    for name, value in params.items():
+        summary[name] = np.array([value], np.float64)
+    for k, name in enumerate(STORE_NAMES):
+        summary[f'peak_{name}'] = np.array([peaks[k]], np.int64)
+    summary['elapsed'] = np.array([time.time() - start_time])
+    series = {'run': np.full(len(counts), run, np.int32), 'round': np.arange(len(counts), dtype=np.int32)}
+    for k, name in enumerate(STORE_NAMES):
+        series[name] = counts[:, k]
+    return {'rounds': series, 'runs': summary}
+
+def run_sweep(grid, path, rounds=MAX_ROUNDS, replicates=1, seed=0, workers=0, grass_model='points'):
+    # Каждая конфигурация сетки повторяется replicates раз с разными зёрнами, выведенными из seed.
+    # workers=0 — считать в основном процессе. Возвращает число прогонов, выполненных этим вызовом.
+    seeds = [int(s) for s in np.random.SeedSequence(seed).generate_state(replicates, np.uint64)]
+    configs = parameter_grid(grid)
+    tasks = []
+    runs = {}
+    for run, (params, run_seed) in enumerate(itertools.product(configs, seeds)):
+        key = run_key(params, run_seed, rounds, grass_model)
+        runs[key] = run
+        tasks.append((run, key, params, run_seed, rounds, grass_model))
+    # Дописывать можно только тот же перебор: иначе номера прогонов и столбцы параметров в файле разойдутся
+    done = read_table(path, 'runs')
+    for run, key in zip(done.get('run', ()), done.get('key', ())):
+        if runs.get(str(key)) != int(run):
+            raise ValueError(f"в {path} результаты другого перебора (прогон {int(run)} не совпадает с сеткой, "
+                             f"зёрнами или числом раундов); укажите другой файл")
+    done = set(runs) & set(done.get('key', ()))
+    tasks = [task for task in tasks if task[1] not in done]
+    total = len(configs) * len(seeds)
+    logger.info(f"Перебор параметров: {total} прогонов, уже выполнено {total - len(tasks)}, результаты в {path}")
+    pool = None
+    finished = 0
+    start_time = time.time()
+    with ColumnarWriter(path) as writer:
+        try:
+            if workers:
+                pool = multiprocessing.get_context('spawn').Pool(
+                    workers, initializer=_init_worker, initargs=(1, logging.getLogger().level))
+                results = pool.imap_unordered(_run, tasks)
+            else:
+                results = map(_run, tasks)
+            for result in results:
+                writer.append(result)
+                finished += 1
+                summary = result['runs']
+                extinction = int(summary['extinction_round'][0])
+                logger.info(f"Прогон {int(summary['run'][0])} ({finished}/{len(tasks)}): "
+                            f"{'вымирание на раунде ' + str(extinction) if extinction >= 0 else 'без вымирания'}, "
+                            f"{summary['elapsed'][0]:.2f} секунд")
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+    logger.info(f"Перебор завершён. Общее время: {time.time() - start_time:.2f} секунд")
+    return finished
+
+def load_results(path):
+    # Итоги и ряды численности выполненных прогонов. Ряды прогонов без итога не возвращаются.
+    runs = read_table(path, 'runs')
+    rounds = read_table(path, 'rounds')
+    if runs and rounds:
+        keep = np.isin(rounds['run'], runs['run'])
+        rounds = {name: values[keep] for name, values in rounds.items()}
+    return runs, rounds
+
+def _parse_param(text):
+    # ИМЯ=v1,v2,... -> (имя, [значения]); целые остаются целыми
+    name, _, values = text.partition('=')
+    if not values:
+        raise argparse.ArgumentTypeError(f"ожидалось ИМЯ=значение,значение,..., получено {text}")
+    parsed = []
+    for value in values.split(','):
+        try:
+            parsed.append(int(value))
+        except ValueError:
+            parsed.append(float(value))
+    return name.strip(), parsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перебор параметров симуляции без рендеринга")
+    parser.add_argument("--param", type=_parse_param, action="append", default=[], metavar="NAME=V1,V2,...",
+                        help="значения параметра из constants.py; несколько --param дают декартово произведение")
+    parser.add_argument("--output", default="sweep.lscf", help="файл результатов; существующий файл дописывается")
+    parser.add_argument("--rounds", type=int, default=MAX_ROUNDS, help="наибольшее число раундов прогона")
+    parser.add_argument("--replicates", type=int, default=1, help="число прогонов каждой конфигурации с разными зёрнами")
+    parser.add_argument("--seed", type=int, default=0, help="зерно, из которого выводятся зёрна прогонов")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="число процессов; 0 — считать в основном процессе")
+    parser.add_argument("--grass", choices=("points", "raster"), default="points", help="модель травы")
+    parser.add_argument("--log-level", choices=("debug", "info", "warning", "error"), default="info",
+                        help="уровень сообщений в консоли")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format='%(message)s')
+    # Сообщения каждого прогона о себе в переборе лишние — остаются только предупреждения и ошибки
+    logging.getLogger('simulation').setLevel(max(logging.getLogger().level, logging.WARNING))
+    try:
+        run_sweep(dict(args.param), args.output, rounds=args.rounds, replicates=args.replicates, seed=args.seed,
+                  workers=args.workers, grass_model=args.grass)
+    except Exception as e:
+        logger.error(f"Ошибка перебора параметров: {e}")
+        sys.exit(1)
@@ -0,0 +1,25 @@
+import os
+import sys
+import numpy as np
+
+# Модули лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation import STORE_NAMES
+
+
+def live_state(simulation):
+    # Живые сущности всех хранилищ по постоянным номерам — для сравнения двух прогонов
+    state = {}
+    for name in STORE_NAMES:
+        store = getattr(simulation, name)
+        ids = store.live('id')
+        order = np.argsort(ids)
+        state[name] = (ids[order], store.live('x')[order], store.live('y')[order])
+    return state
+
+
+def assert_same_state(a, b):
+    for name in STORE_NAMES:
+        for left, right in zip(live_state(a)[name], live_state(b)[name]):
+            np.testing.assert_array_equal(left, right, err_msg=name)
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+from simulation import Simulation, STORE_NAMES
+from stats import load_series
+from trajectory import TrajectoryReader
+from conftest import assert_same_state
+
+ROUNDS = 40
+CHECKPOINT_ROUND = 20
+
+
+def run(simulation, rounds):
+    for _ in range(rounds):
+        simulation.update()
+    return simulation
+
+
+def outputs(path):
+    return os.path.join(path, 'trajectory'), os.path.join(path, 'stats.lscf')
+
+
+def test_resume_matches_continuous_run(tmp_path):
+    for grass_model in ('points', 'raster'):
+        continuous_dir = tmp_path / f'{grass_model}-continuous'
+        resumed_dir = tmp_path / f'{grass_model}-resumed'
+        continuous_dir.mkdir()
+        resumed_dir.mkdir()
+        trajectory_path, stats_path = outputs(str(continuous_dir))
+        continuous = Simulation(trajectory_path, seed=11, grass_model=grass_model, history=False,
+                                stats_path=stats_path)
+        continuous.initialize()
+        run(continuous, ROUNDS).stop()
+
+        trajectory_path, stats_path = outputs(str(resumed_dir))
+        checkpoint = str(resumed_dir / 'checkpoint.npz')
+        interrupted = Simulation(trajectory_path, seed=11, grass_model=grass_model, history=False,
+                                 stats_path=stats_path)
+        interrupted.initialize()
+        run(interrupted, CHECKPOINT_ROUND).save_checkpoint(checkpoint)
+        # Раунды после точки пропадают при сбое, но успевают попасть в файлы
+        run(interrupted, 5).stop()
+        resumed = Simulation.load_checkpoint(checkpoint, trajectory_path=trajectory_path, stats_path=stats_path)
+        assert resumed.simulation_round == CHECKPOINT_ROUND
+        run(resumed, ROUNDS - CHECKPOINT_ROUND).stop()
+
+        assert resumed.simulation_round == continuous.simulation_round
+        assert_same_state(continuous, resumed)
+        np.testing.assert_array_equal(continuous.herbivore_rng, resumed.herbivore_rng)
+        np.testing.assert_array_equal(continuous.predator_rng, resumed.predator_rng)
+        assert continuous.rng.bit_generator.state == resumed.rng.bit_generator.state
+        assert continuous.stats.counts == resumed.stats.counts
+
+        expected = load_series(outputs(str(continuous_dir))[1])
+        series = load_series(stats_path)
+        assert series['round'].tolist() == list(range(ROUNDS + 1))
+        for name in expected:
+            np.testing.assert_array_equal(series[name], expected[name], err_msg=name)
+
+        expected = TrajectoryReader(outputs(str(continuous_dir))[0])
+        reader = TrajectoryReader(trajectory_path)
+        assert (reader.first_round, reader.last_round) == (0, ROUNDS)
+        for round_num in range(ROUNDS + 1):
+            for (ids, xy), (expected_ids, expected_xy) in zip(reader.state(round_num)[0],
+                                                               expected.state(round_num)[0]):
+                np.testing.assert_array_equal(ids, expected_ids)
+                np.testing.assert_array_equal(xy, expected_xy)
+
+
+def test_checkpoint_after_stop_resumes_running(tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.npz')
+    simulation = Simulation(seed=5)
+    simulation.initialize()
+    run(simulation, 10).stop()
+    simulation.save_checkpoint(checkpoint)
+    resumed = Simulation.load_checkpoint(checkpoint)
+    assert resumed.running
+    assert resumed.config == simulation.config
+    assert_same_state(simulation, resumed)
+    assert resumed.stats.counts == {name: getattr(simulation, name).live_count() for name in STORE_NAMES}
+    # Восстановленный раунд сразу доступен в истории для вывода
+    assert resumed.get_current_state(10) is not None
+    run(resumed, 1)
+    assert resumed.simulation_round == 11
@@ -0,0 +1,92 @@
+import numpy as np
+from entities import GrassStore
+from spatial import SpatialHash, relink
+from utils import distance
+from simulation import Simulation
+from conftest import assert_same_state
+
+
+def brute_nearest(store, px, py, radius):
+    best, best_dist = -1, np.inf
+    for j in range(store.count):
+        if store.alive[j]:
+            dist = distance(px, py, store.x[j], store.y[j])
+            if dist <= radius and dist < best_dist:
+                best, best_dist = j, dist
+    return best
+
+
+def make_store(rng, n=500, size=100.0):
+    store = GrassStore()
+    store.add(rng.uniform(0, size, n), rng.uniform(0, size, n))
+    SpatialHash(store, 7.0, size, size)
+    return store
+
+
+def check_queries(store, rng, radius=7.0):
+    points = rng.uniform(-10, 110, (200, 2))
+    found, _ = store.index.nearest_batch(points[:, 0], points[:, 1], radius)
+    for (px, py), j in zip(points, found):
+        assert j == brute_nearest(store, px, py, radius)
+        expected = sorted(k for k in range(store.count)
+                          if store.alive[k] and distance(px, py, store.x[k], store.y[k]) <= radius)
+        assert sorted(store.index.query(px, py, radius).tolist()) == expected
+    first = store.index.first_within_batch(points[:, 0], points[:, 1], radius)
+    for (px, py), j in zip(points, first):
+        near = [k for k in range(store.count)
+                if store.alive[k] and distance(px, py, store.x[k], store.y[k]) < radius]
+        assert (j in near) if near else j == -1
+
+
+def test_queries_match_brute_force():
+    rng = np.random.default_rng(1)
+    check_queries(make_store(rng), rng)
+
+
+def test_incremental_moves_births_and_compaction():
+    rng = np.random.default_rng(2)
+    store = make_store(rng)
+    grid = store.index.arrays()
+    for _ in range(5):
+        # Сдвиги, в том числе за край сетки, перевешиваются на месте
+        n = store.count
+        store.x[:n] += rng.uniform(-15, 15, n)
+        store.y[:n] += rng.uniform(-15, 15, n)
+        for i in range(n):
+            if store.alive[i]:
+                relink(grid, i, store.x[i], store.y[i])
+        store.alive[rng.choice(n, n // 5, replace=False)] = False
+        store.add(rng.uniform(0, 100, 50), rng.uniform(0, 100, 50))
+        grid = store.index.arrays()  # add() мог перевыделить столбцы индекса
+        check_queries(store, rng)
+        store.compact()
+        check_queries(store, rng)
+
+
+def test_index_lists_hold_each_live_entity_once():
+    rng = np.random.default_rng(3)
+    store = make_store(rng)
+    store.alive[::3] = False
+    store.compact()
+    index = store.index
+    seen = []
+    for c in range(len(index.head)):
+        j = index.head[c]
+        while j >= 0:
+            assert index.cell[j] == c
+            seen.append(j)
+            j = index.next[j]
+    assert sorted(seen) == list(range(store.count))
+
+
+def test_same_seed_replays_identically():
+    for grass_model in ('points', 'raster'):
+        runs = []
+        for _ in range(2):
+            simulation = Simulation(seed=7, grass_model=grass_model, history=False)
+            simulation.initialize()
+            for _ in range(40):
+                simulation.update()
+            runs.append(simulation)
+        assert runs[0].simulation_round == 40
+        assert_same_state(*runs)
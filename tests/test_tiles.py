@@ -0,0 +1,123 @@
+import dataclasses
+import numpy as np
+from config import Config
+from entities import GrassStore, HerbivoreStore, PredatorStore
+from kernels import make_rng_state
+from spatial import SpatialHash
+from tiles import TiledWorld, grass_halo
+from utils import distance
+
+SIZE = 400
+TILE = 100
+
+
+def tile_columns(world, kind, *names):
+    # Столбцы живых сущностей всех плиток по сквозным номерам
+    ids, columns = [], [[] for _ in names]
+    for tile in world.tiles.values():
+        store = getattr(tile, kind)
+        n = store.count
+        alive = store.alive[:n]
+        ids.append(store.id[:n][alive])
+        for column, name in zip(columns, names):
+            column.append(getattr(store, name)[:n][alive])
+    order = np.argsort(np.concatenate(ids))
+    return [np.concatenate(ids)[order]] + [np.concatenate(column)[order] for column in columns]
+
+
+def test_herbivore_step_matches_single_world():
+    # Травы столько, что у каждого травоядного есть цель: шаг не зависит от случайных чисел,
+    # и плитки с призраками должны дать те же ходы и ту же съеденную траву, что и одно поле
+    rng = np.random.default_rng(4)
+    config = Config()
+    grass_x, grass_y = rng.uniform(0, SIZE, 8000), rng.uniform(0, SIZE, 8000)
+    herbivore_x, herbivore_y = rng.uniform(0, SIZE, 300), rng.uniform(0, SIZE, 300)
+    direction = np.zeros((300, 2))
+
+    grass = GrassStore()
+    grass.add(grass_x, grass_y)
+    SpatialHash(grass, config.herbivore_vision, SIZE, SIZE)
+    herbivores = HerbivoreStore()
+    herbivores.add(herbivore_x, herbivore_y, direction=direction)
+    SpatialHash(herbivores, config.predator_vision, SIZE, SIZE)
+    herbivores.step(grass, make_rng_state(1, stream=0), config)
+
+    world = TiledWorld(SIZE, SIZE, tile_size=TILE, seed=1, config=config)
+    world._place('grass', grass_x, grass_y)
+    world._place('herbivores', herbivore_x, herbivore_y, direction=direction)
+    assert len(world.tiles) == (SIZE // TILE) ** 2
+    world._herbivore_phase(np.uint64(1))
+
+    ids, x, y = tile_columns(world, 'herbivores', 'x', 'y')
+    n = herbivores.count
+    np.testing.assert_array_equal(ids, herbivores.id[:n])
+    np.testing.assert_allclose(x, herbivores.x[:n])
+    np.testing.assert_allclose(y, herbivores.y[:n])
+    eaten = np.setdiff1d(np.arange(len(grass_x)), tile_columns(world, 'grass')[0])
+    assert len(eaten) > 0
+    np.testing.assert_array_equal(eaten, np.flatnonzero(~grass.alive[:grass.count]))
+
+
+def test_predator_hunger_matches_single_world():
+    # Без добычи голод хищников только убывает: плитки и одно поле должны морить их
+    # одинаково, начиная с сытости из конфигурации, а не из умолчания столбца
+    config = dataclasses.replace(Config(), predator_hunger_max=30)
+    world = TiledWorld(SIZE, SIZE, tile_size=TILE, seed=6, config=config)
+    world.populate(grass=0, herbivores=0, predators=40)
+    ids, x, y, hunger = tile_columns(world, 'predators', 'x', 'y', 'hunger')
+    assert (hunger == 30).all()
+
+    predators = PredatorStore()
+    predators.spawn(x, y, rng=np.random.default_rng(0), hunger=config.predator_hunger_max)
+    prey = HerbivoreStore()
+    SpatialHash(prey, config.predator_vision, SIZE, SIZE)
+    rng_state = make_rng_state(6, stream=1)
+    for _ in range(40):
+        world.step()
+        predators.step(prey, rng_state, config)
+        predators.compact()
+        expected = np.sort(predators.live('hunger'))
+        np.testing.assert_array_equal(np.sort(tile_columns(world, 'predators', 'hunger')[1]), expected)
+    assert world.counts()['predators'] == 0
+
+
+def test_border_fertilisation_matches_global_query():
+    # Экскременты у границ и углов плиток, трава — в любой из соседних плиток
+    rng = np.random.default_rng(5)
+    config = Config()
+    radius = config.grass_spawn_radius
+    lines = np.arange(0, SIZE + 1, TILE)
+    feces_x = rng.choice(lines, 2000) + rng.uniform(-radius, radius, 2000)
+    feces_y = rng.uniform(0, SIZE, 2000)
+    swap = rng.random(2000) < 0.5
+    feces_x[swap], feces_y[swap] = feces_y[swap], feces_x[swap]
+    grass_x, grass_y = rng.uniform(0, SIZE, 1500), rng.uniform(0, SIZE, 1500)
+
+    world = TiledWorld(SIZE, SIZE, tile_size=TILE, seed=2, config=config)
+    world._place('grass', grass_x, grass_y)
+    world._place('feces', feces_x, feces_y)
+    fertile = []
+    for tile in world.tiles.values():
+        fertile.append(tile.feces.id[world._fertile(tile)])
+    fertile = np.sort(np.concatenate(fertile))
+
+    expected = [i for i in range(len(feces_x))
+                if any(distance(feces_x[i], feces_y[i], gx, gy) < radius for gx, gy in zip(grass_x, grass_y))]
+    assert 0 < len(expected) < len(feces_x)
+    np.testing.assert_array_equal(fertile, expected)
+
+
+def test_config_is_honoured():
+    config = dataclasses.replace(Config(), herbivore_vision=30, initial_herbivore_count=50,
+                                 initial_predator_count=5, initial_grass_count=100, predator_hunger_max=30)
+    world = TiledWorld(2 * config.field_width, config.field_height, tile_size=TILE, seed=3, config=config)
+    assert world.grass_halo == grass_halo(config) > grass_halo(Config())
+    world.populate()
+    assert world.counts() == {'grass': 200, 'herbivores': 100, 'predators': 10, 'feces': 0}
+    for _ in range(5):
+        world.step()
+    # Номера сущностей сквозные и после переезда между плитками не повторяются
+    for kind in ('herbivores', 'predators'):
+        ids = tile_columns(world, kind)[0]
+        assert len(np.unique(ids)) == len(ids)
+    assert (tile_columns(world, 'predators', 'hunger')[1] <= config.predator_hunger_max).all()
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pytest
+from simulation import Simulation, STORE_NAMES
+from trajectory import TrajectoryReader, TrajectoryWriter
+from conftest import live_state
+
+ROUNDS = 30
+
+
+def record(path, keyframe_interval=7, rounds=ROUNDS):
+    # Прогон с журналом; ожидаемые состояния раундов снимаются прямо с хранилищ
+    simulation = Simulation(trajectory_path=path, seed=3, history=False)
+    simulation.trajectory.keyframe_interval = keyframe_interval
+    simulation.initialize()
+    states = [live_state(simulation)]
+    hunger = [simulation.stats.avg_hunger()]
+    for _ in range(rounds):
+        simulation.update()
+        states.append(live_state(simulation))
+        hunger.append(simulation.stats.avg_hunger())
+    simulation.stop()
+    return states, hunger
+
+
+def assert_round(reader, round_num, expected, avg_hunger):
+    state, hunger = reader.state(round_num)
+    assert hunger == pytest.approx(avg_hunger)
+    for (ids, xy), name in zip(state, STORE_NAMES):
+        expected_ids, x, y = expected[name]
+        np.testing.assert_array_equal(ids, expected_ids, err_msg=name)
+        np.testing.assert_array_equal(xy[:, 0], x.astype(np.float32), err_msg=name)
+        np.testing.assert_array_equal(xy[:, 1], y.astype(np.float32), err_msg=name)
+
+
+def test_round_trip_in_any_order(tmp_path):
+    states, hunger = record(str(tmp_path))
+    reader = TrajectoryReader(str(tmp_path))
+    assert (reader.first_round, reader.last_round) == (0, ROUNDS)
+    order = list(range(ROUNDS + 1)) + list(np.random.default_rng(0).permutation(ROUNDS + 1))
+    order += [12, 12, 13, 12]  # повтор и шаг назад от курсора
+    for round_num in order:
+        assert_round(reader, round_num, states[round_num], hunger[round_num])
+    with pytest.raises(IndexError):
+        reader.state(ROUNDS + 1)
+
+
+def test_snapshots_match_counts(tmp_path):
+    states, _ = record(str(tmp_path))
+    snapshots = list(TrajectoryReader(str(tmp_path)).snapshots(5, 15))
+    assert [s.round for s in snapshots] == list(range(5, 16))
+    for snapshot in snapshots:
+        expected = states[snapshot.round]
+        assert snapshot.counts.tolist() == [len(expected[name][0]) for name in STORE_NAMES]
+        assert len(snapshot.positions) == snapshot.counts.sum()
+
+
+def test_resume_drops_later_rounds_and_torn_tail(tmp_path):
+    path = str(tmp_path)
+    states, hunger = record(path)
+    # Оборванная запись в конце, как после падения процесса
+    with open(os.path.join(path, 'data.bin'), 'ab') as f:
+        f.write(b'\0' * 13)
+    with open(os.path.join(path, 'index.bin'), 'ab') as f:
+        f.write(b'\0' * 20)
+    with pytest.raises(ValueError):
+        TrajectoryWriter(path, resume_round=ROUNDS + 5)
+    writer = TrajectoryWriter(path, keyframe_interval=7, resume_round=20)
+    writer.close()
+    reader = TrajectoryReader(path)
+    assert reader.last_round == 19
+    for round_num in range(20):
+        assert_round(reader, round_num, states[round_num], hunger[round_num])
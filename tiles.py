@@ -0,0 +1,394 @@
+import math
+import multiprocessing
+import numpy as np
+from config import Config
+from entities import GrassStore, HerbivoreStore, PredatorStore, FecesStore, random_directions, scatter_around
+from kernels import (make_rng_state, _next_seed, _splitmix, _claim_winners, _offspring,
+                     herbivore_intents, herbivore_outcomes, predator_intents, predator_outcomes)
+from spatial import SpatialHash
+
+# Мир из плиток для больших полей. Каждая плитка владеет сущностями, чьи координаты
+# лежат в её квадрате, и своим индексом травы. Раунд идёт фазами:
+#   трава     — удобрение экскрементами и появление травы, по плиткам; экскременты у границы
+#               ищут траву и в индексах соседних плиток;
+#   травоядные — намерения считаются по плиткам в процессах-работниках; трава соседних
+#               плиток в полосе grass_halo() приходит копиями-призраками;
+#   хищники   — так же, с призраками травоядных в полосе prey_halo();
+# после каждой фазы заявки на траву и жертв разрешаются по сквозным номерам мира
+# (ближайший претендент, жребий от зерна), поэтому конфликт через границу решается
+# так же, как внутри плитки. Перешедшие границу агенты переезжают к новой плитке.
+# Хранятся и считаются только плитки, где есть хоть одна сущность: трава случайно
+# появляется лишь в них, с плотностью исходного поля (config.field_width x config.field_height).
+# Параметры модели — из Config, как у Simulation.
+
+STORES = (('grass', GrassStore), ('herbivores', HerbivoreStore), ('predators', PredatorStore), ('feces', FecesStore))
+
+def grass_halo(config):
+    # Агент у границы выбирает цель в радиусе обзора от начала шага и заявляет её после
+    # шага, поэтому полоса призраков — обзор + наибольший шаг + размер
+    c = config
+    return c.herbivore_vision + max(c.herbivore_speed, c.herbivore_speed_to_grass) + HerbivoreStore.size
+
+def prey_halo(config):
+    c = config
+    return c.predator_vision + max(c.predator_speed, c.predator_speed_to_prey) + PredatorStore.size
+
+def _herbivore_task(task):
+    # Выполняется в процессе-работнике: индекс травы плитки с призраками и намерения травоядных
+    seed, x, y, direction, alive, grass_x, grass_y, x0, y0, extent, width, height, c = task
+    grass = GrassStore()
+    grass.add(grass_x, grass_y)
+    index = SpatialHash(grass, c.herbivore_vision, extent, extent, x0, y0)
+    claims, dists = herbivore_intents(x, y, direction, alive, len(x), grass.x, grass.y, grass.alive, index.arrays(),
+                                      seed, c.herbivore_vision, c.herbivore_speed, c.herbivore_speed_to_grass,
+                                      HerbivoreStore.size, width, height)
+    return x, y, direction, claims, dists
+
+def _predator_task(task):
+    seed, x, y, direction, hunger, eating_timer, alive, prey_x, prey_y, x0, y0, extent, width, height, c = task
+    prey = HerbivoreStore()
+    prey.add(prey_x, prey_y)
+    index = SpatialHash(prey, c.predator_vision, extent, extent, x0, y0)
+    hunting, claims, dists = predator_intents(x, y, direction, hunger, eating_timer, alive, len(x),
+                                              prey.x, prey.y, prey.alive, index.arrays(), seed,
+                                              c.predator_vision, c.predator_speed, c.predator_speed_to_prey,
+                                              PredatorStore.size, width, height,
+                                              c.predator_hunger_max, c.predator_hunger_decrease)
+    return x, y, direction, hunger, eating_timer, hunting, claims, dists
+
+class Tile:
+    def __init__(self, key, tile_size, grass_spawn_radius):
+        self.key = key
+        self.x0 = key[0] * tile_size
+        self.y0 = key[1] * tile_size
+        for name, store in STORES:
+            setattr(self, name, store())
+        # Индекс травы нужен только для удобрения экскрементами
+        SpatialHash(self.grass, grass_spawn_radius, tile_size, tile_size, self.x0, self.y0)
+
+    def empty(self):
+        return all(getattr(self, name).count == 0 for name, _ in STORES)
+
+class TiledWorld:
+    def __init__(self, width, height, tile_size=1000, seed=None, workers=0, config=None):
+        self.config = c = config or Config()
+        self.grass_halo = grass_halo(c)
+        self.prey_halo = prey_halo(c)
+        halo = max(self.grass_halo, self.prey_halo, c.grass_spawn_radius)
+        if tile_size < halo:
+            raise ValueError(f"плитка {tile_size} меньше полосы призраков {halo}")
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.tiles_x = math.ceil(width / tile_size)
+        self.tiles_y = math.ceil(height / tile_size)
+        self.tiles = {}
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(2,)))
+        self.rng_state = make_rng_state(self.seed, stream=0)
+        self.next_id = {name: 0 for name, _ in STORES}  # Сквозные номера мира по видам
+        self.round = 0
+        # Без работников намерения считаются в этом же процессе
+        self.pool = multiprocessing.get_context('spawn').Pool(workers) if workers else None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def _map(self, function, tasks):
+        if self.pool is None:
+            return [function(task) for task in tasks]
+        return self.pool.map(function, tasks)
+
+    def _keys(self, x, y):
+        tx = np.clip((x // self.tile_size).astype(np.int64), 0, self.tiles_x - 1)
+        ty = np.clip((y // self.tile_size).astype(np.int64), 0, self.tiles_y - 1)
+        return tx, ty
+
+    def _tile(self, key):
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.tiles[key] = Tile(key, self.tile_size, self.config.grass_spawn_radius)
+        return tile
+
+    def _tile_seed(self, seed, key):
+        return np.uint64(_splitmix(seed ^ np.uint64(key[1] * self.tiles_x + key[0])))
+
+    def _place(self, kind, x, y, ids=None, **values):
+        # Раскладывает сущности по плиткам-владельцам; новым выдаются сквозные номера
+        x = np.asarray(x, np.float64)
+        y = np.asarray(y, np.float64)
+        if not len(x):
+            return
+        if ids is None:
+            ids = np.arange(self.next_id[kind], self.next_id[kind] + len(x))
+            self.next_id[kind] += len(x)
+        tx, ty = self._keys(x, y)
+        code = ty * self.tiles_x + tx
+        order = np.argsort(code, kind='stable')
+        codes, starts = np.unique(code[order], return_index=True)
+        bounds = np.append(starts, len(order))
+        for c, a, b in zip(codes.tolist(), bounds[:-1].tolist(), bounds[1:].tolist()):
+            part = order[a:b]
+            store = getattr(self._tile((c % self.tiles_x, c // self.tiles_x)), kind)
+            placed = store.add(x[part], y[part], **{name: value[part] for name, value in values.items()})
+            store.id[placed] = ids[part]
+
+    def _migrate(self, kind, store_class):
+        # Агенты, сменившие плитку, переезжают к новому владельцу вместе с номерами
+        moved = []
+        for tile in self.tiles.values():
+            store = getattr(tile, kind)
+            n = store.count
+            tx, ty = self._keys(store.x[:n], store.y[:n])
+            leaving = np.flatnonzero(store.alive[:n] & ((tx != tile.key[0]) | (ty != tile.key[1])))
+            if len(leaving):
+                moved.append({name: getattr(store, name)[leaving].copy() for name in store.column_names()})
+                store.alive[leaving] = False
+        for columns in moved:
+            self._place(kind, columns['x'], columns['y'], ids=columns['id'],
+                        **{name: columns[name] for name, *_ in store_class.columns})
+
+    def _neighbourhood(self, tile, kind, margin, offsets):
+        # Живые сущности плитки и призраки соседей в полосе margin вокруг неё:
+        # координаты и сквозные номера строк фазы (смещение плитки + индекс в хранилище)
+        xs, ys, refs = [], [], []
+        x0, y0, x1, y1 = tile.x0 - margin, tile.y0 - margin, tile.x0 + self.tile_size + margin, tile.y0 + self.tile_size + margin
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                other = self.tiles.get((tile.key[0] + dx, tile.key[1] + dy))
+                if other is None:
+                    continue
+                store = getattr(other, kind)
+                n = store.count
+                x, y = store.x[:n], store.y[:n]
+                keep = store.alive[:n]
+                if other is not tile:
+                    keep = keep & (x >= x0) & (x < x1) & (y >= y0) & (y < y1)
+                keep = np.flatnonzero(keep)
+                xs.append(x[keep])
+                ys.append(y[keep])
+                refs.append(offsets[other.key] + keep)
+        if not xs:
+            return np.empty(0), np.empty(0), np.empty(0, np.int64)
+        return np.concatenate(xs), np.concatenate(ys), np.concatenate(refs)
+
+    def _offsets(self, kind):
+        # Начало строк каждой плитки в сквозной нумерации фазы
+        offsets = {}
+        total = 0
+        for key in sorted(self.tiles):
+            offsets[key] = total
+            total += getattr(self.tiles[key], kind).count
+        return offsets, total
+
+    def _kill(self, kind, flat, offsets):
+        keys = sorted(offsets)
+        starts = np.array([offsets[key] for key in keys], dtype=np.int64)
+        owner = np.searchsorted(starts, flat, side='right') - 1
+        for k in np.unique(owner).tolist():
+            store = getattr(self.tiles[keys[k]], kind)
+            store.alive[flat[owner == k] - starts[k]] = False
+
+    def populate(self, grass=None, herbivores=None, predators=None):
+        # По умолчанию — плотность исходного поля конфигурации
+        c = self.config
+        area = self.width * self.height / (c.field_width * c.field_height)
+        counts = {'grass': grass, 'herbivores': herbivores, 'predators': predators}
+        defaults = {'grass': c.initial_grass_count, 'herbivores': c.initial_herbivore_count,
+                    'predators': c.initial_predator_count}
+        for kind, count in counts.items():
+            n = int(round(defaults[kind] * area)) if count is None else count
+            x = self.rng.uniform(0, self.width, n)
+            y = self.rng.uniform(0, self.height, n)
+            if kind == 'grass':
+                self._place(kind, x, y)
+            elif kind == 'herbivores':
+                self._place(kind, x, y, direction=random_directions(n, self.rng))
+            else:
+                self._place(kind, x, y, direction=random_directions(n, self.rng), hunger=self._full_hunger(n))
+
+    def _full_hunger(self, n):
+        # Новые хищники сыты по конфигурации, а не по умолчанию столбца
+        return np.full(n, self.config.predator_hunger_max, np.int64)
+
+    def counts(self):
+        return {name: sum(getattr(tile, name).live_count() for tile in self.tiles.values()) for name, _ in STORES}
+
+    def _bounds(self, tile):
+        # Область, где лежат сущности плитки: у края мира крайние плитки забирают и всё за краем
+        x0 = tile.x0 if tile.key[0] > 0 else -np.inf
+        y0 = tile.y0 if tile.key[1] > 0 else -np.inf
+        x1 = tile.x0 + self.tile_size if tile.key[0] < self.tiles_x - 1 else np.inf
+        y1 = tile.y0 + self.tile_size if tile.key[1] < self.tiles_y - 1 else np.inf
+        return x0, y0, x1, y1
+
+    def _fertile(self, tile):
+        # Экскременты плитки рядом с травой. Сначала своя трава; не нашедшие её экскременты
+        # в полосе радиуса у границы проверяются по индексам травы соседних плиток
+        feces = tile.feces
+        n = feces.count
+        x, y = feces.x[:n], feces.y[:n]
+        radius = self.config.grass_spawn_radius
+        found = tile.grass.index.first_within_batch(x, y, radius) >= 0
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                other = self.tiles.get((tile.key[0] + dx, tile.key[1] + dy))
+                if other is None or other is tile:
+                    continue
+                x0, y0, x1, y1 = self._bounds(other)
+                near = np.flatnonzero(~found & (x >= x0 - radius) & (x <= x1 + radius)
+                                      & (y >= y0 - radius) & (y <= y1 + radius))
+                if len(near):
+                    found[near] = other.grass.index.first_within_batch(x[near], y[near], radius) >= 0
+        return np.flatnonzero(feces.alive[:n] & found)
+
+    def _grass_phase(self):
+        # Удобрение считается по траве начала раунда во всех плитках, затем добавляется новая
+        c = self.config
+        fertile = {key: self._fertile(self.tiles[key]) for key in sorted(self.tiles)}
+        new_x, new_y = [], []
+        for key in sorted(self.tiles):
+            tile = self.tiles[key]
+            feces = tile.feces
+            feces.alive[fertile[key]] = False
+            bonus_x, bonus_y = scatter_around(feces.x[fertile[key]], feces.y[fertile[key]], c.grass_spawn_bonus,
+                                              self.rng)
+            w = min(self.tile_size, self.width - tile.x0)
+            h = min(self.tile_size, self.height - tile.y0)
+            k = self.rng.poisson(c.grass_spawn_per_round * w * h / (c.field_width * c.field_height))
+            new_x += [tile.x0 + self.rng.uniform(0, w, k), bonus_x]
+            new_y += [tile.y0 + self.rng.uniform(0, h, k), bonus_y]
+        if new_x:
+            self._place('grass', np.concatenate(new_x), np.concatenate(new_y))
+        for tile in self.tiles.values():
+            tile.grass.compact()
+            tile.feces.compact()
+
+    def _herbivore_phase(self, seed):
+        offsets, total = self._offsets('grass')
+        c = self.config
+        halo = self.grass_halo
+        extent = self.tile_size + 2 * halo
+        keys = [key for key in sorted(self.tiles) if self.tiles[key].herbivores.count]
+        tasks = []
+        refs = []
+        for key in keys:
+            tile = self.tiles[key]
+            store = tile.herbivores
+            n = store.count
+            grass_x, grass_y, grass_ref = self._neighbourhood(tile, 'grass', halo, offsets)
+            refs.append(grass_ref)
+            tasks.append((self._tile_seed(seed, key), store.x[:n], store.y[:n], store.direction[:n], store.alive[:n],
+                          grass_x, grass_y, tile.x0 - halo, tile.y0 - halo, extent, self.width, self.height, c))
+        results = self._map(_herbivore_task, tasks)
+
+        # Заявки всех плиток разрешаются вместе: трава у границы достаётся ближайшему
+        agents, targets, dists = [], [], []
+        for key, (x, y, direction, claims, claim_dists), grass_ref in zip(keys, results, refs):
+            store = self.tiles[key].herbivores
+            n = store.count
+            store.x[:n], store.y[:n], store.direction[:n] = x, y, direction
+            agents.append(store.id[:n])
+            targets.append(np.where(claims >= 0, grass_ref[np.maximum(claims, 0)] if len(grass_ref) else -1, -1))
+            dists.append(claim_dists)
+        if not keys:
+            return [], []
+        agents, targets, dists = np.concatenate(agents), np.concatenate(targets), np.concatenate(dists)
+        winner = _claim_winners(agents, targets, dists, total, seed)
+        fed = targets >= 0
+        fed[fed] = winner[targets[fed]] == np.flatnonzero(fed)
+        self._kill('grass', targets[fed], offsets)
+
+        feces, births = [], []
+        start = 0
+        for key in keys:
+            store = self.tiles[key].herbivores
+            n = store.count
+            parents = herbivore_outcomes(store.grass_eaten, fed[start:start + n], n, c.herbivore_grass_to_reproduce)
+            start += n
+            feces.append((store.x[parents].copy(), store.y[parents].copy()))
+            births.append(_offspring(store.x, store.y, parents, len(parents), c.herbivore_reproduction_count,
+                                     self._tile_seed(seed, key), n))
+        return feces, births
+
+    def _predator_phase(self, seed):
+        offsets, total = self._offsets('herbivores')
+        c = self.config
+        halo = self.prey_halo
+        extent = self.tile_size + 2 * halo
+        keys = [key for key in sorted(self.tiles) if self.tiles[key].predators.count]
+        tasks = []
+        refs = []
+        for key in keys:
+            tile = self.tiles[key]
+            store = tile.predators
+            n = store.count
+            prey_x, prey_y, prey_ref = self._neighbourhood(tile, 'herbivores', halo, offsets)
+            refs.append(prey_ref)
+            tasks.append((self._tile_seed(seed, key), store.x[:n], store.y[:n], store.direction[:n], store.hunger[:n],
+                          store.eating_timer[:n], store.alive[:n], prey_x, prey_y,
+                          tile.x0 - halo, tile.y0 - halo, extent, self.width, self.height, c))
+        results = self._map(_predator_task, tasks)
+
+        agents, targets, dists, owners = [], [], [], []
+        for t, (key, result, prey_ref) in enumerate(zip(keys, results, refs)):
+            x, y, direction, hunger, eating_timer, hunting, claims, claim_dists = result
+            store = self.tiles[key].predators
+            n = store.count
+            store.x[:n], store.y[:n], store.direction[:n] = x, y, direction
+            store.hunger[:n], store.eating_timer[:n] = hunger, eating_timer
+            agents.append(store.id[hunting])
+            targets.append(np.where(claims >= 0, prey_ref[np.maximum(claims, 0)] if len(prey_ref) else -1, -1))
+            dists.append(claim_dists)
+            owners.append(np.column_stack((np.full(len(hunting), t), hunting)))
+        if not keys:
+            return [], []
+        agents, targets, dists = np.concatenate(agents), np.concatenate(targets), np.concatenate(dists)
+        owners = np.concatenate(owners)
+        winner = _claim_winners(agents, targets, dists, total, seed)
+        # Без добычи в мире массив победителей пуст — смотрим его только по заявкам
+        won = targets >= 0
+        won[won] = winner[targets[won]] == np.flatnonzero(won)
+        self._kill('herbivores', targets[won], offsets)
+
+        feces, births = [], []
+        for t, key in enumerate(keys):
+            store = self.tiles[key].predators
+            n = store.count
+            fed = np.zeros(n, dtype=np.bool_)
+            fed[owners[won & (owners[:, 0] == t), 1]] = True
+            droppers, parents, _, _ = predator_outcomes(store.hunger, store.eating_timer, store.feces_timer,
+                                                        store.alive, n, fed, c.predator_eating_time,
+                                                        c.predator_feces_interval, c.predator_hunger_max)
+            feces.append((store.x[droppers].copy(), store.y[droppers].copy()))
+            births.append(_offspring(store.x, store.y, parents, len(parents), c.predator_reproduction_count,
+                                     self._tile_seed(seed, key), n))
+        return feces, births
+
+    def step(self):
+        # У каждой фазы своё зерно из потока: зёрна плиток (_tile_seed) разных фаз не пересекаются
+        herbivore_seed = np.uint64(_next_seed(self.rng_state))
+        predator_seed = np.uint64(_next_seed(self.rng_state))
+        self._grass_phase()
+        herbivore_feces, herbivore_births = self._herbivore_phase(herbivore_seed)
+        self._migrate('herbivores', HerbivoreStore)
+        # Хищники видят травоядных уже после их шага, но без новорождённых — как в Simulation
+        predator_feces, predator_births = self._predator_phase(predator_seed)
+        self._migrate('predators', PredatorStore)
+
+        for x, y, direction in herbivore_births:
+            self._place('herbivores', x, y, direction=direction)
+        for x, y, direction in predator_births:
+            self._place('predators', x, y, direction=direction, hunger=self._full_hunger(len(x)))
+        for x, y in herbivore_feces + predator_feces:
+            self._place('feces', x, y)
+        for key in list(self.tiles):
+            tile = self.tiles[key]
+            for name, _ in STORES:
+                getattr(tile, name).compact()
+            if tile.empty():
+                del self.tiles[key]
+        self.round += 1
@@ -0,0 +1,197 @@
+import os
+import numpy as np
+from history import KINDS, Snapshot
+
+# Журнал траектории на диске: каталог с двумя файлами.
+#   data.bin  — записи раундов подряд; каждые keyframe_interval раундов полный кадр
+#               (номера и координаты всех сущностей), между ними дельты: родившиеся
+#               (номер, координаты), умершие (номер) и сдвинувшиеся (номер, координаты).
+#   index.bin — на каждый раунд три int64: смещение записи, её длина и раунд ключевого
+#               кадра, от которого она отсчитывается. Поиск раунда — одно чтение индекса.
+# Запись: заголовок int64[2 + 3 * len(KINDS)] = [раунд, ключевой?, по каждому виду
+# три длины секций], float64 средний голод, затем секции. Все секции кратны 8 байтам,
+# поэтому читаются из np.memmap без копирования.
+
+HEADER_INTS = 2 + 3 * len(KINDS)
+HEADER_BYTES = HEADER_INTS * 8 + 8
+INDEX_FIELDS = 3
+
+class TrajectoryWriter:
+    # resume_round — продолжение журнала с контрольной точки: записи до этого раунда
+    # сохраняются, более поздние и оборванный хвост отрезаются, первая новая запись — ключевой кадр
+    def __init__(self, path, keyframe_interval=100, resume_round=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.last_round = None
+        self.keyframe_round = None
+        self.previous = None  # По каждому виду: номера по возрастанию и их координаты
+        data_path = os.path.join(path, 'data.bin')
+        index_path = os.path.join(path, 'index.bin')
+        kept = _kept_entries(data_path, index_path, resume_round) if resume_round is not None else None
+        if not kept:
+            self.data = open(data_path, 'wb')
+            self.index = open(index_path, 'wb')
+            return
+        kept, end, keyframe_round = kept
+        self.data = open(data_path, 'r+b')
+        self.index = open(index_path, 'r+b')
+        self.data.truncate(end)
+        self.data.seek(end)
+        self.index.truncate(kept * INDEX_FIELDS * 8)
+        self.index.seek(kept * INDEX_FIELDS * 8)
+        self.last_round = resume_round - 1
+        self.keyframe_round = keyframe_round
+
+    def append(self, round_num, stores, avg_hunger):
+        # stores — хранилища в порядке KINDS; раунды пишутся подряд
+        if self.last_round is not None and round_num != self.last_round + 1:
+            raise ValueError(f"раунд {round_num} записан не по порядку (последний {self.last_round})")
+        current = []
+        for store in stores:
+            ids = store.live('id')
+            order = np.argsort(ids)
+            xy = np.empty((len(ids), 2), dtype=np.float32)
+            xy[:, 0] = store.live('x')[order]
+            xy[:, 1] = store.live('y')[order]
+            current.append((ids[order], xy))
+
+        is_key = self.previous is None or round_num - self.keyframe_round >= self.keyframe_interval
+        header = np.zeros(HEADER_INTS, dtype=np.int64)
+        header[0] = round_num
+        header[1] = is_key
+        sections = []
+        for k, (ids, xy) in enumerate(current):
+            if is_key:
+                parts = (ids, xy, np.empty(0, np.int64), np.empty(0, np.int64), np.empty((0, 2), np.float32))
+                lengths = (len(ids), 0, 0)
+            else:
+                prev_ids, prev_xy = self.previous[k]
+                known = np.isin(ids, prev_ids, assume_unique=True)
+                dead = prev_ids[~np.isin(prev_ids, ids, assume_unique=True)]
+                same = np.searchsorted(prev_ids, ids[known])
+                moved = np.any(prev_xy[same] != xy[known], axis=1)
+                parts = (ids[~known], xy[~known], dead, ids[known][moved], xy[known][moved])
+                lengths = (np.count_nonzero(~known), len(dead), np.count_nonzero(moved))
+            header[2 + 3 * k:5 + 3 * k] = lengths
+            sections.extend(parts)
+
+        if is_key:
+            self.keyframe_round = round_num
+        offset = self.data.tell()
+        self.data.write(header.tobytes())
+        self.data.write(np.float64(avg_hunger).tobytes())
+        for part in sections:
+            self.data.write(np.ascontiguousarray(part).tobytes())
+        length = self.data.tell() - offset
+        self.index.write(np.array([offset, length, self.keyframe_round], dtype=np.int64).tobytes())
+        self.previous = current
+        self.last_round = round_num
+
+    def flush(self):
+        self.data.flush()
+        self.index.flush()
+
+    def close(self):
+        if not self.data.closed:
+            self.data.close()
+            self.index.close()
+
+def _kept_entries(data_path, index_path, resume_round):
+    # Сколько записей существующего журнала идут до resume_round: (число, конец данных,
+    # ключевой кадр последней); None — журнала нет, начинаем новый
+    if not os.path.exists(index_path) or not os.path.exists(data_path):
+        return None
+    index = np.fromfile(index_path, dtype=np.int64)
+    index = index[:len(index) // INDEX_FIELDS * INDEX_FIELDS].reshape(-1, INDEX_FIELDS)
+    if not len(index):
+        return None
+    data_size = os.path.getsize(data_path)
+    kept = -1
+    if index[0, 0] + HEADER_BYTES <= data_size:
+        first_round = int(np.fromfile(data_path, dtype=np.int64, count=1, offset=int(index[0, 0]))[0])
+        kept = resume_round - first_round
+    if kept == 0:
+        return None
+    if kept < 0 or kept > len(index) or index[kept - 1, 0] + index[kept - 1, 1] > data_size:
+        raise ValueError(f"журнал траектории в {os.path.dirname(index_path)} не доходит до раунда {resume_round}; "
+                         f"укажите другой каталог")
+    return kept, int(index[kept - 1, 0] + index[kept - 1, 1]), int(index[kept - 1, 2])
+
+class TrajectoryReader:
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(os.path.join(path, 'data.bin'), dtype=np.uint8, mode='r')
+        self.index = np.fromfile(os.path.join(path, 'index.bin'), dtype=np.int64).reshape(-1, INDEX_FIELDS)
+        self.first_round = int(self._header(0)[0][0]) if len(self.index) else 0
+        self.last_round = self.first_round + len(self.index) - 1
+        self._cursor = None  # Последний восстановленный раунд для последовательного чтения
+
+    def __len__(self):
+        return len(self.index)
+
+    def _header(self, position):
+        offset = self.index[position, 0]
+        header = self.data[offset:offset + HEADER_INTS * 8].view(np.int64)
+        avg_hunger = float(self.data[offset + HEADER_INTS * 8:offset + HEADER_BYTES].view(np.float64)[0])
+        return header, avg_hunger, offset + HEADER_BYTES
+
+    def _apply(self, position, state):
+        # Применяет запись к состоянию (список пар номера/координаты по видам)
+        header, avg_hunger, offset = self._header(position)
+        is_key = bool(header[1])
+        result = []
+        for k in range(len(KINDS)):
+            a, b, c = header[2 + 3 * k:5 + 3 * k]
+            born_ids = self.data[offset:offset + 8 * a].view(np.int64)
+            offset += 8 * a
+            born_xy = self.data[offset:offset + 8 * a].view(np.float32).reshape(-1, 2)
+            offset += 8 * a
+            dead = self.data[offset:offset + 8 * b].view(np.int64)
+            offset += 8 * b
+            moved_ids = self.data[offset:offset + 8 * c].view(np.int64)
+            offset += 8 * c
+            moved_xy = self.data[offset:offset + 8 * c].view(np.float32).reshape(-1, 2)
+            offset += 8 * c
+            if is_key:
+                result.append((np.array(born_ids), np.array(born_xy)))
+                continue
+            ids, xy = state[k]
+            keep = ~np.isin(ids, dead, assume_unique=True)
+            ids, xy = ids[keep], xy[keep]
+            xy[np.searchsorted(ids, moved_ids)] = moved_xy
+            ids = np.concatenate((ids, born_ids))
+            xy = np.concatenate((xy, born_xy))
+            order = np.argsort(ids, kind='stable')
+            result.append((ids[order], xy[order]))
+        return result, avg_hunger
+
+    def state(self, round_num):
+        # Состояние раунда: ближайший ключевой кадр плюс не больше keyframe_interval дельт
+        if not self.first_round <= round_num <= self.last_round:
+            raise IndexError(f"раунда {round_num} нет в журнале ({self.first_round}..{self.last_round})")
+        position = round_num - self.first_round
+        keyframe = int(self.index[position, 2]) - self.first_round
+        # От последнего восстановленного раунда, если он между ключевым кадром и нужным раундом;
+        # повторный запрос того же раунда отдаёт его без применения записей
+        if self._cursor is not None and keyframe <= self._cursor[0] <= position:
+            start, state, avg_hunger = self._cursor[0] + 1, self._cursor[1], self._cursor[2]
+        else:
+            start, state = keyframe, None
+        for p in range(start, position + 1):
+            state, avg_hunger = self._apply(p, state)
+        self._cursor = (position, state, avg_hunger)
+        return state, avg_hunger
+
+    def snapshot(self, round_num):
+        state, avg_hunger = self.state(round_num)
+        counts = np.array([len(ids) for ids, _ in state], dtype=np.int64)
+        positions = np.concatenate([xy for _, xy in state]) if counts.sum() else np.empty((0, 2), np.float32)
+        return Snapshot(round_num, positions, counts, avg_hunger)
+
+    def snapshots(self, start=None, end=None):
+        # Последовательный обход диапазона раундов [start, end]: каждая дельта применяется один раз
+        start = self.first_round if start is None else start
+        end = self.last_round if end is None else min(end, self.last_round)
+        for round_num in range(start, end + 1):
+            yield self.snapshot(round_num)
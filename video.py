@@ -0,0 +1,34 @@
+import logging
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class VideoStream:
+    # Кадры пишутся прямо в открытый VideoWriter, без промежуточных PNG на диске.
+    # Кадр — RGB-массив (высота, ширина, 3), допускается представление поверхности без копирования.
+    def __init__(self, output_path, fps=30, fourcc='mp4v'):
+        self.output_path = output_path
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.writer = None
+        self.buffer = None
+        self.frames = 0
+
+    def write(self, frame):
+        if self.writer is None:
+            height, width, _ = frame.shape
+            self.writer = cv2.VideoWriter(self.output_path, self.fourcc, self.fps, (width, height))
+            if not self.writer.isOpened():
+                raise RuntimeError(f"не удалось открыть {self.output_path} для записи видео")
+            self.buffer = np.empty((height, width, 3), dtype=np.uint8)
+        # Перестановка каналов RGB -> BGR сразу в заранее выделенный буфер
+        cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=self.buffer)
+        self.writer.write(self.buffer)
+        self.frames += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+            logger.info(f"Видео сохранено как {self.output_path} ({self.frames} кадров)")
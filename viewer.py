@@ -0,0 +1,148 @@
+import time
+import queue
+import logging
+import multiprocessing
+from constants import MAX_ROUNDS, ROUNDS_PER_SECOND
+from history import HISTORY_BUDGET
+
+logger = logging.getLogger(__name__)
+
+# Живой просмотр в окне. Симуляция идёт в отдельном процессе и не ждёт отрисовку:
+# окно с частотой обновления экрана просит свежий снимок (событие wanted), процесс
+# симуляции отдаёт последний готовый раунд в очередь на один элемент, заменяя
+# неподобранный. Промежуточные раунды между показанными кадрами пропускаются.
+# Управление: стрелки вверх/вниз — скорость, U — без ограничения скорости,
+# пробел — пауза, Esc или закрытие окна — выход.
+# Скорость s означает s * ROUNDS_PER_SECOND раундов в секунду, как у видео.
+
+def _publish(snapshots, item):
+    # Оставляем в очереди только последний снимок
+    try:
+        snapshots.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        snapshots.put_nowait(item)
+    except queue.Full:
+        pass
+
+def _simulation_worker(commands, snapshots, wanted, progress, seed, grass_model, config, max_rounds, log_level,
+                       history_budget):
+    logging.basicConfig(level=log_level, format='%(message)s')
+    from simulation import Simulation
+    # Окну нужен только последний раунд; бюджет истории задаёт, сколько сущностей в раунде поместится
+    simulation = Simulation(seed=seed, grass_model=grass_model, config=config, history_budget=history_budget)
+    simulation.initialize()
+    paused = False
+    unlimited = False
+    stop = False
+    next_time = time.perf_counter()
+    while not stop:
+        try:
+            while True:
+                command = commands.get_nowait()
+                if command in ('faster', 'slower'):
+                    simulation.adjust_speed(command == 'faster')
+                elif command == 'pause':
+                    paused = not paused
+                elif command == 'unlimited':
+                    unlimited = not unlimited
+                elif command == 'stop':
+                    stop = True
+                next_time = time.perf_counter()
+        except queue.Empty:
+            pass
+        # После конца прогона процесс ждёт команды stop, а окно показывает последний раунд
+        finished = not simulation.running or simulation.simulation_round >= max_rounds
+        if paused or finished:
+            if wanted.is_set():
+                wanted.clear()
+                _publish(snapshots, (simulation.history.latest().copy(), simulation.simulation_round,
+                                     simulation.speed, finished))
+            time.sleep(0.01)
+            continue
+        simulation.update()
+        progress.value = simulation.simulation_round
+        if wanted.is_set():
+            wanted.clear()
+            # Очередь сериализует снимок позже, в своём потоке, а слот истории к тому времени
+            # может быть перезаписан — отдаём копию
+            _publish(snapshots, (simulation.history.latest().copy(), simulation.simulation_round, simulation.speed,
+                                 False))
+        if not unlimited:
+            # Темп задаёт скорость; при отставании не догоняем рывком, а начинаем отсчёт заново
+            next_time += 1 / (simulation.speed * ROUNDS_PER_SECOND)
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -0.1:
+                next_time = time.perf_counter()
+    simulation.stop()
+    snapshots.cancel_join_thread()  # Неподобранный снимок не должен задерживать выход процесса
+
+class LiveViewer:
+    def __init__(self, seed=None, grass_model='points', config=None, fps=60, renderer_backend='numpy',
+                 max_rounds=MAX_ROUNDS, history_budget=HISTORY_BUDGET):
+        from config import Config
+        self.config = config or Config()
+        self.fps = fps
+        self.renderer_backend = renderer_backend
+        context = multiprocessing.get_context('spawn')
+        self.commands = context.Queue()
+        self.snapshots = context.Queue(maxsize=1)
+        self.wanted = context.Event()
+        self.progress = context.Value('q', 0, lock=False)  # Последний посчитанный раунд
+        self.worker = context.Process(target=_simulation_worker,
+                                      args=(self.commands, self.snapshots, self.wanted, self.progress, seed, grass_model,
+                                            self.config, max_rounds, logging.getLogger().level, history_budget),
+                                      daemon=True)
+
+    def run(self):
+        import pygame
+        from pipeline import RENDERERS
+        renderer = RENDERERS[self.renderer_backend](disable_rendering=False, snapshot_dir=None, config=self.config)
+        pygame.init()
+        display = pygame.display.set_mode((renderer.width + 200, renderer.height))
+        pygame.display.set_caption("Симуляция травоядных и хищников")
+        clock = pygame.time.Clock()
+        self.worker.start()
+        keys = {pygame.K_UP: 'faster', pygame.K_DOWN: 'slower', pygame.K_SPACE: 'pause', pygame.K_u: 'unlimited'}
+        shown = None  # (раунд, скорость) показанного кадра
+        frames_skipped = 0
+        finished_logged = False
+        try:
+            running = True
+            while running:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                        running = False
+                    elif event.type == pygame.KEYDOWN and event.key in keys:
+                        self.commands.put(keys[event.key])
+                self.wanted.set()
+                try:
+                    state, simulation_round, speed, finished = self.snapshots.get_nowait()
+                except queue.Empty:
+                    state = None
+                if state is not None and (state.round, speed) != shown:
+                    if shown is not None:
+                        frames_skipped += max(0, state.round - shown[0] - 1)
+                    shown = (state.round, speed)
+                    # «Раундов вперёд» — насколько симуляция ушла от показанного кадра прямо сейчас
+                    renderer.render(state, speed, state.round, max(simulation_round, self.progress.value), frames_skipped)
+                    frame = renderer.frame()
+                    pygame.surfarray.blit_array(display, frame.swapaxes(0, 1))
+                    del frame
+                    pygame.display.flip()
+                if state is not None and finished and not finished_logged:
+                    logger.info(f"Симуляция завершилась на раунде {simulation_round}; закройте окно для выхода")
+                    finished_logged = True
+                clock.tick(self.fps)
+        finally:
+            self.close()
+            pygame.quit()
+
+    def close(self):
+        self.commands.put('stop')
+        self.worker.join(timeout=5)
+        if self.worker.is_alive():
+            self.worker.terminate()